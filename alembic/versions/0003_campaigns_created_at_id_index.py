@@ -0,0 +1,26 @@
+"""index campaigns (created_at, id) for keyset pagination
+
+Revision ID: 0003_campaigns_created_at_id_index
+Revises: 0002_add_role_to_campaign_members
+Create Date: 2025-09-20 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003_campaigns_created_at_id_index'
+down_revision = '0002_add_role_to_campaign_members'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pagination compares (created_at, id); NULLs would fall out of the
+    # ordering, so give any legacy rows a timestamp first.
+    op.execute("UPDATE campaigns SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    op.create_index('ix_campaigns_created_at_id', 'campaigns', ['created_at', 'id'])
+    # campaign_members is already ordered by its (campaign_id, user_id) primary key.
+
+
+def downgrade():
+    op.drop_index('ix_campaigns_created_at_id', table_name='campaigns')
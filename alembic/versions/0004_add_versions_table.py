@@ -0,0 +1,28 @@
+"""add versions table for ETag / conditional GET
+
+Revision ID: 0004_add_versions_table
+Revises: 0003_campaigns_created_at_id_index
+Create Date: 2025-09-24 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_add_versions_table'
+down_revision = '0003_campaigns_created_at_id_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One counter per cacheable listing ('campaigns', 'members:<cid>',
+    # 'user:<uid>'), bumped in the same transaction as the write.
+    op.create_table(
+        'versions',
+        sa.Column('key', sa.Text(), primary_key=True),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_table('versions')
@@ -0,0 +1,22 @@
+"""index campaigns.owner_id for the dashboard's owned-campaigns lookup
+
+Revision ID: 0005_campaigns_owner_id_index
+Revises: 0004_add_versions_table
+Create Date: 2025-09-26 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_campaigns_owner_id_index'
+down_revision = '0004_add_versions_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_campaigns_owner_id', 'campaigns', ['owner_id'])
+
+
+def downgrade():
+    op.drop_index('ix_campaigns_owner_id', table_name='campaigns')
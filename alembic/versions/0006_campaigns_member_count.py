@@ -0,0 +1,48 @@
+"""add denormalized campaigns.member_count
+
+Revision ID: 0006_campaigns_member_count
+Revises: 0005_campaigns_owner_id_index
+Create Date: 2025-09-28 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_campaigns_member_count'
+down_revision = '0005_campaigns_owner_id_index'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 500
+
+
+def upgrade():
+    op.add_column('campaigns', sa.Column('member_count', sa.Integer(), nullable=False, server_default='0'))
+    # Backfill in id order, committing each batch, so a large campaigns table
+    # is never locked by one long transaction. The column is committed first;
+    # if the backfill is interrupted, `python backend/repair_member_counts.py`
+    # finishes it.
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = ''
+        while True:
+            ids = [r[0] for r in conn.execute(
+                sa.text("SELECT id FROM campaigns WHERE id > :last ORDER BY id LIMIT :n"),
+                {"last": last_id, "n": BACKFILL_BATCH},
+            )]
+            if not ids:
+                break
+            conn.execute(
+                sa.text(
+                    "UPDATE campaigns SET member_count = "
+                    "(SELECT COUNT(*) FROM campaign_members m WHERE m.campaign_id = campaigns.id) "
+                    "WHERE id IN :ids"
+                ).bindparams(sa.bindparam("ids", expanding=True)),
+                {"ids": ids},
+            )
+            last_id = ids[-1]
+
+
+def downgrade():
+    with op.batch_alter_table('campaigns') as batch:
+        batch.drop_column('member_count')
@@ -1,5 +1,8 @@
 """Run alembic upgrade using the project's DATABASE_URL and local alembic scripts.
 
+After upgrading, the schema readiness check (backend/schema.py) is run once so
+a deploy fails here rather than on the first request.
+
 Usage:
     python backend/alembic_upgrade.py head
 """
@@ -23,3 +26,10 @@ if __name__ == '__main__':
         sys.exit(2)
     rev = sys.argv[1]
     command.upgrade(cfg, rev)
+    if rev == 'head':
+        from backend.schema import check_schema, SchemaNotReady
+        try:
+            print('Schema ready at revision', check_schema(force=True))
+        except SchemaNotReady as e:
+            print('Schema not ready:', e)
+            sys.exit(1)
@@ -6,12 +6,19 @@ from flask_cors import CORS
 
 # local imports (blueprints and settings)
 from .config import settings
+from .db import get_engine, pool_stats
+from . import schema, metrics, querylog, profiling, replicas, jsonprovider, compression, ratelimit
+from .publisher import publisher
+from .membership import membership_cache
 from .routes.health import bp as health_bp
 from .realtime import bp as realtime_bp
 from .dice import bp as dice_bp
 from .campaigns import bp as campaigns_bp
+from .export import bp as export_bp
 
 app = Flask(__name__)
+# orjson-backed jsonify/get_json when available; ISO 8601 datetimes either way.
+jsonprovider.init_app(app)
 
 # Allow the frontend origins we use in development and production. When credentials
 # are required, the response must echo the Origin (not use '*').
@@ -22,30 +29,68 @@ FRONTEND_ORIGINS = {
   "http://127.0.0.1:5173",        # Vite dev (loopback)
 }
 
+# One CORS policy for /api/*: Flask-CORS, the fallback in add_cors_headers
+# and the ASGI entry point's native routes (asgi.py) all use these.
+CORS_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+CORS_ALLOW_HEADERS = [
+  "Authorization",
+  "Content-Type",
+  "X-Requested-With",
+  "Ably-Agent",
+  "Ably-Version",
+  "X-Profile",          # admins opting into profiling (profiling.py)
+]
+CORS_EXPOSE_HEADERS = [
+  "Content-Length",
+  "Content-Type",
+  "X-Next-Cursor",
+  "Server-Timing",
+  "X-Profile-File",
+]
+CORS_MAX_AGE = 600
+
 CORS(
   app,
   resources={r"/api/*": {"origins": list(FRONTEND_ORIGINS)}},
   supports_credentials=True,
-  methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-  allow_headers=[
-    "Authorization",
-    "Content-Type",
-    "X-Requested-With",
-    "Ably-Agent",
-    "Ably-Version",
-  ],
-  expose_headers=[
-    "Content-Length",
-    "Content-Type",
-  ],
-  max_age=600,
+  methods=CORS_METHODS,
+  allow_headers=CORS_ALLOW_HEADERS,
+  expose_headers=CORS_EXPOSE_HEADERS,
+  max_age=CORS_MAX_AGE,
 )
 
+
+def cors_headers(origin: str | None) -> dict:
+  """CORS headers for an /api/* response to `origin`; empty if not allowed."""
+  if not origin or origin not in FRONTEND_ORIGINS:
+    return {}
+  return {
+    "Access-Control-Allow-Origin": origin,
+    "Access-Control-Allow-Credentials": "true",
+    "Access-Control-Allow-Methods": ",".join(CORS_METHODS),
+    "Access-Control-Allow-Headers": ",".join(CORS_ALLOW_HEADERS),
+    "Access-Control-Expose-Headers": ",".join(CORS_EXPOSE_HEADERS),
+    "Access-Control-Max-Age": str(CORS_MAX_AGE),
+  }
+
 # Register API blueprints
 app.register_blueprint(health_bp)
 app.register_blueprint(realtime_bp)
 app.register_blueprint(dice_bp)
 app.register_blueprint(campaigns_bp)
+app.register_blueprint(export_bp)
+
+# Request latency, in-flight and dependency timers; served on /api/_metrics.
+metrics.init_app(app)
+# Per-worker in-flight cap (MAX_IN_FLIGHT); sheds overload with 503.
+ratelimit.init_app(app)
+# Per-request query count and DB time in Server-Timing; slow-query log.
+querylog.init_app(app)
+# Opt-in cProfile/stack-sample capture (X-Profile header from an admin).
+profiling.init_app(app)
+
+# Verify the alembic revision once per worker instead of running DDL per request.
+schema.init_app(app)
 
 @app.route("/api/<path:subpath>", methods=["OPTIONS"])
 def _preflight_catchall(subpath):
@@ -77,10 +122,9 @@ def _diag():
     # running process can reach.
     db_count = None
     try:
-      from sqlalchemy import create_engine, text
+      from sqlalchemy import text
       if settings.DATABASE_URL:
-        eng = create_engine(settings.DATABASE_URL, echo=False)
-        with eng.connect() as conn:
+        with get_engine().connect() as conn:
           r = conn.execute(text('SELECT COUNT(*) FROM campaigns'))
           db_count = int(r.scalar() or 0)
     except Exception:
@@ -92,11 +136,24 @@ def _diag():
       "ably_key_masked": masked_ably,
       "clerk_jwks_configured": bool(settings.CLERK_JWKS_URL),
       "db_campaigns": db_count,
+      "membership_cache": membership_cache.stats(),
     }
   except Exception:
     return {"ok": False}
 
 
+# Connection pool usage for this worker (checked out, overflow, wait time).
+@app.get("/api/_pool")
+def _pool_diag():
+  return {"ok": True, "pid": os.getpid(), "pools": pool_stats(), "replicas": replicas.stats()}
+
+
+# Ably publish queue depth, drops and failures for this worker.
+@app.get("/api/_publisher")
+def _publisher_diag():
+  return {"ok": True, "pid": os.getpid(), **publisher.metrics()}
+
+
 @app.get("/api/_jwks")
 def _jwks_diag():
   """Return the list of key ids (kids) present in configured JWKS URLs.
@@ -104,7 +161,8 @@ def _jwks_diag():
   showing which kids the running backend currently trusts.
   """
   import requests
-  out = {"ok": True, "jwks": []}
+  from .authn import jwks_store, claims_cache
+  out = {"ok": True, "jwks": [], "cached": jwks_store.snapshot(), "claims_cache": claims_cache.stats()}
   try:
     urls = [u for u in [settings.CLERK_JWKS_URL, settings.CLERK_JWKS_URL_ALT] if u]
     for u in urls:
@@ -144,23 +202,18 @@ def add_cors_headers(response):
   if "Access-Control-Allow-Origin" in response.headers:
     return response  # Flask-CORS already handled
 
-  origin = request.headers.get("Origin")
-  if origin and origin in FRONTEND_ORIGINS and request.path.startswith("/api/"):
-    response.headers["Access-Control-Allow-Origin"] = origin
-    response.headers["Vary"] = "Origin"
-    response.headers["Access-Control-Allow-Credentials"] = "true"
-    response.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,PATCH,DELETE,OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = ",".join([
-      "Authorization",
-      "Content-Type",
-      "X-Requested-With",
-      "Ably-Agent",
-      "Ably-Version",
-    ])
-    response.headers["Access-Control-Max-Age"] = "600"
+  headers = cors_headers(request.headers.get("Origin")) if request.path.startswith("/api/") else {}
+  if headers:
+    response.headers.update(headers)
+    response.vary.add("Origin")
   return response
 
 
+# gzip/brotli by Accept-Encoding. Registered last so it runs first among the
+# after_request hooks (they run in reverse) and its time is measured.
+compression.init_app(app)
+
+
 if __name__ == "__main__":
   port = int(os.getenv("PORT", "5000"))
   app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,457 @@
+"""Optional ASGI entry point.
+
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 backend.asgi:app
+    uvicorn backend.asgi:app --workers 2
+
+Needs the extras in backend/requirements-async.txt (uvicorn plus asyncpg or
+aiosqlite). The sync entry point, backend.app:app, is unchanged.
+
+The hot I/O-bound routes are served on the event loop:
+
+    GET  /api/health
+    GET  /api/campaigns              async engine (same query and ETag as Flask)
+    GET  /api/realtime/token         async engine on a membership-cache miss
+    POST /api/campaigns/<cid>/roll   async Ably publisher (httpx)
+
+While one of them waits on Postgres or Ably, the worker keeps serving other
+requests. A JWT whose claims are not cached yet is verified in a worker
+thread, because an unknown kid may force a JWKS fetch. All other requests
+(writes, exports, diagnostics, CORS preflights) go to the Flask app in a
+pool of ASGI_THREADS threads, so every blueprint behaves exactly as under
+the sync workers.
+"""
+import io
+import json
+import sys
+import time
+import traceback
+from contextlib import asynccontextmanager
+from functools import partial
+from urllib.parse import parse_qsl
+
+import anyio
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import BadRequest, Forbidden, HTTPException, InternalServerError, ServiceUnavailable, Unauthorized
+from werkzeug.http import parse_etags, quote_etag, unquote_etag
+
+from . import authn, compression, metrics, ratelimit, replicas, schema
+from .app import app as flask_app, cors_headers
+from .campaigns import _campaigns_after, _campaigns_page, _campaigns_query, _encode_cursor, _etag_value, _page_args, _page_version
+from .config import settings
+from .db import dispose_all_async, get_async_engine
+from .dice import DiceError, roll, roll_event
+from .jsonprovider import dumps_bytes
+from .membership import MISS, membership_cache
+from .publisher import AsyncPublisher
+from .realtime import (
+    CHANNEL_CAPS, _campaigns_capability, _member_role_query, _sign_token_request, _store_member_role,
+    _store_user_roles, _user_roles_query,
+)
+
+async_publisher = AsyncPublisher(
+    maxsize=settings.ABLY_QUEUE_SIZE,
+    batch_size=settings.ABLY_BATCH_SIZE,
+    max_retries=settings.ABLY_MAX_RETRIES,
+    backoff=settings.ABLY_RETRY_BACKOFF,
+)
+
+# Read the WSGI response in slices of about this size per thread hop.
+STREAM_CHUNK = 64 * 1024
+
+_END = object()
+
+
+class Request:
+    """The parts of an ASGI HTTP request the native handlers use."""
+
+    def __init__(self, scope, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"")
+        self.args = MultiDict(parse_qsl(self.query_string.decode("latin-1"), keep_blank_values=True))
+        self.headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+        self.body = body
+
+    def json(self):
+        # Mirrors Flask's get_json(force=True): bad JSON is a 400.
+        if not self.body:
+            return {}
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise BadRequest("Failed to decode JSON object")
+
+
+class Response:
+    def __init__(self, body: bytes = b"", status: int = 200, headers=None, content_type="application/json"):
+        self.body = body
+        self.status = status
+        self.headers = Headers(headers or [])
+        if content_type and "Content-Type" not in self.headers:
+            self.headers["Content-Type"] = content_type
+
+    @classmethod
+    def json(cls, obj, status: int = 200, headers=None):
+        return cls(dumps_bytes(obj), status, headers)
+
+    @classmethod
+    def from_werkzeug(cls, resp):
+        return cls(resp.get_data(), resp.status_code, list(resp.headers.items()), content_type=None)
+
+
+# --- Shared request steps ---
+
+async def current_user(req: Request) -> dict:
+    token = authn.bearer_token(req.headers.get("Authorization", ""))
+    claims = authn.cached_claims(token)
+    if claims is None:
+        claims = await anyio.to_thread.run_sync(authn.verify_token, token)
+    return claims
+
+
+async def require_schema():
+    if schema.is_ready():
+        return
+    try:
+        await anyio.to_thread.run_sync(schema.check_schema)
+    except schema.SchemaNotReady as e:
+        raise ServiceUnavailable(f"Schema not ready: {e}")
+
+
+async def reader_id(req: Request) -> str | None:
+    # Same rule as campaigns._reader_id: an optional token only steers reads.
+    if not req.headers.get("Authorization"):
+        return None
+    try:
+        claims = await current_user(req)
+    except HTTPException:
+        return None
+    return claims.get("sub") or claims.get("id") or claims.get("user_id")
+
+
+async def rate_limit(name: str, **keys):
+    """ratelimit.check, off the event loop when the store may block."""
+    buckets = ratelimit.store()
+    if buckets is not None and buckets.blocking:
+        await anyio.to_thread.run_sync(partial(ratelimit.check, name, **keys))
+    else:
+        ratelimit.check(name, **keys)
+
+
+@asynccontextmanager
+async def read_connection(user_id: str | None = None):
+    """Async twin of replicas.read_connection."""
+    urls = replicas.read_urls(user_id)
+    for url in urls[:-1]:
+        try:
+            conn = await get_async_engine(url).connect()
+        except DBAPIError:
+            replicas.mark_down(url)
+            continue
+        break
+    else:
+        conn = await get_async_engine(urls[-1]).connect()
+    # Already started by connect(); `async with conn` would start it again.
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+def _cacheable(resp: Response, etag: str) -> Response:
+    resp.headers["ETag"] = quote_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# --- Native handlers (same behaviour as their Flask counterparts) ---
+
+async def health(req: Request):
+    return Response.json({"ok": True})
+
+
+async def list_campaigns(req: Request):
+    await require_schema()
+    limit, cursor = _page_args(req.args)
+    after = _campaigns_after(cursor)
+    user_id = await reader_id(req)
+    try:
+        async with read_connection(user_id) as conn:
+            rows = (await conn.execute(_campaigns_query(conn, limit, after))).fetchall()
+    except Exception as e:
+        raise InternalServerError(f"DB error: {e}")
+    etag = _etag_value("campaigns", _page_version(rows), req.query_string)
+    held = compression.matching_etag(etag, parse_etags(req.headers.get("If-None-Match")))
+    if held is not None:
+        return _cacheable(Response(status=304, content_type=None), held)
+    items, next_cursor = _campaigns_page(rows, limit)
+    resp = Response.json(items)
+    if next_cursor is not None:
+        resp.headers["X-Next-Cursor"] = _encode_cursor(next_cursor)
+    return _cacheable(resp, etag)
+
+
+async def ably_token(req: Request):
+    await require_schema()
+    if not settings.ABLY_API_KEY or ":" not in settings.ABLY_API_KEY:
+        raise InternalServerError("ABLY_API_KEY missing or not in appId.keyId:secret format")
+    claims = await current_user(req)
+    user_id = claims.get("sub") or claims.get("user_id")
+    if not user_id:
+        raise Unauthorized("No user id in token")
+    await rate_limit("token", user=user_id)
+
+    chan = req.args.get("channel", "")
+    if chan:
+        role = None
+        if chan.startswith("campaign:"):
+            cid = chan.split(":", 1)[1]
+            role = membership_cache.get(cid, user_id)
+            if role is MISS:
+                generation = membership_cache.generation()
+                try:
+                    async with read_connection(user_id) as conn:
+                        row = (await conn.execute(_member_role_query(cid, user_id))).fetchone()
+                    role = _store_member_role(cid, user_id, row, generation)
+                except Exception:
+                    # On DB error, default to deny to be safe.
+                    role = None
+        if role is None:
+            raise Forbidden("Not a member of that campaign")
+        capability = {chan: CHANNEL_CAPS}
+    else:
+        roles = membership_cache.get_user(user_id)
+        if roles is MISS:
+            generation = membership_cache.generation()
+            try:
+                async with read_connection(user_id) as conn:
+                    rows = (await conn.execute(_user_roles_query(user_id))).fetchall()
+            except Exception:
+                raise ServiceUnavailable("Unable to load campaign memberships")
+            roles = _store_user_roles(user_id, rows, generation)
+        if not roles:
+            raise Forbidden("Not a member of any campaign")
+        capability = _campaigns_capability(roles)
+
+    try:
+        return Response.json(_sign_token_request(user_id, capability))
+    except Exception:
+        traceback.print_exc(file=sys.stdout)
+        return Response.json({"error": "failed to create Ably token request"}, status=500)
+
+
+async def do_roll(req: Request, cid: str):
+    claims = await current_user(req)
+    await rate_limit("roll", user=claims.get("sub"), campaign=cid)
+    expr = req.json().get("expr", "1d20")
+    try:
+        r = roll(str(expr))
+    except DiceError as e:
+        raise BadRequest(str(e))
+    async_publisher.publish(f"campaign:{cid}", "dice", roll_event(claims, expr, r))
+    return Response.json({"ok": True, "total": r.total, "detail": r.detail})
+
+
+# (method, path segments, handler, rule) — "<cid>" segments are captured.
+ROUTES = [
+    ("GET", ("api", "health"), health, "/api/health"),
+    ("GET", ("api", "campaigns"), list_campaigns, "/api/campaigns"),
+    ("GET", ("api", "realtime", "token"), ably_token, "/api/realtime/token"),
+    ("POST", ("api", "campaigns", "<cid>", "roll"), do_roll, "/api/campaigns/<cid>/roll"),
+]
+
+
+def _match(method: str, path: str):
+    parts = tuple(path.strip("/").split("/"))
+    for m, pattern, handler, rule in ROUTES:
+        if m != method or len(pattern) != len(parts):
+            continue
+        params = {}
+        for want, got in zip(pattern, parts):
+            if want.startswith("<"):
+                if not got:
+                    break
+                params[want[1:-1]] = got
+            elif want != got:
+                break
+        else:
+            return handler, rule, params
+    return None
+
+
+# --- WSGI bridge ---
+
+def _environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name, value = raw_name.decode("latin-1"), raw_value.decode("latin-1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _pull(iterator) -> tuple[list[bytes], bool]:
+    """Read up to STREAM_CHUNK bytes from a WSGI iterable; (chunks, finished)."""
+    chunks, size = [], 0
+    while size < STREAM_CHUNK:
+        chunk = next(iterator, _END)
+        if chunk is _END:
+            return chunks, True
+        chunks.append(chunk)
+        size += len(chunk)
+    return chunks, False
+
+
+class AsgiApp:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self._limiter = None
+
+    def limiter(self):
+        # Created on first use: anyio limiters belong to the running loop.
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(settings.ASGI_THREADS)
+        return self._limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        found = _match(scope["method"], scope["path"])
+        if found is None:
+            return await self._wsgi(scope, receive, send)
+        handler, rule, params = found
+        req = Request(scope, await _read_body(receive))
+        start = time.perf_counter()
+        metrics.registry.inc("http_requests_in_flight")
+        admitted = False
+        try:
+            try:
+                if not ratelimit.exempt(req.method, req.path):
+                    # No queue on the event loop: over the cap is shed at once.
+                    admitted = ratelimit.admit(wait=False)
+                resp = await handler(req, **params)
+            except HTTPException as e:
+                resp = Response.from_werkzeug(e.get_response())
+            except Exception:
+                traceback.print_exc(file=sys.stdout)
+                resp = Response.from_werkzeug(InternalServerError().get_response())
+            labels = (("route", rule), ("method", req.method), ("status", str(resp.status)))
+            metrics.registry.observe("http_request_duration_seconds", labels, time.perf_counter() - start)
+        finally:
+            metrics.registry.inc("http_requests_in_flight", amount=-1)
+            if admitted:
+                ratelimit.admission.leave()
+        _cors(req, resp)
+        _compress(req, resp)
+        await send({
+            "type": "http.response.start",
+            "status": resp.status,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in resp.headers.items()]
+            + [(b"content-length", str(len(resp.body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": resp.body})
+
+    async def _wsgi(self, scope, receive, send):
+        environ = _environ(scope, await _read_body(receive))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+            return lambda data: None
+
+        result = await anyio.to_thread.run_sync(lambda: self.wsgi_app(environ, start_response), limiter=self.limiter())
+        iterator = iter(result)
+        try:
+            chunks, finished = await anyio.to_thread.run_sync(_pull, iterator, limiter=self.limiter())
+            await send({
+                "type": "http.response.start",
+                "status": started["status"],
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in started["headers"]],
+            })
+            while True:
+                body = b"".join(chunks)
+                if finished:
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                if body:
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+                chunks, finished = await anyio.to_thread.run_sync(_pull, iterator, limiter=self.limiter())
+        finally:
+            if hasattr(result, "close"):
+                await anyio.to_thread.run_sync(result.close, limiter=self.limiter())
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_publisher.aflush()
+                await async_publisher.aclose()
+                await dispose_all_async()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _compress(req: Request, resp: Response):
+    # Same rules as compression.init_app applies to Flask responses.
+    if resp.status in (204, 304) or "Content-Encoding" in resp.headers:
+        return
+    resp.headers.add("Vary", "Accept-Encoding")
+    coding = compression.negotiate(req.headers.get("Accept-Encoding"))
+    content_type = resp.headers.get("Content-Type", "").split(";")[0]
+    if coding is None or not compression.compressible(content_type, len(resp.body)):
+        return
+    resp.body = compression.compress(resp.body, coding)
+    resp.headers["Content-Encoding"] = coding
+    etag = resp.headers.get("ETag")
+    if etag:
+        resp.headers["ETag"] = quote_etag(compression.encoded_etag(unquote_etag(etag)[0], coding))
+
+
+def _cors(req: Request, resp: Response):
+    # Same headers the Flask app sends on /api/* (app.cors_headers).
+    headers = cors_headers(req.headers.get("Origin"))
+    if headers:
+        for name, value in headers.items():
+            resp.headers[name] = value
+        resp.headers.add("Vary", "Origin")
+
+
+app = AsgiApp(flask_app.wsgi_app)
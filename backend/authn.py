@@ -1,69 +1,329 @@
+import hashlib
+import threading
 import time
+from collections import OrderedDict
 from flask import request, abort
 import jwt
-from jwt import PyJWKClient
+import requests
+from jwt import PyJWK, PyJWKSet
 from .config import settings
+from . import metrics
 
-_jwks_client = None
-_cache: dict[str, float] = {"jwks_at": 0.0}
+# Seconds of clock skew tolerated on exp/nbf/iat.
+JWT_LEEWAY = 10
+# Seconds allowed per JWKS request.
+FETCH_TIMEOUT = 5
+# Seconds before a forced refresh is retried after a failed fetch.
+FETCH_RETRY_SECONDS = 1
 
-def _jwks():
-    global _jwks_client
-    now = time.time()
-    if _jwks_client is None or now - _cache["jwks_at"] > 3600:
-        _jwks_client = PyJWKClient(settings.CLERK_JWKS_URL)
-        _cache["jwks_at"] = now
-    return _jwks_client
 
-def require_user():
-    auth = request.headers.get("Authorization", "")
+def _fetch_jwks(url: str) -> dict:
+    with metrics.timer("jwks"):
+        r = requests.get(url, timeout=FETCH_TIMEOUT)
+    r.raise_for_status()
+    return r.json()
+
+
+class KeyStore:
+    """Signing keys from every configured JWKS URL, indexed by kid.
+
+    Keys are loaded once and refreshed in a background thread before the TTL
+    runs out, so verifying a token with a known kid never touches the network.
+    Unknown kids trigger at most one forced refresh per
+    JWKS_MIN_REFRESH_INTERVAL and are then negatively cached, so a flood of
+    bad tokens costs no outbound HTTP. A failed fetch only holds off the next
+    forced refresh for FETCH_RETRY_SECONDS.
+
+    Safe to share between threads: fetches are single-flighted, so when a
+    rotation lands on many threads at once one of them fetches and the rest
+    wait for its result instead of failing or fetching again.
+    """
+
+    MAX_NEGATIVE = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_url: dict[str, dict[str, PyJWK]] = {}
+        self._keys: dict[str, PyJWK] = {}
+        self._fetched_at = 0.0
+        self._last_forced = 0.0
+        self._negative: dict[str, float] = {}
+        # Set while a fetch is running; other threads wait on it.
+        self._inflight: threading.Event | None = None
+        # Completed fetches, so a late joiner can tell one already finished.
+        self._generation = 0
+        self._background: threading.Thread | None = None
+        self._listeners = []
+
+    def urls(self) -> list[str]:
+        return [u for u in [settings.CLERK_JWKS_URL, settings.CLERK_JWKS_URL_ALT] if u]
+
+    def on_rotate(self, fn):
+        """Register fn(removed_kids) to be called when kids disappear."""
+        self._listeners.append(fn)
+
+    def refresh(self):
+        """Fetch every JWKS URL, or wait for the fetch another thread started."""
+        with self._lock:
+            done, leader = self._claim()
+        self._complete(done, leader)
+
+    def _claim(self) -> tuple[threading.Event, bool]:
+        # Caller holds self._lock. Returns (event, True) if this thread must
+        # fetch, or the in-flight fetch's (event, False) to wait on.
+        if self._inflight is not None:
+            return self._inflight, False
+        self._inflight = threading.Event()
+        return self._inflight, True
+
+    def _complete(self, done: threading.Event, leader: bool):
+        if not leader:
+            done.wait(FETCH_TIMEOUT * max(len(self.urls()), 1) + 1)
+            return
+        try:
+            self._fetch()
+        finally:
+            with self._lock:
+                self._inflight = None
+            done.set()
+
+    def _fetch(self):
+        by_url = {}
+        errors = []
+        for url in self.urls():
+            try:
+                jwks = PyJWKSet.from_dict(_fetch_jwks(url))
+                by_url[url] = {k.key_id: k for k in jwks.keys if k.key_id}
+            except Exception as e:
+                # Keep serving the last good keys for a URL that is briefly down.
+                errors.append(f"{url}: {e}")
+                if url in self._by_url:
+                    by_url[url] = self._by_url[url]
+        merged = {}
+        for keys in by_url.values():
+            merged.update(keys)
+        if errors and not merged:
+            raise RuntimeError("JWKS fetch failed: " + "; ".join(errors))
+        with self._lock:
+            removed = set(self._keys) - set(merged)
+            self._by_url = by_url
+            self._keys = merged
+            self._fetched_at = time.time()
+            self._generation += 1
+            # Newly published kids must not stay negatively cached.
+            for kid in merged:
+                self._negative.pop(kid, None)
+        if removed:
+            for fn in self._listeners:
+                fn(removed)
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._background = None
+
+    def _maybe_refresh_ahead(self, now: float):
+        # Refresh once 80% of the TTL has elapsed; requests keep using the
+        # current keys while the new set is fetched.
+        if now - self._fetched_at < settings.JWKS_TTL * 0.8:
+            return
+        with self._lock:
+            if self._background is not None or self._inflight is not None:
+                return
+            thread = self._background = threading.Thread(
+                target=self._refresh_in_background, name="jwks-refresh", daemon=True
+            )
+        thread.start()
+
+    def get(self, kid):
+        now = time.time()
+        if self._fetched_at:
+            self._maybe_refresh_ahead(now)
+
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        if kid is None or self._negative.get(kid, 0) > now:
+            return None
+
+        # Unknown kid (or nothing loaded yet): possibly a rotation we haven't
+        # seen. Refresh at most once per interval, then remember the miss.
+        # A fetch already in flight (forced or ahead-of-TTL) is joined rather
+        # than skipped, so threads racing the first one still see the new kid.
+        with self._lock:
+            # Re-check: a fetch may have finished since the lookup above.
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+            seen = self._generation
+            if self._inflight is None:
+                if now - self._last_forced < settings.JWKS_MIN_REFRESH_INTERVAL:
+                    return None
+                self._last_forced = now
+            done, leader = self._claim()
+        try:
+            self._complete(done, leader)
+        except Exception:
+            pass
+        if self._generation == seen:
+            # JWKS unreachable (here or in the fetch we joined): don't blame
+            # the kid for it, and retry soon rather than after the full
+            # interval, which would lock everyone out of a cold worker.
+            with self._lock:
+                self._last_forced = min(
+                    self._last_forced,
+                    now - settings.JWKS_MIN_REFRESH_INTERVAL + FETCH_RETRY_SECONDS,
+                )
+            return None
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        with self._lock:
+            if len(self._negative) >= self.MAX_NEGATIVE:
+                self._negative = {k: t for k, t in self._negative.items() if t > now}
+                if len(self._negative) >= self.MAX_NEGATIVE:
+                    self._negative.clear()
+            self._negative[kid] = now + settings.JWKS_NEGATIVE_TTL
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "kids": sorted(self._keys),
+            "age_s": round(time.time() - self._fetched_at, 1) if self._fetched_at else None,
+            "negative": len(self._negative),
+        }
+
+
+class ClaimsCache:
+    """Bounded LRU of verified claims keyed by a hash of the raw token.
+
+    The frontend sends the same session token on every call, so repeat
+    requests skip RS256 verification. Entries expire at the token's `exp`
+    minus the leeway and are dropped when their kid is rotated out.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, tuple[dict, float, str]] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        k = self._key(token)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires_at, _kid = entry
+            if time.time() >= expires_at:
+                del self._entries[k]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(k)
+            self.hits += 1
+            return claims
+
+    def put(self, token: str, claims: dict, kid: str):
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)) or self.maxsize <= 0:
+            return
+        expires_at = exp - JWT_LEEWAY
+        if expires_at <= time.time():
+            return
+        k = self._key(token)
+        with self._lock:
+            self._entries[k] = (claims, expires_at, kid)
+            self._entries.move_to_end(k)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict_kids(self, kids):
+        with self._lock:
+            for k in [k for k, e in self._entries.items() if e[2] in kids]:
+                del self._entries[k]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+jwks_store = KeyStore()
+claims_cache = ClaimsCache(settings.CLAIMS_CACHE_SIZE)
+
+
+def _evict_rotated(kids):
+    claims_cache.evict_kids(kids)
+
+
+jwks_store.on_rotate(_evict_rotated)
+
+
+def bearer_token(auth: str) -> str:
     if not auth.startswith("Bearer "):
         abort(401, "Missing bearer token")
-    token = auth.split(" ", 1)[1]
+    return auth.split(" ", 1)[1]
+
+
+def cached_claims(token: str):
+    """Claims for an already-verified token, or None (never does I/O)."""
+    return claims_cache.get(token)
+
+
+def verify_token(token: str) -> dict:
+    """Verify a Clerk session JWT and return its claims (aborts 401 on failure).
+
+    May fetch the JWKS for an unknown kid; async callers run it in a thread
+    after cached_claims() misses.
+    """
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
     try:
-        key = _jwks().get_signing_key_from_jwt(token).key
-    except Exception:
-        # Possible causes: JWKS rotated or wrong JWKS URL. Try refreshing the JWKS
-        # client once and retry. If that fails, include the token header 'kid' in
-        # the 401 message to aid debugging (no token body is logged).
-        # First, try forcing a refresh of the primary JWKS
-        try:
-            global _jwks_client, _cache
-            _jwks_client = PyJWKClient(settings.CLERK_JWKS_URL)
-            _cache["jwks_at"] = time.time()
-            key = _jwks_client.get_signing_key_from_jwt(token).key
-        except Exception:
-            # If an alternate JWKS URL is configured, try it as a fallback. This
-            # helps during short migrations when tokens from a different Clerk
-            # project may be presented to the backend.
-            if settings.CLERK_JWKS_URL_ALT:
-                try:
-                    alt_client = PyJWKClient(settings.CLERK_JWKS_URL_ALT)
-                    key = alt_client.get_signing_key_from_jwt(token).key
-                except Exception:
-                    try:
-                        hdr = jwt.get_unverified_header(token)
-                        kid = hdr.get('kid')
-                    except Exception:
-                        kid = None
-                    abort(401, f"Invalid token (key lookup failed): Unable to find a signing key that matches: {kid}")
-            else:
-                try:
-                    hdr = jwt.get_unverified_header(token)
-                    kid = hdr.get('kid')
-                except Exception:
-                    kid = None
-                abort(401, f"Invalid token (key lookup failed): Unable to find a signing key that matches: {kid}")
+        kid = jwt.get_unverified_header(token).get('kid')
+    except Exception as e:
+        abort(401, f"Invalid token: {e}")
+
+    key = jwks_store.get(kid)
+    if key is None:
+        # Include the token header 'kid' in the 401 message to aid debugging
+        # (no token body is logged).
+        abort(401, f"Invalid token (key lookup failed): Unable to find a signing key that matches: {kid}")
 
     try:
-        claims = jwt.decode(
-            token,
-            key,
-            algorithms=["RS256"],
-            options={"leeway": 10},
-        )
+        with metrics.timer("jwt"):
+            claims = jwt.decode(
+                token,
+                key.key,
+                algorithms=["RS256"],
+                leeway=JWT_LEEWAY,
+            )
     except Exception as e:
         abort(401, f"Invalid token: {e}")
     if settings.CLERK_ISSUER and claims.get("iss") != settings.CLERK_ISSUER:
         abort(401, "Wrong issuer")
+    claims_cache.put(token, claims, kid)
+    return claims
+
+
+def require_user():
+    return verify_token(bearer_token(request.headers.get("Authorization", "")))
+
+
+def require_admin():
+    claims = require_user()
+    user_id = claims.get("sub") or claims.get("id") or claims.get("user_id")
+    if not user_id or user_id not in settings.ADMIN_USER_IDS:
+        abort(403, "Admin only")
     return claims
@@ -0,0 +1 @@
+"""Benchmark harness; run with `python -m backend.bench --help`."""
@@ -0,0 +1,322 @@
+"""Load-test backend.app under gunicorn with local Clerk/Ably stand-ins.
+
+    python -m backend.bench --duration 20 --concurrency 8
+    python -m backend.bench --database-url postgresql://localhost/npc_bench
+    python -m backend.bench --compare bench-results/<previous>.json
+    python -m backend.bench --asgi   # backend.asgi:app under uvicorn workers
+
+Starts a JWKS server and a fake Ably REST endpoint (backend/bench/stubs.py),
+migrates a scratch database (SQLite unless --database-url is given), boots
+gunicorn, seeds campaigns and members through the API, then drives a weighted
+mix of list/join/roll/token requests from --concurrency threads. Throughput
+and p50/p95/p99 per endpoint are printed and written as JSON to --out
+(default bench-results/<utc time>-<commit>.json) for comparison between
+commits.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from .stubs import FakeAbly, JwksServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+DEFAULT_MIX = "list=50,token=25,roll=20,join=5"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_mix(raw: str) -> dict[str, int]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation in --mix: {name!r} (choose from {', '.join(OPERATIONS)})")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# --- Operations: (method, path, json body) given the worker's context ---
+
+def _op_list(ctx):
+    return "GET", "/api/campaigns", None
+
+
+def _op_join(ctx):
+    return "POST", f"/api/campaigns/{ctx['rng'].choice(ctx['campaigns'])}/join", None
+
+
+def _op_roll(ctx):
+    return "POST", f"/api/campaigns/{ctx['rng'].choice(ctx['campaigns'])}/roll", {"expr": "4d6kh3+2"}
+
+
+def _op_token(ctx):
+    return "GET", "/api/realtime/token", None
+
+
+OPERATIONS = {"list": _op_list, "join": _op_join, "roll": _op_roll, "token": _op_token}
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="npc-bench-")
+        self.jwks = JwksServer().start()
+        self.ably = FakeAbly().start()
+        self.port = args.port or _free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.database_url = args.database_url or f"sqlite:///{os.path.join(self.tmp, 'bench.db')}"
+        self.proc = None
+
+    def env(self) -> dict:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": self.database_url,
+            "CLERK_ISSUER": self.jwks.issuer,
+            "CLERK_JWKS_URL": self.jwks.url,
+            "CLERK_JWKS_URL_ALT": "",
+            "ABLY_API_KEY": "bench.key:secret",
+            "ABLY_REST_HOST": "127.0.0.1",
+            "ABLY_REST_PORT": str(self.ably.port),
+            "ABLY_TLS": "0",
+            "METRICS_DIR": os.path.join(self.tmp, "metrics"),
+            # A handful of bench users roll far faster than any player, so
+            # limits are off unless the caller's environment sets a store.
+            "RATE_LIMIT_STORE": os.environ.get("RATE_LIMIT_STORE", "off"),
+            "RATE_LIMIT_DB": os.path.join(self.tmp, "ratelimit.db"),
+            # Likewise no load shedding, so runs measure capacity, not 503s.
+            "MAX_IN_FLIGHT": os.environ.get("MAX_IN_FLIGHT", "0"),
+            "WEB_CONCURRENCY": str(self.args.workers),
+            "PYTHONPATH": ROOT,
+        })
+        return env
+
+    def migrate(self):
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, "backend", "alembic_upgrade.py"), "head"],
+            cwd=ROOT, env=self.env(), check=True, stdout=subprocess.DEVNULL,
+        )
+
+    def start_server(self):
+        cmd = [
+            sys.executable, "-m", "gunicorn",
+            "--worker-class", self.args.worker_class,
+            "-w", str(self.args.workers),
+            "--threads", str(self.args.threads),
+            "-b", f"127.0.0.1:{self.port}",
+            "--log-level", "warning",
+            "backend.asgi:app" if self.args.asgi else "backend.app:app",
+        ]
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, env=self.env(), stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise SystemExit(f"gunicorn exited with {self.proc.returncode}")
+            try:
+                if requests.get(self.base + "/api/health", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise SystemExit("gunicorn did not become healthy within 30s")
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.jwks.stop()
+        self.ably.stop()
+
+    def seed(self) -> tuple[list[str], list[str]]:
+        """Create campaigns and memberships through the API; return (tokens, campaign ids)."""
+        tokens = [self.jwks.mint(f"bench_user_{i}") for i in range(self.args.users)]
+        s = requests.Session()
+        campaigns = []
+        for i in range(self.args.campaigns):
+            r = s.post(self.base + "/api/campaigns", json={"name": f"Bench {i}"},
+                       headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+            r.raise_for_status()
+            campaigns.append(r.json()["id"])
+        rng = random.Random(self.args.seed)
+        for token in tokens:
+            for cid in rng.sample(campaigns, min(3, len(campaigns))):
+                s.post(self.base + f"/api/campaigns/{cid}/join",
+                       headers={"Authorization": f"Bearer {token}"}).raise_for_status()
+        return tokens, campaigns
+
+    def drive(self, tokens, campaigns) -> dict[str, list]:
+        mix = _parse_mix(self.args.mix)
+        names, weights = list(mix), list(mix.values())
+        samples: dict[str, list] = {name: [] for name in names}
+        lock = threading.Lock()
+        start = time.monotonic()
+        measure_from = start + self.args.warmup
+        stop_at = measure_from + self.args.duration
+
+        def worker(n):
+            rng = random.Random(self.args.seed + n)
+            s = requests.Session()
+            ctx = {"campaigns": campaigns, "rng": rng}
+            local: dict[str, list] = {name: [] for name in names}
+            while True:
+                now = time.monotonic()
+                if now >= stop_at:
+                    break
+                name = rng.choices(names, weights)[0]
+                method, path, body = OPERATIONS[name](ctx)
+                headers = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+                t0 = time.perf_counter()
+                try:
+                    status = s.request(method, self.base + path, json=body, headers=headers, timeout=30).status_code
+                except requests.RequestException:
+                    status = 0
+                elapsed = time.perf_counter() - t0
+                if now >= measure_from:
+                    local[name].append((elapsed, status))
+            with lock:
+                for name, values in local.items():
+                    samples[name].extend(values)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return samples
+
+
+def summarize(samples: dict[str, list], duration: float) -> dict:
+    out = {}
+    all_latencies = []
+    for name, values in samples.items():
+        latencies = sorted(v[0] for v in values)
+        all_latencies.extend(latencies)
+        out[name] = _stats(latencies, duration, errors=sum(1 for _, status in values if not 200 <= status < 400))
+    out["all"] = _stats(sorted(all_latencies), duration, errors=sum(v["errors"] for v in out.values()))
+    return out
+
+
+def _stats(latencies: list[float], duration: float, errors: int) -> dict:
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 2) if duration else 0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0,
+    }
+
+
+def print_table(results: dict, baseline: dict | None = None):
+    cols = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print(f"{'endpoint':<10}" + "".join(f"{c:>12}" for c in cols))
+    for name, row in results.items():
+        line = f"{name:<10}" + "".join(f"{row[c]:>12}" for c in cols)
+        print(line)
+        base = (baseline or {}).get(name)
+        if base:
+            deltas = []
+            for c in cols[2:]:
+                if base.get(c):
+                    deltas.append(f"{(row[c] - base[c]) / base[c] * 100:>+11.1f}%")
+                else:
+                    deltas.append(f"{'-':>12}")
+            print(f"{'  vs base':<10}{'':>12}{'':>12}" + "".join(deltas))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m backend.bench", description=__doc__.split("\n\n")[0])
+    p.add_argument("--duration", type=float, default=20, help="measured seconds")
+    p.add_argument("--warmup", type=float, default=3, help="unmeasured seconds before --duration")
+    p.add_argument("--concurrency", type=int, default=8, help="client threads")
+    p.add_argument("--workers", type=int, default=2, help="gunicorn workers (production runs 2)")
+    p.add_argument("--worker-class", default="", help="default gthread as deployed, or uvicorn.workers.UvicornWorker with --asgi")
+    p.add_argument("--threads", type=int, default=16, help="threads per worker (for --worker-class gthread)")
+    p.add_argument("--asgi", action="store_true", help="serve backend.asgi:app (needs requirements-async.txt)")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--campaigns", type=int, default=10)
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operations (default {DEFAULT_MIX})")
+    p.add_argument("--database-url", default="", help="defaults to a scratch SQLite file")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="", help="results JSON path")
+    p.add_argument("--compare", default="", help="previous results JSON to diff against")
+    args = p.parse_args(argv)
+    args.worker_class = args.worker_class or ("uvicorn.workers.UvicornWorker" if args.asgi else "gthread")
+    _parse_mix(args.mix)
+
+    h = Harness(args)
+    try:
+        h.migrate()
+        h.start_server()
+        tokens, campaigns = h.seed()
+        samples = h.drive(tokens, campaigns)
+        server_metrics = requests.get(h.base + "/api/_metrics", timeout=5).text
+    finally:
+        h.stop()
+
+    results = summarize(samples, args.duration)
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "database": args.database_url.split(":", 1)[0] if args.database_url else "sqlite",
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "database_url")},
+        "jwks_fetches": h.jwks.fetches,
+        "ably_publishes": h.ably.publishes,
+        "results": results,
+        "server_metrics": server_metrics,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    out = args.out or os.path.join(
+        ROOT, "bench-results", f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{commit or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compare JSON encoders and response compression on list_campaigns payloads.
+
+    python -m backend.bench.serialize
+    python -m backend.bench.serialize --rows 200,5000 --repeat 100 --out serialize.json
+
+For each payload size, builds rows shaped like one /api/campaigns page and
+reports the median time to serialize them with Flask's stdlib provider and
+with jsonprovider (orjson when installed). Then it reports bytes on the wire
+and compression time for identity, gzip and brotli (when installed), at the
+levels from settings.
+"""
+import argparse
+import json
+import random
+import statistics
+import string
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from .. import compression, jsonprovider
+
+
+def campaign_rows(n: int, seed: int = 1) -> list[dict]:
+    """n rows shaped like a list_campaigns page (see campaigns._campaigns_page)."""
+    rng = random.Random(seed)
+
+    def words(k):
+        return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(k))
+
+    return [
+        {
+            "id": f"c{i:012x}",
+            "name": words(3).title(),
+            "description": words(rng.randint(5, 40)),
+            "avatar": f"https://img.example/{rng.getrandbits(48):012x}.png" if rng.random() < 0.5 else "",
+            "owner_id": f"user_{rng.getrandbits(64):016x}",
+            "member_count": rng.randint(0, 40),
+        }
+        for i in range(n)
+    ]
+
+
+def _median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return round(statistics.median(times) * 1000, 4)
+
+
+def run(sizes: list[int], repeat: int) -> dict:
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    encoders = {
+        "stdlib": lambda rows: (stdlib.dumps(rows, separators=(",", ":")) + "\n").encode(),
+        "jsonprovider": jsonprovider.dumps_bytes,
+    }
+    codings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    out = {"orjson": jsonprovider.use_orjson(), "brotli": compression.brotli is not None, "payloads": {}}
+    for n in sizes:
+        rows = campaign_rows(n)
+        body = jsonprovider.dumps_bytes(rows)
+        entry = {"encode_ms": {}, "bytes": {"identity": len(body)}, "compress_ms": {}}
+        for name, encode in encoders.items():
+            entry["encode_ms"][name] = _median_ms(lambda: encode(rows), repeat)
+        for coding in codings:
+            entry["bytes"][coding] = len(compression.compress(body, coding))
+            entry["compress_ms"][coding] = _median_ms(lambda: compression.compress(body, coding), repeat)
+        out["payloads"][str(n)] = entry
+    return out
+
+
+def print_report(report: dict):
+    print(f"orjson: {report['orjson']}  brotli: {report['brotli']}")
+    for n, e in report["payloads"].items():
+        print(f"\n{n} rows")
+        for name, ms in e["encode_ms"].items():
+            print(f"  encode {name:<14}{ms:>10.3f} ms")
+        identity = e["bytes"]["identity"]
+        for coding, size in e["bytes"].items():
+            ms = e["compress_ms"].get(coding)
+            timing = f"{ms:>10.3f} ms" if ms is not None else ""
+            print(f"  {coding:<21}{size:>10} B {size / identity:>6.1%}{timing}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m backend.bench.serialize", description=__doc__.split("\n\n")[0])
+    p.add_argument("--rows", default="50,200,5000", help="comma-separated payload sizes")
+    p.add_argument("--repeat", type=int, default=50)
+    p.add_argument("--out", default="", help="also write the report as JSON")
+    args = p.parse_args(argv)
+    report = run([int(n) for n in args.rows.split(",")], args.repeat)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
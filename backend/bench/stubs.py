@@ -0,0 +1,109 @@
+"""Local stand-ins for Clerk and Ably used by the benchmark.
+
+JwksServer serves an RS256 public key at /.well-known/jwks.json and mints
+tokens signed with the matching private key, so the app's real verification
+path runs unchanged. FakeAbly accepts REST publishes and counts messages.
+Both run on a daemon thread bound to 127.0.0.1 and an OS-assigned port.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+
+class _Server:
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _JwksHandler(_QuietHandler):
+    def do_GET(self):
+        owner = self.server.owner
+        if self.path != "/.well-known/jwks.json":
+            return self._send(404, b"{}")
+        owner.fetches += 1
+        self._send(200, owner.jwks)
+
+
+class JwksServer(_Server):
+    """RS256 signing key plus the JWKS endpoint that publishes it."""
+
+    issuer = "https://bench.clerk.local"
+
+    def __init__(self, kid: str = "bench-key"):
+        super().__init__(_JwksHandler)
+        self.kid = kid
+        self.fetches = 0
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(RSAAlgorithm.to_jwk(self._key.public_key()))
+        jwk.update({"kid": kid, "use": "sig", "alg": "RS256"})
+        self.jwks = json.dumps({"keys": [jwk]}).encode()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/.well-known/jwks.json"
+
+    def mint(self, sub: str, ttl: int = 3600) -> str:
+        now = int(time.time())
+        claims = {"sub": sub, "iss": self.issuer, "iat": now, "nbf": now, "exp": now + ttl}
+        return jwt.encode(claims, self._key, algorithm="RS256", headers={"kid": self.kid})
+
+
+class _AblyHandler(_QuietHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        owner = self.server.owner
+        if self.path.startswith("/keys/") and self.path.endswith("/requestToken"):
+            # Token auth (the app cannot use Basic auth over plain HTTP).
+            now = int(time.time() * 1000)
+            return self._send(200, json.dumps({
+                "token": "bench-token", "keyName": self.path.split("/")[2],
+                "issued": now, "expires": now + 3600 * 1000, "capability": '{"*":["*"]}',
+            }).encode())
+        with owner.lock:
+            owner.publishes += 1
+        self._send(201, b"{}")
+
+    def do_GET(self):
+        # /time and anything else the client might probe
+        self._send(200, json.dumps([int(time.time() * 1000)]).encode())
+
+
+class FakeAbly(_Server):
+    """Accepts Ably REST channel publishes and counts them."""
+
+    def __init__(self):
+        super().__init__(_AblyHandler)
+        self.lock = threading.Lock()
+        self.publishes = 0
@@ -1,82 +1,170 @@
 # Leading duplicated route removed; blueprint/imports defined below
-from flask import Blueprint, request, jsonify, abort
-from sqlalchemy import (
-    Table, Column, String, MetaData, create_engine, select, PrimaryKeyConstraint, DateTime, text
-)
-from .config import settings
+import base64
+import hashlib
+import json
+from datetime import datetime
+from flask import Blueprint, request, jsonify, abort, make_response
+from sqlalchemy import String, select, func, text, literal, or_, and_
+from werkzeug.exceptions import HTTPException
+from . import dal
 from .authn import require_user
+from .db import get_engine
+from .compression import matching_etag
+from .replicas import note_write, read_connection
+from .membership import membership_cache, DEFAULT_ROLE
+# Tables live in tables.py; re-exported here for existing importers (alembic env, export, realtime).
+from .tables import metadata, campaigns_table, campaign_members_table, user_settings_table, versions_table  # noqa: F401
 
 bp = Blueprint("campaigns", __name__)
 
-# --- DB Metadata & Tables ---
-metadata = MetaData()
-
-campaigns_table = Table(
-    "campaigns",
-    metadata,
-    Column("id", String, primary_key=True),
-    Column("name", String, nullable=False),
-    Column("description", String, nullable=True),
-    Column("avatar", String, nullable=True),
-    # Owner ID (Clerk user id). Nullable for existing rows; new creates will set this.
-    Column("owner_id", String, nullable=True),
-    Column("created_at", DateTime, server_default=text('CURRENT_TIMESTAMP')),
-    Column("updated_at", DateTime, nullable=True),
-)
-
-campaign_members_table = Table(
-    "campaign_members",
-    metadata,
-    Column("campaign_id", String, nullable=False),
-    Column("user_id", String, nullable=False),
-    PrimaryKeyConstraint("campaign_id", "user_id", name="pk_campaign_members"),
-)
-
-# Simple user settings table to persist small per-user preferences such as
-# the currently active campaign. Kept in this module so the existing
-# `metadata.create_all()` call will create the table automatically.
-user_settings_table = Table(
-    "user_settings",
-    metadata,
-    Column("user_id", String, primary_key=True),
-    Column("active_campaign_id", String, nullable=True),
-)
-
 # --- Engine helper ---
 def _engine():
-    # pool_pre_ping helps with stale connections on hosts like Render
-    return create_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True, future=True)
+    # Shared per-process engine; pool settings live in config/db.py
+    return get_engine()
+
+def _reader_id() -> str | None:
+    """Signed-in user of a public read, if a valid token was sent.
 
-# --- Ensure tables exist ---
-@bp.before_app_request
-def _ensure_tables():
+    Public listings accept an optional bearer token only so the user's own
+    recent writes are read back from the primary (see replicas.py).
+    """
+    if not request.headers.get("Authorization"):
+        return None
     try:
-        engine = _engine()
-        metadata.create_all(engine)
-        # Ensure an index on campaign_members.user_id for faster membership queries
-        try:
-            with engine.begin() as conn:
-                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_campaign_members_user_id ON campaign_members (user_id)'))
-        except Exception:
-            # Non-fatal: some DBs may not support IF NOT EXISTS for index creation
-            pass
-        # Attempt to add missing columns (safe for Postgres with IF NOT EXISTS). This
-        # helps when the table was created earlier and SQLAlchemy's create_all won't
-        # alter existing tables to add new columns.
-        try:
-            with engine.begin() as conn:
-                # Add owner_id and timestamp columns if they don't exist
-                conn.execute(text("ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS owner_id TEXT"))
-                conn.execute(text("ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"))
-                conn.execute(text("ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP"))
-                # Ensure user_settings table exists (some DBs won't have been created earlier)
-                conn.execute(text("CREATE TABLE IF NOT EXISTS user_settings (user_id TEXT PRIMARY KEY, active_campaign_id TEXT)"))
-        except Exception:
-            # Non-fatal: tolerate DBs that don't support IF NOT EXISTS or need migrations
-            pass
+        claims = require_user()
+    except HTTPException:
+        return None
+    return claims.get('sub') or claims.get('id') or claims.get('user_id')
+
+
+# --- Pagination helpers ---
+# Listings are keyset-paginated: the body stays a JSON array (capped at
+# PAGE_SIZE_MAX rows) and the opaque cursor for the next page, if any, is
+# returned in the X-Next-Cursor header.
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+
+def _page_args(args=None):
+    # `args` lets the ASGI fast path (asgi.py) reuse this outside a Flask request.
+    args = request.args if args is None else args
+    try:
+        limit = int(args.get('limit', PAGE_SIZE_DEFAULT))
+    except ValueError:
+        abort(400, 'limit must be an integer')
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    raw = args.get('cursor')
+    if not raw:
+        return limit, None
+    try:
+        return limit, json.loads(base64.urlsafe_b64decode(raw.encode() + b'=' * (-len(raw) % 4)))
     except Exception:
-        # Don't crash app if DB not reachable at startup; endpoints will surface errors later
-        pass
+        abort(400, 'invalid cursor')
+
+
+def _encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _page_response(items, next_cursor):
+    resp = jsonify(items)
+    if next_cursor is not None:
+        resp.headers['X-Next-Cursor'] = _encode_cursor(next_cursor)
+    return resp
+
+
+def _ts_param(conn, ts: datetime):
+    # SQLite keeps timestamps as text ('YYYY-MM-DD HH:MM:SS' from
+    # CURRENT_TIMESTAMP). Bind the same text form so comparisons line up.
+    if conn.dialect.name == 'sqlite':
+        return literal(str(ts), String)
+    return ts
+
+
+# --- Versions & conditional GET ---
+# Bump when a response body changes shape, so tags issued by an older
+# deploy can't revalidate to the old body.
+ETAG_FORMAT = 1
+
+
+def _version_query(key: str):
+    return select(versions_table.c.version).where(versions_table.c.key == key)
+
+
+def _etag_value(key: str, version, query_string: bytes) -> str:
+    # Pages/limits of the same listing share a version but not a body.
+    digest = hashlib.sha1(query_string).hexdigest()[:12]
+    return f"{key}.{ETAG_FORMAT}.{version}.{digest}"
+
+
+def _row_version(row) -> int:
+    return row[0] if row else 0
+
+
+def _page_version(rows) -> str:
+    """Version of a directory page: a digest of the rows it is built from.
+
+    The directory has no counter of its own. One shared row bumped by every
+    create, edit, join and leave would serialize those writes and expire
+    every page whenever any campaign changed; this way only the pages that
+    show the change get a new tag.
+    """
+    return hashlib.sha1(repr([tuple(r) for r in rows]).encode()).hexdigest()[:16]
+
+
+def _etag(conn, key: str) -> str:
+    return _etag_value(key, _row_version(conn.execute(_version_query(key)).fetchone()), request.query_string)
+
+
+def _not_modified(etag: str, private: bool = False):
+    """304 response if the client already has this version, else None."""
+    # The client may hold the compressed body's ETag (see compression.py).
+    held = matching_etag(etag, request.if_none_match)
+    if held is not None:
+        return _cacheable(make_response("", 304), held, private)
+    return None
+
+
+def _cacheable(resp, etag: str, private: bool = False):
+    resp.set_etag(etag)
+    # Clients may keep the body but must revalidate; revalidation is one PK
+    # read (or the page query itself for the campaign directory).
+    resp.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return resp
+
+
+# --- Member counts ---
+def _member_count_expr():
+    return (
+        select(func.count())
+        .where(campaign_members_table.c.campaign_id == campaigns_table.c.id)
+        .scalar_subquery()
+    )
+
+
+def repair_member_counts(engine=None, batch: int = 500) -> int:
+    """Recompute campaigns.member_count where it has drifted; returns rows fixed."""
+    engine = engine or _engine()
+    fixed = 0
+    last_id = ''
+    while True:
+        with engine.begin() as conn:
+            ids = [r[0] for r in conn.execute(
+                select(campaigns_table.c.id).where(campaigns_table.c.id > last_id)
+                .order_by(campaigns_table.c.id).limit(batch)
+            )]
+            if not ids:
+                break
+            actual = _member_count_expr()
+            res = conn.execute(
+                campaigns_table.update()
+                .where(campaigns_table.c.id.in_(ids), campaigns_table.c.member_count != actual)
+                .values(member_count=actual)
+            )
+            fixed += res.rowcount
+        last_id = ids[-1]
+    return fixed
+
 
 # --- Routes ---
 
@@ -105,26 +193,11 @@ def update_campaign(cid: str):
     try:
         engine = _engine()
         with engine.begin() as conn:
-            # Ensure requester is owner
-            owner_row = conn.execute(select(campaigns_table.c.owner_id).where(campaigns_table.c.id == cid)).fetchone()
-            if not owner_row:
-                abort(404, "Campaign not found")
-            if owner_row[0] != user_id:
-                abort(403, "Only the campaign owner may edit campaign metadata")
-
-            # Update
-            result = conn.execute(
-                campaigns_table.update()
-                .where(campaigns_table.c.id == cid)
-                .values(**{**update_values, 'updated_at': text('CURRENT_TIMESTAMP')})
-            )
-            # If nothing was updated, something unexpected happened
-            if result.rowcount == 0:
-                abort(404, "Campaign not found")
-
-            # Return the fresh row
-            res = conn.execute(
-                select(
+            # Ownership is part of the UPDATE's WHERE; RETURNING gives the fresh row.
+            row = dal.update_owned_campaign(
+                conn, cid, user_id,
+                {**update_values, 'updated_at': text('CURRENT_TIMESTAMP')},
+                returning=[
                     campaigns_table.c.id,
                     campaigns_table.c.name,
                     campaigns_table.c.description,
@@ -132,59 +205,110 @@ def update_campaign(cid: str):
                     campaigns_table.c.owner_id,
                     campaigns_table.c.created_at,
                     campaigns_table.c.updated_at,
-                ).where(campaigns_table.c.id == cid)
+                ],
             )
-            row = res.fetchone()
-            if not row:
-                abort(404, "Campaign not found")
-            # Convert SQLAlchemy Row to dict and serialize datetimes to ISO strings
-            out = dict(row._mapping)
-            for dt_key in ("created_at", "updated_at"):
-                val = out.get(dt_key)
-                try:
-                    if val is not None:
-                        out[dt_key] = val.isoformat()
-                except Exception:
-                    # If it's not a datetime or cannot be serialized, leave as-is
-                    pass
-            return jsonify(out)
+            if row is None:
+                found, _ = dal.campaign_owner(conn, cid)
     except Exception as e:
         import traceback
         traceback.print_exc()
         abort(500, f"DB error: {e}")
+    if row is None:
+        if not found:
+            abort(404, "Campaign not found")
+        abort(403, "Only the campaign owner may edit campaign metadata")
+    note_write(user_id)
+    # The app's JSON provider writes datetimes as ISO 8601.
+    return jsonify(dict(row._mapping))
 
 @bp.get("/api/campaigns/<cid>/members")
 def list_members(cid: str):
+    limit, cursor = _page_args()
+    after = _members_after(cursor)
     try:
-        engine = _engine()
-        with engine.connect() as conn:
-            res = conn.execute(
-                select(campaign_members_table.c.user_id)
-                .where(campaign_members_table.c.campaign_id == cid)
-            )
+        with read_connection(_reader_id()) as conn:
+            etag = _etag(conn, f"members:{cid}")
+            not_modified = _not_modified(etag)
+            if not_modified is not None:
+                return not_modified
+            q = select(campaign_members_table.c.user_id).where(campaign_members_table.c.campaign_id == cid)
+            if after is not None:
+                q = q.where(campaign_members_table.c.user_id > after)
+            res = conn.execute(q.order_by(campaign_members_table.c.user_id).limit(limit + 1))
             rows = [r[0] for r in res.fetchall()]
-        return jsonify(rows)
+        return _cacheable(_page_response(rows[:limit], [rows[limit - 1]] if len(rows) > limit else None), etag)
     except Exception as e:
         abort(500, f"DB error: {e}")
 
 
+def _members_after(cursor):
+    """user_id to resume after, from a decoded cursor; 400 if malformed."""
+    if cursor is None:
+        return None
+    if not isinstance(cursor, list) or len(cursor) != 1 or not isinstance(cursor[0], str):
+        abort(400, 'invalid cursor')
+    return cursor[0]
+
+
 @bp.get('/api/campaigns')
 def list_campaigns():
+    limit, cursor = _page_args()
+    after = _campaigns_after(cursor)
     try:
-        engine = _engine()
-        with engine.connect() as conn:
-            res = conn.execute(select(
-                campaigns_table.c.id,
-                campaigns_table.c.name,
-                campaigns_table.c.description,
-                campaigns_table.c.avatar,
-            ))
-            rows = [dict(r._mapping) for r in res.fetchall()]
-        return jsonify(rows)
+        with read_connection(_reader_id()) as conn:
+            rows = conn.execute(_campaigns_query(conn, limit, after)).fetchall()
+        etag = _etag_value("campaigns", _page_version(rows), request.query_string)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        items, next_cursor = _campaigns_page(rows, limit)
+        return _cacheable(_page_response(items, next_cursor), etag)
     except Exception as e:
         abort(500, f"DB error: {e}")
 
 
+# list_campaigns pieces shared with the ASGI fast path (asgi.py).
+def _campaigns_after(cursor):
+    """(created_at, id) to resume after, from a decoded cursor; 400 if malformed."""
+    if cursor is None:
+        return None
+    try:
+        return datetime.fromisoformat(cursor[0]), str(cursor[1])
+    except Exception:
+        abort(400, 'invalid cursor')
+
+
+def _campaigns_query(conn, limit: int, after):
+    q = select(
+        campaigns_table.c.id,
+        campaigns_table.c.name,
+        campaigns_table.c.description,
+        campaigns_table.c.avatar,
+        campaigns_table.c.member_count,
+        campaigns_table.c.created_at,
+    )
+    if after is not None:
+        ts = _ts_param(conn, after[0])
+        q = q.where(or_(
+            campaigns_table.c.created_at > ts,
+            and_(campaigns_table.c.created_at == ts, campaigns_table.c.id > after[1]),
+        ))
+    # One extra row tells us whether there is a next page.
+    return q.order_by(campaigns_table.c.created_at, campaigns_table.c.id).limit(limit + 1)
+
+
+def _campaigns_page(rows, limit: int):
+    """(items, next cursor values) from the limit+1 rows of _campaigns_query."""
+    rows = [dict(r._mapping) for r in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = [last['created_at'].isoformat() if last['created_at'] else None, last['id']]
+    for r in rows:
+        del r['created_at']
+    return rows[:limit], next_cursor
+
+
 @bp.post('/api/campaigns')
 def create_campaign():
     claims = require_user()
@@ -207,6 +331,7 @@ def create_campaign():
                 owner_id=owner_id,
                 created_at=text('CURRENT_TIMESTAMP'),
             ))
+        note_write(owner_id)
         return jsonify({"id": cid, "name": name, "description": description, "avatar": avatar})
     except Exception as e:
         abort(500, f"DB error: {e}")
@@ -221,21 +346,22 @@ def join_campaign(cid: str):
     try:
         engine = _engine()
         with engine.begin() as conn:
-            # ensure campaign exists
-            res = conn.execute(select(campaigns_table.c.id).where(campaigns_table.c.id == cid)).fetchone()
-            if not res:
-                abort(404, 'campaign not found')
-            # insert membership if not exists
-            existing = conn.execute(
-                select(campaign_members_table.c.user_id).where(
-                    (campaign_members_table.c.campaign_id == cid) & (campaign_members_table.c.user_id == user_id)
-                )
-            ).fetchone()
-            if not existing:
-                conn.execute(campaign_members_table.insert().values(campaign_id=cid, user_id=user_id))
-        return jsonify({"ok": True, "campaign": cid, "member": user_id})
+            # One INSERT ... SELECT WHERE EXISTS(campaign) ON CONFLICT DO NOTHING
+            inserted = dal.insert_membership(conn, cid, user_id, DEFAULT_ROLE)
+            if inserted:
+                dal.adjust_member_count(conn, cid, 1)
+                dal.bump_versions(conn, f"members:{cid}")
+                found = True
+            else:
+                # Already a member, or no such campaign
+                found, _ = dal.campaign_owner(conn, cid)
     except Exception as e:
         abort(500, f"DB error: {e}")
+    if not found:
+        abort(404, 'campaign not found')
+    membership_cache.invalidate(cid, user_id)
+    note_write(user_id)
+    return jsonify({"ok": True, "campaign": cid, "member": user_id})
 
 
 @bp.post('/api/campaigns/<cid>/leave')
@@ -248,26 +374,26 @@ def leave_campaign(cid: str):
         engine = _engine()
         with engine.begin() as conn:
             # delete membership if exists
-            conn.execute(
+            deleted = conn.execute(
                 campaign_members_table.delete().where(
                     (campaign_members_table.c.campaign_id == cid) & (campaign_members_table.c.user_id == user_id)
                 )
             )
+            if deleted.rowcount:
+                dal.adjust_member_count(conn, cid, -deleted.rowcount)
+                dal.bump_versions(conn, f"members:{cid}")
             # If this campaign was the user's active campaign, clear it
-            res = conn.execute(
-                select(user_settings_table.c.active_campaign_id).where(user_settings_table.c.user_id == user_id)
-            ).fetchone()
-            new_active = None
-            if res:
-                # If active matches the left campaign, clear it; otherwise keep existing value
-                if res[0] == cid:
-                    conn.execute(
-                        user_settings_table.update().where(user_settings_table.c.user_id == user_id).values(active_campaign_id=None)
-                    )
-                    new_active = None
-                else:
-                    new_active = res[0]
-            # Return the result including the user's current active campaign (or null)
+            if dal.clear_active_if(conn, user_id, cid):
+                dal.bump_versions(conn, f"user:{user_id}")
+                new_active = None
+            else:
+                res = conn.execute(
+                    select(user_settings_table.c.active_campaign_id).where(user_settings_table.c.user_id == user_id)
+                ).fetchone()
+                new_active = res[0] if res else None
+        membership_cache.invalidate(cid, user_id)
+        note_write(user_id)
+        # Return the result including the user's current active campaign (or null)
         return jsonify({"ok": True, "campaign": cid, "member": user_id, "active": new_active})
     except Exception as e:
         abort(500, f"DB error: {e}")
@@ -278,12 +404,64 @@ def get_active_campaign():
     claims = require_user()
     user_id = claims.get('sub') or claims.get('id') or claims.get('user_id')
     try:
-        engine = _engine()
-        with engine.connect() as conn:
+        with read_connection(user_id) as conn:
+            etag = _etag(conn, f"user:{user_id}")
+            not_modified = _not_modified(etag, private=True)
+            if not_modified is not None:
+                return not_modified
             res = conn.execute(select(user_settings_table.c.active_campaign_id).where(user_settings_table.c.user_id == user_id)).fetchone()
-            if not res:
-                return jsonify({"active": None})
-            return jsonify({"active": res[0]})
+            return _cacheable(jsonify({"active": res[0] if res else None}), etag, private=True)
+    except Exception as e:
+        abort(500, f"DB error: {e}")
+
+
+@bp.get('/api/user/dashboard')
+def get_dashboard():
+    """Everything the campaigns page needs for the signed-in user, in one call.
+
+    Runs a fixed number of queries however many campaigns the user has:
+    memberships joined to campaigns (ix_campaign_members_user_id), owned
+    campaigns (ix_campaigns_owner_id) and the active campaign. Member counts
+    come from the denormalized campaigns.member_count column.
+    """
+    claims = require_user()
+    user_id = claims.get('sub') or claims.get('id') or claims.get('user_id')
+    if not user_id:
+        abort(400, 'unable to determine user id')
+    cols = [
+        campaigns_table.c.id,
+        campaigns_table.c.name,
+        campaigns_table.c.description,
+        campaigns_table.c.avatar,
+        campaigns_table.c.owner_id,
+        campaigns_table.c.member_count,
+    ]
+    order = [campaigns_table.c.created_at, campaigns_table.c.id]
+    try:
+        with read_connection(user_id) as conn:
+            joined = conn.execute(
+                select(*cols, campaign_members_table.c.role)
+                .select_from(campaign_members_table.join(
+                    campaigns_table, campaigns_table.c.id == campaign_members_table.c.campaign_id
+                ))
+                .where(campaign_members_table.c.user_id == user_id)
+                .order_by(*order)
+            ).fetchall()
+            owned = conn.execute(select(*cols).where(campaigns_table.c.owner_id == user_id).order_by(*order)).fetchall()
+
+            out = {}
+            for r in joined:
+                out[r.id] = {**r._mapping, "role": r.role or DEFAULT_ROLE, "is_member": True}
+            for r in owned:
+                out.setdefault(r.id, {**r._mapping, "role": "owner", "is_member": False})
+            active = conn.execute(
+                select(user_settings_table.c.active_campaign_id).where(user_settings_table.c.user_id == user_id)
+            ).fetchone()
+        campaigns = []
+        for c in out.values():
+            c["is_owner"] = c["owner_id"] == user_id
+            campaigns.append(c)
+        return jsonify({"campaigns": campaigns, "active": active[0] if active else None})
     except Exception as e:
         abort(500, f"DB error: {e}")
 
@@ -298,25 +476,17 @@ def set_active_campaign():
     try:
         engine = _engine()
         with engine.begin() as conn:
-            # Validate that active is either None or a campaign the user has joined or owns
-            if active is not None:
-                # ensure campaign exists
-                c = conn.execute(select(campaigns_table.c.id, campaigns_table.c.owner_id).where(campaigns_table.c.id == active)).fetchone()
-                if not c:
-                    abort(404, 'campaign not found')
-                # check membership or ownership
-                member = conn.execute(select(campaign_members_table.c.user_id).where(
-                    (campaign_members_table.c.campaign_id == active) & (campaign_members_table.c.user_id == user_id)
-                )).fetchone()
-                if not member and c[1] != user_id:
-                    abort(403, 'user is not a member or owner of that campaign')
-
-            # upsert-style insert/update
-            result = conn.execute(
-                user_settings_table.update().where(user_settings_table.c.user_id == user_id).values(active_campaign_id=active)
-            )
-            if result.rowcount == 0:
-                conn.execute(user_settings_table.insert().values(user_id=user_id, active_campaign_id=active))
-        return jsonify({"ok": True, "active": active})
+            # Upsert guarded by "campaign exists and user is a member or owner"
+            ok = dal.upsert_active_campaign(conn, user_id, active)
+            if ok:
+                dal.bump_versions(conn, f"user:{user_id}")
+            else:
+                found, _ = dal.campaign_owner(conn, active)
     except Exception as e:
-        abort(500, f"DB error: {e}")
\ No newline at end of file
+        abort(500, f"DB error: {e}")
+    if not ok:
+        if not found:
+            abort(404, 'campaign not found')
+        abort(403, 'user is not a member or owner of that campaign')
+    note_write(user_id)
+    return jsonify({"ok": True, "active": active})
\ No newline at end of file
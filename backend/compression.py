@@ -0,0 +1,115 @@
+"""Negotiated gzip/brotli compression of API responses.
+
+A response is compressed when the client's Accept-Encoding allows it, its
+body is at least COMPRESS_MIN_BYTES, it has a text or JSON content type and
+nothing has encoded it yet. Brotli is preferred when the `brotli` package is
+installed and the client accepts `br`; gzip otherwise. Streamed responses
+(the NDJSON export, profile downloads) pass through untouched; the export
+has its own ?gzip=1.
+
+A compressed body gets its own ETag, the identity one with a "-gzip" or
+"-br" suffix, since strong validators must differ between content-codings.
+Handlers answering conditional requests use matching_etag() so either form
+revalidates.
+"""
+import gzip
+
+from flask import request
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # optional, see requirements.txt
+    brotli = None
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+# Every coding this module may have produced, installed here or not.
+CODINGS = ("gzip", "br")
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """Pick "br", "gzip" or None from an Accept-Encoding header value."""
+    if not accept_encoding:
+        return None
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    wildcard = offered.get("*", 0.0)
+    choices = (("br",) if brotli is not None else ()) + ("gzip",)
+    best, best_q = None, 0.0
+    for coding in choices:
+        q = offered.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(data, quality=settings.COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=settings.COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def encoded_etag(etag: str, coding: str) -> str:
+    return f"{etag}-{coding}"
+
+
+def matching_etag(etag: str, if_none_match) -> str | None:
+    """The form of `etag` (identity or encoded) found in a parsed
+    If-None-Match (werkzeug ETags), or None."""
+    for candidate in (etag, *(encoded_etag(etag, c) for c in CODINGS)):
+        if candidate in if_none_match:
+            return candidate
+    return None
+
+
+def compressible(content_type: str | None, size: int) -> bool:
+    return (
+        settings.COMPRESS_MIN_BYTES > 0
+        and size >= settings.COMPRESS_MIN_BYTES
+        and bool(content_type)
+        and content_type.startswith(COMPRESSIBLE)
+    )
+
+
+def init_app(app):
+    """Compress eligible responses.
+
+    Register this after the other hooks: Flask runs after_request hooks in
+    reverse, so compression then happens first and its cost shows up in the
+    request metrics and Server-Timing.
+    """
+
+    @app.after_request
+    def _compress(response):
+        if (
+            request.method == "HEAD"
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        coding = negotiate(request.headers.get("Accept-Encoding"))
+        if coding is None:
+            return response
+        data = response.get_data()
+        if not compressible(response.mimetype, len(data)):
+            return response
+        response.set_data(compress(data, coding))
+        response.headers["Content-Encoding"] = coding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag, coding), weak)
+        return response
@@ -4,13 +4,123 @@ class Settings:
     APP_SECRET = os.getenv("APP_SECRET", "change-me")
     DATABASE_URL = os.getenv("DATABASE_URL", "")
 
+    # Connection pool (one shared engine per worker process, see db.py)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    # Recycle connections before Render/Postgres idle timeouts drop them
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+
+    # Read replicas (see replicas.py): comma-separated URLs for read-only
+    # handlers. An unreachable replica is skipped for REPLICA_RETRY_SECONDS;
+    # a user's reads stay on the primary for READ_YOUR_WRITES_SECONDS after
+    # they write.
+    DATABASE_URL_REPLICAS = os.getenv("DATABASE_URL_REPLICAS", "")
+    REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+    READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+    READ_YOUR_WRITES_DIR = os.getenv("READ_YOUR_WRITES_DIR", "")
+
+    # Schema readiness (see schema.py): "on" checks the alembic revision once
+    # per worker, "off" skips the check entirely.
+    SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "on").lower()
+    SCHEMA_RECHECK_SECONDS = float(os.getenv("SCHEMA_RECHECK_SECONDS", "30"))
+
+    # Membership/role cache used by Ably token minting (see membership.py)
+    MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "60"))
+    MEMBERSHIP_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "5"))
+    MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+    # Marker files through which a join/leave on one worker reaches the
+    # others' caches. Defaults to <tmp>/npcchatter-membership.
+    MEMBERSHIP_MARKS_DIR = os.getenv("MEMBERSHIP_MARKS_DIR", "")
+
     # Clerk
     CLERK_ISSUER = os.getenv("CLERK_ISSUER", "")
     CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "")
     # Optional alternate JWKS URL to tolerate short migrations / rotated projects
     CLERK_JWKS_URL_ALT = os.getenv("CLERK_JWKS_URL_ALT", "")
+    # JWKS key cache (see authn.KeyStore): keys are refreshed in the background
+    # before JWKS_TTL; unknown kids force at most one refresh per
+    # JWKS_MIN_REFRESH_INTERVAL and are then rejected for JWKS_NEGATIVE_TTL.
+    JWKS_TTL = float(os.getenv("JWKS_TTL", "3600"))
+    JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+    JWKS_NEGATIVE_TTL = float(os.getenv("JWKS_NEGATIVE_TTL", "300"))
+    # Verified-claims LRU (entries); 0 disables the cache
+    CLAIMS_CACHE_SIZE = int(os.getenv("CLAIMS_CACHE_SIZE", "2048"))
+
+    # Clerk user ids allowed to call admin-only endpoints (comma separated)
+    ADMIN_USER_IDS = {u.strip() for u in os.getenv("ADMIN_USER_IDS", "").split(",") if u.strip()}
 
     # Ably
     ABLY_API_KEY = os.getenv("ABLY_API_KEY", "")
+    # Override the Ably REST host (e.g. the local stand-in used by backend.bench)
+    ABLY_REST_HOST = os.getenv("ABLY_REST_HOST", "")
+    ABLY_REST_PORT = int(os.getenv("ABLY_REST_PORT", "0"))
+    ABLY_TLS = os.getenv("ABLY_TLS", "1").lower() not in ("0", "false", "no")
+    # Background publisher (see publisher.py)
+    ABLY_QUEUE_SIZE = int(os.getenv("ABLY_QUEUE_SIZE", "1000"))
+    ABLY_BATCH_SIZE = int(os.getenv("ABLY_BATCH_SIZE", "50"))
+    ABLY_MAX_RETRIES = int(os.getenv("ABLY_MAX_RETRIES", "3"))
+    ABLY_RETRY_BACKOFF = float(os.getenv("ABLY_RETRY_BACKOFF", "0.5"))
+    # Longest a worker waits at exit for queued messages to be sent
+    ABLY_EXIT_FLUSH_SECONDS = float(os.getenv("ABLY_EXIT_FLUSH_SECONDS", "5"))
+    # Token endpoint: Ably token TTL and how long a user's campaign
+    # capability is reused before re-reading memberships.
+    ABLY_TOKEN_TTL_MS = int(os.getenv("ABLY_TOKEN_TTL_MS", str(60 * 60 * 1000)))
+    ABLY_CAPABILITY_TTL = float(os.getenv("ABLY_CAPABILITY_TTL", "2700"))
+
+    # NDJSON export (see export.py): rows per response before a resume cursor,
+    # and rows fetched per server-side cursor batch.
+    EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "100000"))
+    EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))
+
+    # Metrics (see metrics.py): per-worker snapshot files merged by
+    # /api/_metrics. Defaults to <tmp>/npcchatter-metrics.
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "1"))
+    # Statements at or above this many milliseconds go to the slow-query log
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+    # Per-request profiling (see profiling.py). Admins opt in with an
+    # X-Profile header; PROFILE_SAMPLE_RATE (0..1) profiles random requests.
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile").lower()
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+    PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
+    # Response encoding (see jsonprovider.py, compression.py). JSON_PROVIDER
+    # "stdlib" turns orjson off; COMPRESS_MIN_BYTES=0 turns compression off.
+    JSON_PROVIDER = os.getenv("JSON_PROVIDER", "auto").lower()
+    COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+    # Gunicorn workers per instance (gunicorn reads the same variable for -w)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+    # Rate limits (see ratelimit.py). A limit "N/SECONDS" allows bursts of N,
+    # refilled at N per SECONDS; empty or "0" turns it off. RATE_LIMIT_STORE
+    # "memory" keeps buckets per worker, "sqlite" shares them between the
+    # workers on an instance through RATE_LIMIT_DB, "off" disables them.
+    # Defaults to "sqlite" with more than one worker.
+    RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "sqlite" if WEB_CONCURRENCY > 1 else "memory").lower()
+    RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "")
+    ROLL_LIMIT_USER = os.getenv("ROLL_LIMIT_USER", "30/30")
+    ROLL_LIMIT_CAMPAIGN = os.getenv("ROLL_LIMIT_CAMPAIGN", "120/30")
+    TOKEN_LIMIT_USER = os.getenv("TOKEN_LIMIT_USER", "20/60")
+    # Admission control: at most MAX_IN_FLIGHT requests per worker (0 = no
+    # cap; defaults to the DB pool's capacity). Up to ADMISSION_QUEUE more
+    # wait ADMISSION_TIMEOUT seconds for a slot; the rest get a 503 with
+    # Retry-After: ADMISSION_RETRY_AFTER. Under gthread, keep --threads above
+    # MAX_IN_FLIGHT + ADMISSION_QUEUE or the excess waits unseen in gunicorn.
+    MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+    ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "4"))
+    ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "0.5"))
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+    # ASGI mode (see asgi.py): threads running the Flask fallback routes and
+    # forced JWKS refreshes per worker.
+    ASGI_THREADS = int(os.getenv("ASGI_THREADS", "40"))
 
 settings = Settings()
@@ -0,0 +1,118 @@
+"""Single-statement write paths for the campaign routes.
+
+Each helper issues one dialect-aware statement (`INSERT ... ON CONFLICT`,
+`UPDATE ... RETURNING`) with the ownership/membership check folded into its
+WHERE clause, so concurrent requests cannot interleave between a check and
+the write. Only when the statement matches nothing does the caller pay for a
+second read to tell "not found" from "forbidden".
+
+All helpers take an open connection; callers own the transaction.
+"""
+from sqlalchemy import select, exists, literal, and_, or_, true
+
+from .tables import campaigns_table, campaign_members_table, user_settings_table, versions_table
+
+
+def _insert(conn):
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _campaign_exists(cid):
+    return exists().where(campaigns_table.c.id == cid)
+
+
+def _is_member(cid, user_id):
+    return exists().where(
+        campaign_members_table.c.campaign_id == cid,
+        campaign_members_table.c.user_id == user_id,
+    )
+
+
+def campaign_owner(conn, cid):
+    """(found, owner_id) for cid; used to explain a write that matched nothing."""
+    row = conn.execute(select(campaigns_table.c.owner_id).where(campaigns_table.c.id == cid)).fetchone()
+    return (row is not None, row[0] if row else None)
+
+
+def bump_versions(conn, *keys):
+    # Called inside the write's transaction so the ETag changes atomically
+    # with the data it describes.
+    insert = _insert(conn)
+    for key in keys:
+        stmt = insert(versions_table).values(key=key, version=1)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[versions_table.c.key],
+            set_={"version": versions_table.c.version + 1},
+        ))
+
+
+def update_owned_campaign(conn, cid, owner_id, values, returning):
+    """UPDATE the campaign if owner_id owns it; returns the fresh row or None."""
+    return conn.execute(
+        campaigns_table.update()
+        .where(campaigns_table.c.id == cid, campaigns_table.c.owner_id == owner_id)
+        .values(**values)
+        .returning(*returning)
+    ).fetchone()
+
+
+def insert_membership(conn, cid, user_id, role) -> bool:
+    """Add user_id to an existing campaign; True if a row was inserted.
+
+    False means either the campaign does not exist or the user is already a
+    member; see campaign_owner() to tell which.
+    """
+    insert = _insert(conn)
+    src = select(literal(cid), literal(user_id), literal(role)).where(_campaign_exists(cid))
+    stmt = (
+        insert(campaign_members_table)
+        .from_select(["campaign_id", "user_id", "role"], src)
+        .on_conflict_do_nothing(index_elements=[campaign_members_table.c.campaign_id, campaign_members_table.c.user_id])
+        .returning(campaign_members_table.c.user_id)
+    )
+    return conn.execute(stmt).fetchone() is not None
+
+
+def adjust_member_count(conn, cid, delta: int):
+    conn.execute(
+        campaigns_table.update().where(campaigns_table.c.id == cid)
+        .values(member_count=campaigns_table.c.member_count + delta)
+    )
+
+
+def clear_active_if(conn, user_id, cid) -> bool:
+    """Unset the user's active campaign if it is cid; True if it was."""
+    res = conn.execute(
+        user_settings_table.update()
+        .where(user_settings_table.c.user_id == user_id, user_settings_table.c.active_campaign_id == cid)
+        .values(active_campaign_id=None)
+    )
+    return bool(res.rowcount)
+
+
+def upsert_active_campaign(conn, user_id, cid) -> bool:
+    """Set the user's active campaign; False if cid is not theirs to select.
+
+    None always succeeds (clears the selection). Otherwise the row is only
+    written if the campaign exists and the user owns it or is a member.
+    """
+    insert = _insert(conn)
+    src = select(literal(user_id), literal(cid, campaigns_table.c.id.type))
+    if cid is None:
+        # SQLite needs a WHERE before ON CONFLICT to parse INSERT ... SELECT.
+        src = src.where(true())
+    else:
+        src = src.where(exists().where(and_(
+            campaigns_table.c.id == cid,
+            or_(campaigns_table.c.owner_id == user_id, _is_member(cid, user_id)),
+        )))
+    stmt = insert(user_settings_table).from_select(["user_id", "active_campaign_id"], src)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[user_settings_table.c.user_id],
+        set_={"active_campaign_id": stmt.excluded.active_campaign_id},
+    ).returning(user_settings_table.c.user_id)
+    return conn.execute(stmt).fetchone() is not None
@@ -0,0 +1,201 @@
+"""Process-wide SQLAlchemy engine registry.
+
+Every module borrows connections from the engine returned by `get_engine()`
+instead of calling `create_engine` per request. Engines are keyed by URL so
+tests that point `settings.DATABASE_URL` at a scratch SQLite file still get
+their own pool. Pools are dropped in forked children (gunicorn workers) so a
+connection is never shared across processes.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from .config import settings
+from . import metrics, querylog
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def recreate(self):
+        # Carry the counters over when SQLAlchemy rebuilds the pool (dispose).
+        new = super().recreate()
+        new.wait_count = self.wait_count
+        new.wait_total = self.wait_total
+        new.wait_max = self.wait_max
+        return new
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+
+
+_lock = threading.Lock()
+_engines: dict[str, Engine] = {}
+# Async engines for the ASGI app (asgi.py), keyed by the configured sync URL.
+_async_engines: dict = {}
+_pid = os.getpid()
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url)
+
+
+def _pool_kwargs(url: str) -> dict:
+    # In-memory SQLite must stay on SQLAlchemy's SingletonThreadPool, which
+    # does not accept the QueuePool sizing options.
+    if _is_memory_sqlite(url):
+        return {}
+    return {
+        "poolclass": _TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+
+def _check_fork():
+    # Fallback for fork paths that bypass os.register_at_fork (e.g. os.fork in
+    # extension code): if our pid changed, forget the parent's pools.
+    if os.getpid() != _pid:
+        _reset_after_fork()
+
+
+def _reset_after_fork():
+    global _pid
+    _pid = os.getpid()
+    for eng in list(_engines.values()):
+        # close=False: leave the parent's sockets alone, just stop using them.
+        eng.dispose(close=False)
+    for eng in list(_async_engines.values()):
+        eng.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is dropped with a failed statement,
+    # rather than on the pooled connection where it would outlive it.
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    metrics.observe_dependency("db", elapsed)
+    querylog.record(statement, elapsed)
+
+
+def get_engine(url: str | None = None) -> Engine:
+    """Return the shared engine for `url` (defaults to settings.DATABASE_URL)."""
+    url = url or settings.DATABASE_URL
+    _check_fork()
+    eng = _engines.get(url)
+    if eng is not None:
+        return eng
+    with _lock:
+        eng = _engines.get(url)
+        if eng is None:
+            eng = create_engine(
+                url,
+                echo=False,
+                future=True,
+                pool_pre_ping=settings.DB_POOL_PRE_PING,
+                **_pool_kwargs(url),
+            )
+            event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+            event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+            _engines[url] = eng
+    return eng
+
+
+def async_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto the matching asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+", 1)[0]
+    if base in ("postgres", "postgresql"):
+        # asyncpg spells libpq's sslmode as ssl
+        return "postgresql+asyncpg://" + rest.replace("sslmode=", "ssl=")
+    if base == "sqlite":
+        return "sqlite+aiosqlite://" + rest
+    return url
+
+
+def get_async_engine(url: str | None = None):
+    """Shared AsyncEngine for `url`, with the same pool sizing and query hooks."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = url or settings.DATABASE_URL
+    _check_fork()
+    eng = _async_engines.get(url)
+    if eng is not None:
+        return eng
+    with _lock:
+        eng = _async_engines.get(url)
+        if eng is None:
+            kwargs = {}
+            if not url.startswith("sqlite"):
+                kwargs = {k: v for k, v in _pool_kwargs(url).items() if k != "poolclass"}
+            eng = create_async_engine(async_url(url), pool_pre_ping=settings.DB_POOL_PRE_PING, **kwargs)
+            event.listen(eng.sync_engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(eng.sync_engine, "after_cursor_execute", _after_cursor_execute)
+            _async_engines[url] = eng
+    return eng
+
+
+async def dispose_all_async():
+    """Close the async engines' pooled connections (ASGI lifespan shutdown)."""
+    for eng in list(_async_engines.values()):
+        await eng.dispose()
+    _async_engines.clear()
+
+
+def dispose_all():
+    """Close every pooled connection and forget the engines."""
+    with _lock:
+        for eng in _engines.values():
+            eng.dispose()
+        _engines.clear()
+
+
+def pool_stats() -> list[dict]:
+    """Snapshot of pool usage for each engine (URLs are not included)."""
+    out = []
+    for eng in list(_engines.values()):
+        pool = eng.pool
+        item = {"dialect": eng.dialect.name, "pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            item.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            })
+        if isinstance(pool, _TimedQueuePool):
+            item.update({
+                "waits": pool.wait_count,
+                "wait_total_ms": round(pool.wait_total * 1000, 3),
+                "wait_max_ms": round(pool.wait_max * 1000, 3),
+            })
+        out.append(item)
+    return out
@@ -1,46 +1,477 @@
+import math
 import random
+import re
 from dataclasses import dataclass
+from functools import lru_cache
 from flask import Blueprint, request, jsonify, abort
-from ably import AblyRest
-from .config import settings
 from .authn import require_user
+from .ratelimit import check as check_rate_limit
+from .publisher import publisher
 
 bp = Blueprint("dice", __name__)
 
+# Hard limits so a single request can't tie up a worker.
+MAX_EXPR_LEN = 200
+MAX_TERMS = 20
+MAX_DICE = 10_000
+MAX_SIDES = 10_000
+# Exploding dice re-roll at most this many times per die.
+MAX_EXPLODE = 20
+# Expressions per batch roll request (dice across the batch share MAX_DICE).
+MAX_BATCH = 100
+# Terms with more dice than this are summarized in `detail`.
+DETAIL_MAX_DICE = 50
+# Work budgets for exact distributions (see distribution()).
+DIST_MAX_SUPPORT = 20_000
+DIST_MAX_BITS = 4_000_000
+DIST_MAX_KEEP_WORK = 3_000_000
+
+
+class DiceError(ValueError):
+    pass
+
+
 @dataclass
 class Roll:
     total: int
     detail: str
 
+
+@dataclass(frozen=True)
+class DiceTerm:
+    sign: int
+    count: int
+    sides: int
+    # Number of dice kept and from which end ("h"/"l"); keep=None keeps all.
+    keep: str | None = None
+    keep_n: int = 0
+    explode: bool = False
+    # Re-roll (once) any die showing this value or lower; 0 disables.
+    reroll: int = 0
+
+
+@dataclass(frozen=True)
+class Plan:
+    terms: tuple[DiceTerm, ...]
+    constant: int
+    dice: int
+
+
+# Grammar: term (("+"|"-") term)*, where a term is an integer or
+# [N]d(M|%) followed by any of: kh[n] kl[n] k[n] dh[n] dl[n] ! r[n]
+_TERM_RE = re.compile(r"([+-]?)(?:(\d*)d(\d+|%)((?:kh|kl|dh|dl|k|r|!)\d*)*|(\d+))")
+_MOD_RE = re.compile(r"(kh|kl|dh|dl|k|r|!)(\d*)")
+_DICE_RE = re.compile(r"(\d*)d(\d+|%)(.*)")
+
+
+def _compile_dice(sign: int, spec: str) -> DiceTerm:
+    m = _DICE_RE.fullmatch(spec)
+    count = int(m.group(1) or 1)
+    sides = 100 if m.group(2) == "%" else int(m.group(2))
+    if count < 1 or sides < 1:
+        raise DiceError(f"invalid dice term '{spec}'")
+    if sides > MAX_SIDES:
+        raise DiceError(f"dice may have at most {MAX_SIDES} sides")
+    keep, keep_n, explode, reroll = None, 0, False, 0
+    for op, num in _MOD_RE.findall(m.group(3)):
+        n = int(num) if num else 1
+        if op in ("k", "kh", "kl", "dh", "dl"):
+            if keep is not None:
+                raise DiceError(f"only one keep/drop modifier allowed in '{spec}'")
+            if op in ("dh", "dl"):
+                # Dropping n from one end is keeping count-n from the other.
+                keep, n = ("l" if op == "dh" else "h"), count - n
+            else:
+                keep = "l" if op == "kl" else "h"
+            if n < 0 or n > count:
+                raise DiceError(f"cannot keep {n} of {count} dice in '{spec}'")
+            keep_n = n
+        elif op == "!":
+            if num or sides < 2:
+                raise DiceError(f"invalid exploding dice '{spec}'")
+            explode = True
+        elif op == "r":
+            if n >= sides:
+                raise DiceError(f"re-roll threshold must be below {sides} in '{spec}'")
+            reroll = n
+    return DiceTerm(sign, count, sides, keep, keep_n, explode, reroll)
+
+
+@lru_cache(maxsize=1024)
+def compile_expr(expr: str) -> Plan:
+    """Parse a dice expression into a cached Plan (raises DiceError)."""
+    src = expr.lower().replace(" ", "")
+    if not src:
+        raise DiceError("empty dice expression")
+    if len(src) > MAX_EXPR_LEN:
+        raise DiceError(f"dice expression longer than {MAX_EXPR_LEN} characters")
+    terms = []
+    constant = 0
+    pos = 0
+    while pos < len(src):
+        m = _TERM_RE.match(src, pos)
+        if not m or m.end() == pos or (pos and not m.group(1)):
+            raise DiceError(f"invalid dice expression '{expr}'")
+        sign = -1 if m.group(1) == "-" else 1
+        if m.group(5) is not None:
+            constant += sign * int(m.group(5))
+        else:
+            terms.append(_compile_dice(sign, m.group(0).lstrip("+-")))
+        pos = m.end()
+    if len(terms) > MAX_TERMS:
+        raise DiceError(f"at most {MAX_TERMS} dice terms allowed")
+    dice = sum(t.count for t in terms)
+    if dice > MAX_DICE:
+        raise DiceError(f"at most {MAX_DICE} dice per roll")
+    return Plan(tuple(terms), constant, dice)
+
+
+def _roll_many(n: int, sides: int, rng) -> list[int]:
+    # One C-level call for the whole pool instead of n randint() calls.
+    return rng.choices(range(1, sides + 1), k=n)
+
+
+def _roll_term(t: DiceTerm, rng) -> tuple[list[int], set[int]]:
+    """Roll one term; returns per-die values and the indexes that were kept."""
+    values = _roll_many(t.count, t.sides, rng)
+    if t.reroll:
+        low = [i for i, v in enumerate(values) if v <= t.reroll]
+        for i, v in zip(low, _roll_many(len(low), t.sides, rng)):
+            values[i] = v
+    if t.explode:
+        # Each round re-rolls every die whose last roll hit the maximum.
+        live = [i for i, v in enumerate(values) if v == t.sides]
+        for _ in range(MAX_EXPLODE):
+            if not live:
+                break
+            extra = _roll_many(len(live), t.sides, rng)
+            for i, v in zip(live, extra):
+                values[i] += v
+            live = [i for i, v in zip(live, extra) if v == t.sides]
+    if t.keep is None:
+        return values, set(range(t.count))
+    order = sorted(range(t.count), key=values.__getitem__, reverse=(t.keep == "h"))
+    return values, set(order[:t.keep_n])
+
+
+def _term_detail(t: DiceTerm, values: list[int], kept: set[int], subtotal: int) -> str:
+    if t.count > DETAIL_MAX_DICE:
+        return f"[{t.count}d{t.sides}={subtotal}]"
+    shown = "+".join(str(v) for i, v in enumerate(values) if i in kept)
+    dropped = [str(v) for i, v in enumerate(values) if i not in kept]
+    if dropped:
+        shown = f"{shown or 0} (dropped {','.join(dropped)})"
+    return shown
+
+
+def execute(plan: Plan, rng=None) -> Roll:
+    rng = rng or random
+    total = plan.constant
+    parts = []
+    for t in plan.terms:
+        values, kept = _roll_term(t, rng)
+        subtotal = sum(v for i, v in enumerate(values) if i in kept) if t.keep else sum(values)
+        total += t.sign * subtotal
+        detail = _term_detail(t, values, kept, subtotal)
+        parts.append(detail if (t.sign > 0 and not parts) else f"{'-' if t.sign < 0 else '+'}{detail}")
+    if plan.constant or not parts:
+        parts.append(f"{plan.constant:+d}" if parts else str(plan.constant))
+    return Roll(total, "".join(parts))
+
+
 def roll(expr: str) -> Roll:
-    expr = expr.lower().replace(" ", "")
-    if "+" in expr:
-        dice, mod = expr.split("+", 1)
-        mod = int(mod)
-    elif "-" in expr:
-        dice, mod = expr.split("-", 1)
-        mod = -int(mod)
+    return execute(compile_expr(expr))
+
+
+# --- Exact distributions ---
+#
+# A distribution is a polynomial with integer coefficients: (lo, coeffs) means
+# value lo+i occurs in coeffs[i] of sum(coeffs) equally likely outcomes. Adding
+# independent terms multiplies polynomials, which we do exactly with big-int
+# (Kronecker) multiplication. Per-die polynomials, powers and whole-plan
+# results are memoized, so repeated expressions are served from cache.
+
+Poly = tuple[int, tuple[int, ...]]
+
+
+def _trim(lo: int, coeffs: list[int]) -> Poly:
+    start = 0
+    while start < len(coeffs) - 1 and not coeffs[start]:
+        start += 1
+    end = len(coeffs)
+    while end > start + 1 and not coeffs[end - 1]:
+        end -= 1
+    return lo + start, tuple(coeffs[start:end])
+
+
+def _mul(a: Poly, b: Poly) -> Poly:
+    (alo, ac), (blo, bc) = a, b
+    n = len(ac) + len(bc) - 1
+    if len(ac) * len(bc) <= 4096:
+        out = [0] * n
+        for i, x in enumerate(ac):
+            if x:
+                for j, y in enumerate(bc):
+                    out[i + j] += x * y
+        return _trim(alo + blo, out)
+    # Pack each coefficient into a fixed-width slot wide enough that no
+    # product coefficient can carry into its neighbour, multiply, unpack.
+    width = ((sum(ac) * sum(bc)).bit_length() + 8) // 8
+    pa = int.from_bytes(b"".join(c.to_bytes(width, "little") for c in ac), "little")
+    pb = int.from_bytes(b"".join(c.to_bytes(width, "little") for c in bc), "little")
+    raw = (pa * pb).to_bytes(width * n, "little")
+    out = [int.from_bytes(raw[i:i + width], "little") for i in range(0, width * n, width)]
+    return _trim(alo + blo, out)
+
+
+def _negate(p: Poly) -> Poly:
+    lo, coeffs = p
+    return -(lo + len(coeffs) - 1), coeffs[::-1]
+
+
+@lru_cache(maxsize=256)
+def _explode_chain(sides: int, depth: int) -> Poly:
+    # A fresh roll that keeps exploding on `sides` for up to `depth` rolls,
+    # matching _roll_term's MAX_EXPLODE cut-off. Denominator sides**depth.
+    if depth == 1:
+        return 1, (1,) * sides
+    rest_lo, rest = _explode_chain(sides, depth - 1)
+    scale = sides ** (depth - 1)
+    coeffs = [scale] * (sides - 1) + [0] * (rest_lo + len(rest))
+    for i, w in enumerate(rest):
+        coeffs[sides + rest_lo + i - 1] += w
+    return 1, tuple(coeffs)
+
+
+@lru_cache(maxsize=256)
+def _die(sides: int, explode: bool, reroll: int) -> Poly:
+    if reroll:
+        # Re-roll once: faces <= reroll only come from the second roll.
+        first = [reroll + (sides if v > reroll else 0) for v in range(1, sides + 1)]
     else:
-        dice, mod = expr, 0
-    n, die = dice.split("d")
-    n = int(n or 1)
-    sides = int(die)
-    rolls = [random.randint(1, sides) for _ in range(n)]
-    total = sum(rolls) + mod
-    detail = f"{'+'.join(map(str, rolls))}{'+' if mod>=0 and mod!=0 else ''}{mod if mod else ''}"
-    return Roll(total, detail)
+        first = [1] * sides
+    if not explode:
+        return 1, tuple(first)
+    chain_lo, chain = _explode_chain(sides, MAX_EXPLODE)
+    scale = sum(chain)
+    coeffs = [w * scale for w in first[:-1]] + [0] * (chain_lo + len(chain))
+    for i, w in enumerate(chain):
+        coeffs[sides + chain_lo + i - 1] += first[-1] * w
+    return _trim(1, coeffs)
+
+
+@lru_cache(maxsize=512)
+def _die_pow(sides: int, explode: bool, reroll: int, n: int) -> Poly:
+    if n == 1:
+        return _die(sides, explode, reroll)
+    half = _die_pow(sides, explode, reroll, n // 2)
+    sq = _mul(half, half)
+    return _mul(sq, _die(sides, explode, reroll)) if n % 2 else sq
+
+
+def _keep_poly(die: Poly, count: int, keep: str, n: int) -> Poly:
+    # Assign dice to faces from the kept end inward; the first n dice placed
+    # are the kept ones. State: dice placed -> {kept sum: ways}.
+    lo, weights = die
+    faces = [(lo + i, w) for i, w in enumerate(weights) if w]
+    faces.sort(reverse=(keep == "h"))
+    states: dict[int, dict[int, int]] = {0: {0: 1}}
+    for v, w in faces:
+        powers = [1]
+        for _ in range(count):
+            powers.append(powers[-1] * w)
+        nxt: dict[int, dict[int, int]] = {}
+        for used, sums in states.items():
+            left = count - used
+            for c in range(left + 1):
+                factor = math.comb(left, c) * powers[c]
+                add = (min(used + c, n) - min(used, n)) * v
+                tgt = nxt.setdefault(used + c, {})
+                for s, ways in sums.items():
+                    tgt[s + add] = tgt.get(s + add, 0) + ways * factor
+        states = nxt
+    final = states.get(count, {0: 1})
+    lo_sum = min(final)
+    coeffs = [0] * (max(final) - lo_sum + 1)
+    for s, ways in final.items():
+        coeffs[s - lo_sum] = ways
+    return _trim(lo_sum, coeffs)
+
+
+def _term_poly(t: DiceTerm) -> Poly:
+    if t.keep is None or t.keep_n == t.count:
+        p = _die_pow(t.sides, t.explode, t.reroll, t.count)
+    elif t.keep_n == 0:
+        p = (0, (1,))
+    else:
+        p = _keep_term_poly(t.count, t.sides, t.keep, t.keep_n, t.explode, t.reroll)
+    return _negate(p) if t.sign < 0 else p
+
+
+@lru_cache(maxsize=256)
+def _keep_term_poly(count, sides, keep, keep_n, explode, reroll) -> Poly:
+    return _keep_poly(_die(sides, explode, reroll), count, keep, keep_n)
+
+
+def _die_shape(sides: int, explode: bool, reroll: int) -> tuple[int, int, int]:
+    """(lowest face, highest face, bit length of the outcome count) of
+    _die(sides, explode, reroll), worked out without building it."""
+    outcomes = sides * sides if reroll else sides
+    if not explode:
+        return 1, sides, outcomes.bit_length()
+    return 1, sides * (MAX_EXPLODE + 1), (outcomes * sides ** MAX_EXPLODE).bit_length()
+
+
+def _check_budget(plan: Plan):
+    # Runs before any polynomial is built: an exploding d10000 alone takes
+    # about half a second to build, and the caches can't hold every size.
+    support = 1
+    bits = 1
+    for t in plan.terms:
+        lo, face_max, die_bits = _die_shape(t.sides, t.explode, t.reroll)
+        bits += t.count * die_bits
+        if t.keep is None or t.keep_n == t.count:
+            support += t.count * (face_max - lo)
+        else:
+            support += t.keep_n * (face_max - lo)
+            work = (face_max - lo + 1) * t.count * t.count * (t.keep_n * face_max + 1)
+            if work > DIST_MAX_KEEP_WORK:
+                raise DiceError(f"keep/drop term {t.count}d{t.sides} too large for an exact distribution")
+    if support > DIST_MAX_SUPPORT or support * bits > DIST_MAX_BITS:
+        raise DiceError("expression too large for an exact distribution")
+
+
+@lru_cache(maxsize=512)
+def plan_poly(plan: Plan) -> Poly:
+    _check_budget(plan)
+    p: Poly = (plan.constant, (1,))
+    for t in plan.terms:
+        p = _mul(p, _term_poly(t))
+    return p
+
+
+def _value_at(lo: int, coeffs: tuple[int, ...], total: int, pct: int) -> int:
+    # Smallest value whose cumulative probability reaches pct percent.
+    cum = 0
+    for i, c in enumerate(coeffs):
+        cum += c
+        if cum * 100 >= total * pct:
+            return lo + i
+    return lo + len(coeffs) - 1
+
+
+@lru_cache(maxsize=256)
+def _summary(plan: Plan) -> dict:
+    lo, coeffs = plan_poly(plan)
+    total = sum(coeffs)
+    s1 = sum((lo + i) * c for i, c in enumerate(coeffs))
+    s2 = sum((lo + i) * (lo + i) * c for i, c in enumerate(coeffs))
+    variance = (s2 * total - s1 * s1) / (total * total)
+    return {
+        "min": lo,
+        "max": lo + len(coeffs) - 1,
+        "mean": s1 / total,
+        "variance": variance,
+        "stddev": math.sqrt(variance),
+        "percentiles": {str(p): _value_at(lo, coeffs, total, p) for p in (5, 10, 25, 50, 75, 90, 95)},
+        "pmf": [[lo + i, c / total] for i, c in enumerate(coeffs) if c],
+    }
+
+
+def distribution(expr: str, at_least=()) -> dict:
+    """Exact PMF and summary statistics for a dice expression."""
+    plan = compile_expr(expr)
+    out = {"expr": expr, **_summary(plan)}
+    if at_least:
+        lo, coeffs = plan_poly(plan)
+        total = sum(coeffs)
+        out["at_least"] = {
+            str(t): sum(coeffs[max(t - lo, 0):]) / total for t in at_least
+        }
+    return out
+
 
 @bp.post("/api/campaigns/<cid>/roll")
 def do_roll(cid):
     claims = require_user()
+    check_rate_limit("roll", user=claims.get("sub"), campaign=cid)
     data = request.get_json(force=True) if request.data else {}
     expr = data.get("expr", "1d20")
-    r = roll(expr)
-    ably = AblyRest(settings.ABLY_API_KEY)
-    channel = ably.channels.get(f"campaign:{cid}")
-    channel.publish("dice", {
+    try:
+        r = roll(str(expr))
+    except DiceError as e:
+        abort(400, str(e))
+    # Queued; the background publisher sends it so the roll returns immediately.
+    publisher.publish(f"campaign:{cid}", "dice", roll_event(claims, expr, r))
+    return jsonify({"ok": True, "total": r.total, "detail": r.detail})
+
+
+def roll_event(claims: dict, expr, r: Roll) -> dict:
+    """Ably message body announcing a single roll."""
+    return {
         "user": claims.get("sub"),
         "expr": expr,
         "result": f"{r.total} ({r.detail})"
+    }
+
+
+@bp.post("/api/campaigns/<cid>/rolls")
+def do_batch_roll(cid):
+    """Roll many labelled expressions at once (initiative, area spells).
+
+    Body: {"rolls": [{"label": "Goblin 1", "expr": "1d20+2"}, ...]}. All
+    results go out in one response and one Ably message.
+    """
+    claims = require_user()
+    # One Ably message per batch, so a batch costs the same as a single roll.
+    check_rate_limit("roll", user=claims.get("sub"), campaign=cid)
+    data = request.get_json(force=True) if request.data else {}
+    items = data.get("rolls")
+    if not isinstance(items, list) or not items:
+        abort(400, "rolls must be a non-empty list")
+    if len(items) > MAX_BATCH:
+        abort(400, f"at most {MAX_BATCH} rolls per batch")
+
+    plans = []
+    dice_count = 0
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"expr": item}
+        if not isinstance(item, dict):
+            abort(400, f"rolls[{i}] must be an object or expression string")
+        expr = str(item.get("expr", "1d20"))
+        label = item.get("label")
+        try:
+            plan = compile_expr(expr)
+        except DiceError as e:
+            abort(400, f"rolls[{i}]: {e}")
+        dice_count += plan.dice
+        if dice_count > MAX_DICE:
+            abort(400, f"at most {MAX_DICE} dice per batch")
+        plans.append((label, expr, plan))
+
+    results = []
+    for label, expr, plan in plans:
+        r = execute(plan)
+        results.append({"label": label, "expr": expr, "total": r.total, "detail": r.detail})
+
+    publisher.publish(f"campaign:{cid}", "dice_batch", {
+        "user": claims.get("sub"),
+        "rolls": results,
     })
-    return jsonify({"ok": True, "total": r.total, "detail": r.detail})
+    return jsonify({"ok": True, "results": results})
+
+
+@bp.get("/api/dice/distribution")
+def dice_distribution():
+    require_user()
+    expr = request.args.get("expr", "1d20")
+    try:
+        at_least = [int(v) for v in request.args.getlist("at_least")]
+    except ValueError:
+        abort(400, "at_least must be an integer")
+    try:
+        out = distribution(expr, at_least[:20])
+    except DiceError as e:
+        abort(400, str(e))
+    return jsonify({"ok": True, **out})
@@ -0,0 +1,123 @@
+import base64
+import json
+import zlib
+from datetime import date, datetime
+from flask import Blueprint, Response, request, abort
+from sqlalchemy import select, tuple_
+from .authn import require_admin
+from .campaigns import campaigns_table, campaign_members_table, user_settings_table
+from .config import settings
+from .db import get_engine
+
+bp = Blueprint("export", __name__)
+
+# (record type, table, key columns) in export order. Each table is walked in
+# key order so a dump can resume exactly where the previous response stopped.
+EXPORT_TABLES = [
+    ("campaign", campaigns_table, [campaigns_table.c.id]),
+    ("member", campaign_members_table, [campaign_members_table.c.campaign_id, campaign_members_table.c.user_id]),
+    ("user_settings", user_settings_table, [user_settings_table.c.user_id]),
+]
+
+# Flush to the client roughly every 64KB of NDJSON.
+CHUNK_BYTES = 64 * 1024
+
+
+def _default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    return str(o)
+
+
+def _encode_cursor(table_index: int, key) -> str:
+    raw = json.dumps([table_index, key], default=_default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(raw: str):
+    data = json.loads(base64.urlsafe_b64decode(raw.encode() + b"=" * (-len(raw) % 4)))
+    table_index, key = data
+    if not (0 <= int(table_index) < len(EXPORT_TABLES)) or not isinstance(key, list):
+        raise ValueError("bad cursor")
+    if not key:
+        # Resume at the start of this table.
+        return int(table_index), None
+    if len(key) != len(EXPORT_TABLES[int(table_index)][2]):
+        raise ValueError("bad cursor")
+    return int(table_index), key
+
+
+def _records(start_table: int, start_key, max_rows: int):
+    """Yield NDJSON lines, ending with either a resume cursor or an end marker."""
+    engine = get_engine()
+    emitted = 0
+    for ti in range(start_table, len(EXPORT_TABLES)):
+        kind, table, keys = EXPORT_TABLES[ti]
+        q = select(table).order_by(*keys)
+        if ti == start_table and start_key is not None:
+            q = q.where(tuple_(*keys) > tuple_(*start_key))
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=settings.EXPORT_BATCH).execute(q)
+            last_key = None
+            for row in result:
+                if emitted >= max_rows:
+                    result.close()
+                    yield json.dumps({"type": "next", "cursor": _encode_cursor(ti, last_key or [])}) + "\n"
+                    return
+                m = row._mapping
+                yield json.dumps({"type": kind, **m}, default=_default) + "\n"
+                last_key = [m[c.name] for c in keys]
+                emitted += 1
+    yield json.dumps({"type": "end", "rows": emitted}) + "\n"
+
+
+def _chunked(lines, compress: bool):
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf = []
+    size = 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            data = "".join(buf).encode()
+            buf, size = [], 0
+            if gz:
+                data = gz.compress(data)
+            if data:
+                yield data
+    data = "".join(buf).encode()
+    if gz:
+        data = gz.compress(data) + gz.flush()
+    if data:
+        yield data
+
+
+@bp.get("/api/export")
+def export_ndjson():
+    """Stream campaigns, memberships and user settings as NDJSON (admin only).
+
+    Each line is a JSON object with a "type" of campaign/member/user_settings.
+    A response stops after EXPORT_MAX_ROWS rows (or ?limit=) with a
+    {"type": "next", "cursor": ...} line; pass it back as ?cursor= to continue.
+    The last response ends with {"type": "end"}. ?gzip=1 compresses the stream.
+    """
+    require_admin()
+    try:
+        max_rows = min(int(request.args.get("limit", settings.EXPORT_MAX_ROWS)), settings.EXPORT_MAX_ROWS)
+    except ValueError:
+        abort(400, "limit must be an integer")
+    if max_rows < 1:
+        abort(400, "limit must be positive")
+    start_table, start_key = 0, None
+    if request.args.get("cursor"):
+        try:
+            start_table, start_key = _decode_cursor(request.args["cursor"])
+        except Exception:
+            abort(400, "invalid cursor")
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+
+    resp = Response(_chunked(_records(start_table, start_key, max_rows), compress), mimetype="application/x-ndjson")
+    if compress:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
@@ -0,0 +1,157 @@
+"""In-process TTL cache of campaign membership and role.
+
+Ably token refreshes ask "is this user in campaign X, and as what?" far more
+often than membership changes, so answers are cached per (campaign_id,
+user_id). The same cache also keeps each user's full campaign -> role map,
+which the Ably token endpoint turns into a single multi-channel capability.
+
+join/leave call invalidate(), which drops the worker's own entries and
+touches a per-user marker file in MEMBERSHIP_MARKS_DIR. Every worker on the
+instance checks that marker on a hit and ignores entries filled before it,
+so a join on one worker shows up in the next token minted by another.
+
+The cache is shared by all threads of a worker. A reader that misses takes
+generation() before querying and passes it to put()/put_user(); if a join
+or leave invalidated anything in between, in this worker or (per the
+marker) another, the possibly stale rows are not used.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from .config import settings
+from .replicas import RecentWriters
+
+DEFAULT_ROLE = "player"
+
+# Returned by MembershipCache.get when nothing (fresh) is cached.
+MISS = object()
+
+
+class MembershipCache:
+    def __init__(self, ttl: float, negative_ttl: float, maxsize: int, user_ttl: float, marks_dir: str | None = None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.user_ttl = user_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (campaign_id, user_id) -> (role or None for non-members, expires_at, filled_at)
+        self._entries: dict[tuple[str, str], tuple[str | None, float, float]] = {}
+        # user_id -> ({campaign_id: role}, expires_at, filled_at)
+        self._users: dict[str, tuple[dict[str, str], float, float]] = {}
+        # Bumped by every invalidation (see generation()).
+        self._generation = 0
+        # Cross-worker change markers; a marker can go once every entry
+        # filled before it has expired anyway.
+        self._marks = RecentWriters(marks_dir, keep=max(ttl, user_ttl)) if marks_dir else None
+
+    def generation(self) -> tuple[int, float]:
+        """(invalidation count, wall-clock time) for a reader about to query."""
+        return self._generation, time.time()
+
+    def _changed_since(self, user_id: str, filled_at: float) -> bool:
+        if self._marks is None:
+            return False
+        changed = self._marks.last_write(user_id)
+        return changed is not None and changed >= filled_at
+
+    def _fill(self, generation: tuple[int, float] | None) -> float | None:
+        # Caller holds _lock. The fill time is when the reader started its
+        # query, or None if an invalidation has made its rows stale.
+        if generation is None:
+            return time.time()
+        count, started = generation
+        return started if count == self._generation else None
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, campaign_id: str, user_id: str):
+        """Return the cached role, None for a cached non-member, or MISS."""
+        entry = self._entries.get((campaign_id, user_id))
+        if entry is None or entry[1] <= time.monotonic() or self._changed_since(user_id, entry[2]):
+            self._count(False)
+            return MISS
+        self._count(True)
+        return entry[0]
+
+    def put(self, campaign_id: str, user_id: str, role: str | None, generation: tuple[int, float] | None = None):
+        ttl = self.ttl if role is not None else self.negative_ttl
+        now = time.monotonic()
+        with self._lock:
+            filled_at = self._fill(generation)
+            if filled_at is None:
+                return
+            if len(self._entries) >= self.maxsize:
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+                if len(self._entries) >= self.maxsize:
+                    self._entries.clear()
+            self._entries[(campaign_id, user_id)] = (role, now + ttl, filled_at)
+
+    def get_user(self, user_id: str):
+        """Return the cached {campaign_id: role} map for user_id, or MISS."""
+        entry = self._users.get(user_id)
+        if entry is None or entry[1] <= time.monotonic() or self._changed_since(user_id, entry[2]):
+            self._count(False)
+            return MISS
+        self._count(True)
+        return entry[0]
+
+    def put_user(self, user_id: str, roles: dict[str, str], generation: tuple[int, float] | None = None):
+        now = time.monotonic()
+        with self._lock:
+            filled_at = self._fill(generation)
+            if filled_at is None:
+                return
+            if len(self._users) >= self.maxsize:
+                self._users = {k: v for k, v in self._users.items() if v[1] > now}
+                if len(self._users) >= self.maxsize:
+                    self._users.clear()
+            self._users[user_id] = (roles, now + self.user_ttl, filled_at)
+
+    def invalidate(self, campaign_id: str, user_id: str):
+        """Forget user_id's membership here and mark it changed for other workers."""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop((campaign_id, user_id), None)
+            self._users.pop(user_id, None)
+        if self._marks is not None:
+            try:
+                self._marks.note(user_id)
+            except OSError:
+                # Other workers then catch up when their entries expire.
+                pass
+
+    def invalidate_campaign(self, campaign_id: str):
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if k[0] == campaign_id]:
+                del self._entries[key]
+            for uid in [u for u, (roles, _, _) in self._users.items() if campaign_id in roles]:
+                del self._users[uid]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._users.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "users": len(self._users), "hits": self.hits, "misses": self.misses}
+
+
+membership_cache = MembershipCache(
+    ttl=settings.MEMBERSHIP_CACHE_TTL,
+    negative_ttl=settings.MEMBERSHIP_NEGATIVE_TTL,
+    maxsize=settings.MEMBERSHIP_CACHE_SIZE,
+    user_ttl=settings.ABLY_CAPABILITY_TTL,
+    marks_dir=settings.MEMBERSHIP_MARKS_DIR or os.path.join(tempfile.gettempdir(), "npcchatter-membership"),
+)
+
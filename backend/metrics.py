@@ -0,0 +1,314 @@
+"""Request and dependency metrics, aggregated across gunicorn workers.
+
+Each worker keeps its series in memory (a dict update per observation) and a
+daemon thread snapshots them to `<METRICS_DIR>/<pid>-<start>.json` every
+METRICS_FLUSH_SECONDS. `/api/_metrics` merges the live series of the worker
+that serves it with every other worker's latest file and renders Prometheus
+text format.
+
+Counters and histograms from exited workers are kept so totals never go
+backwards: a scrape folds an exited worker's file into `retired.json` and
+deletes it. The start time in the name keeps a worker that reuses a pid from
+overwriting its predecessor's file. Gauges only count workers that are still
+alive. As with any multiprocess store, clear METRICS_DIR when the whole
+service restarts.
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+from .config import settings
+
+# Seconds; tuned for a web app whose requests are mostly 5-500ms.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by route, method and status."),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled."),
+    "dependency_duration_seconds": ("histogram", "Time spent in DB, JWT, JWKS and Ably calls."),
+    "ratelimit_rejections_total": ("counter", "Requests refused with 429 by a rate limit, by limit and scope."),
+    "ratelimit_store_errors_total": ("counter", "Rate-limit checks let through because the shared store failed."),
+    "admission_rejections_total": ("counter", "Requests shed with 503 by the in-flight cap, by reason."),
+    "admission_queued": ("gauge", "Requests waiting for an in-flight slot."),
+    "admission_wait_seconds": ("histogram", "Time requests waited for an in-flight slot."),
+}
+
+
+class Registry:
+    def __init__(self, directory: str, flush_interval: float):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    RETIRED = "retired.json"
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._name = f"{self._pid}-{time.time_ns():x}.json"
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._hist: dict[tuple, list] = {}
+        # (name, labels) -> value
+        self._gauges: dict[tuple, float] = {}
+        self._counters: dict[tuple, float] = {}
+        self._dirty = False
+        self._thread = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked worker: start from empty series under its own pid file.
+            self._reset()
+        if self._thread is None and self.flush_interval > 0:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+                    self._thread.start()
+
+    def observe(self, name: str, labels: tuple, value: float):
+        self._check_pid()
+        key = (name, labels)
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+            self._dirty = True
+
+    def inc(self, name: str, labels: tuple = (), amount: float = 1):
+        self._check_pid()
+        key = (name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+            self._dirty = True
+
+    def count(self, name: str, labels: tuple = (), amount: float = 1):
+        """Add to a counter; unlike gauges, counters of exited workers are kept."""
+        self._check_pid()
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._dirty = True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "hist": [[n, list(lbl), list(v)] for (n, lbl), v in self._hist.items()],
+                "gauges": [[n, list(lbl), v] for (n, lbl), v in self._gauges.items()],
+                "counters": [[n, list(lbl), v] for (n, lbl), v in self._counters.items()],
+            }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write(self, name: str, snap: dict):
+        tmp = self._path(name) + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(snap, separators=(",", ":")))
+        os.replace(tmp, self._path(name))
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._dirty = False
+        self._write(self._name, self.snapshot())
+
+    def _retire(self, name: str):
+        """Fold an exited worker's counters and histograms into RETIRED."""
+        with open(self._path("retired.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another worker's scrape may have folded it first.
+            snap = _load(self._path(name))
+            if snap is None:
+                return
+            retired = _load(self._path(self.RETIRED)) or {"hist": [], "counters": []}
+            hist, _, counters = _merge([], [retired, snap])
+            self._write(self.RETIRED, {
+                "hist": [[n, list(lbl), v] for (n, lbl), v in hist.items()],
+                "gauges": [],
+                "counters": [[n, list(lbl), v] for (n, lbl), v in counters.items()],
+            })
+            os.remove(self._path(name))
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+    def collect(self) -> tuple[dict, dict]:
+        """Merge this worker's live series with the other workers' files.
+
+        Files of exited workers are folded into RETIRED on the way. Returns
+        (histograms, counters and gauges).
+        """
+        self._check_pid()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        live = [self.snapshot()]
+        retired = []
+        for fn in names:
+            if not fn.endswith(".json") or fn in (self._name, self.RETIRED):
+                continue
+            try:
+                pid = int(fn[:-5].split("-")[0])
+            except ValueError:
+                continue
+            # Our own pid under another name is a predecessor that exited.
+            if pid != self._pid and _alive(pid):
+                snap = _load(self._path(fn))
+                if snap is not None:
+                    live.append(snap)
+                continue
+            try:
+                self._retire(fn)
+            except OSError:
+                # Not folded this time; still count it.
+                snap = _load(self._path(fn))
+                if snap is not None:
+                    retired.append(snap)
+        snap = _load(self._path(self.RETIRED))
+        if snap is not None:
+            retired.append(snap)
+        hist, gauges, counters = _merge(live, retired)
+        return hist, {**counters, **gauges}
+
+    def render(self) -> str:
+        hist, values = self.collect()
+        out = []
+        by_name: dict[str, list] = {}
+        for (name, labels), v in hist.items():
+            by_name.setdefault(name, []).append((labels, v))
+        for (name, labels), v in values.items():
+            by_name.setdefault(name, []).append((labels, v))
+        for name in sorted(by_name):
+            kind, text = HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, v in sorted(by_name[name], key=lambda x: x[0]):
+                if kind != "histogram":
+                    out.append(f"{name}{_labels(labels)} {_num(v)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, v):
+                    cumulative += count
+                    out.append(f"{name}_bucket{_labels(labels + (('le', _num(bound)),))} {cumulative}")
+                out.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {v[-1]}")
+                out.append(f"{name}_sum{_labels(labels)} {_num(v[-2])}")
+                out.append(f"{name}_count{_labels(labels)} {v[-1]}")
+        return "\n".join(out) + "\n"
+
+
+def _load(path: str) -> dict | None:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(live: list, retired: list = ()) -> tuple[dict, dict, dict]:
+    """Sum snapshots into (histograms, gauges, counters); gauges from `live` only."""
+    hist: dict[tuple, list] = {}
+    gauges: dict[tuple, float] = {}
+    counters: dict[tuple, float] = {}
+    for snap in [*live, *retired]:
+        for name, labels, values in snap["hist"]:
+            key = (name, tuple(map(tuple, labels)))
+            acc = hist.setdefault(key, [0] * len(values))
+            for i, v in enumerate(values):
+                acc[i] += v
+        for name, labels, value in snap.get("counters", ()):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+    for snap in live:
+        for name, labels, value in snap["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+    return hist, gauges, counters
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+registry = Registry(
+    directory=settings.METRICS_DIR or os.path.join(tempfile.gettempdir(), "npcchatter-metrics"),
+    flush_interval=settings.METRICS_FLUSH_SECONDS,
+)
+
+
+def observe_dependency(dep: str, seconds: float):
+    registry.observe("dependency_duration_seconds", (("dep", dep),), seconds)
+
+
+@contextmanager
+def timer(dep: str):
+    """Time a block as a dependency call: `with metrics.timer("jwt"): ...`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_dependency(dep, time.perf_counter() - start)
+
+
+def init_app(app):
+    """Time every request and serve the merged metrics on /api/_metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_in_flight = True
+        registry.inc("http_requests_in_flight")
+
+    @app.after_request
+    def _record(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            labels = (("route", rule), ("method", request.method), ("status", str(response.status_code)))
+            registry.observe("http_request_duration_seconds", labels, time.perf_counter() - start)
+        return response
+
+    @app.teardown_request
+    def _done(exc):
+        if g.pop("_metrics_in_flight", False):
+            registry.inc("http_requests_in_flight", amount=-1)
+
+    @app.get("/api/_metrics")
+    def _metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
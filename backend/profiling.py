@@ -0,0 +1,181 @@
+"""Opt-in per-request profiling written to a rotating directory.
+
+A request is profiled when an admin sends `X-Profile: cprofile` (or
+`sample`), or when it is picked by PROFILE_SAMPLE_RATE. Everything else
+skips the hook after a header lookup.
+
+- cprofile: deterministic cProfile, saved as a .pstats file
+  (`python -m pstats file` / snakeviz).
+- sample: a background thread snapshots the request thread's stack every
+  PROFILE_SAMPLE_INTERVAL seconds and writes collapsed stacks (.collapsed,
+  one "frame;frame;frame count" per line, ready for flamegraph.pl/speedscope).
+
+Only the newest PROFILE_MAX_FILES captures are kept. Admins list them on
+/api/_profiles and download one from /api/_profiles/<name>.
+"""
+import cProfile
+import os
+import random
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask import abort, g, jsonify, request, send_from_directory
+from werkzeug.exceptions import HTTPException
+
+from .authn import require_admin
+from .config import settings
+
+MODES = ("cprofile", "sample")
+HEADER = "X-Profile"
+
+
+def profile_dir() -> str:
+    return settings.PROFILE_DIR or os.path.join(tempfile.gettempdir(), "npcchatter-profiles")
+
+
+class StackSampler:
+    """Collect collapsed stacks of one thread until stopped."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _requested_mode() -> str | None:
+    mode = request.headers.get(HEADER)
+    if mode:
+        mode = mode.strip().lower()
+        if mode in ("1", "true", "yes"):
+            mode = settings.PROFILE_MODE
+        if mode not in MODES:
+            return None
+        try:
+            require_admin()
+        except HTTPException:
+            # Non-admins cannot turn profiling on; the request runs normally.
+            return None
+        return mode
+    if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return settings.PROFILE_MODE
+    return None
+
+
+def _filename(ext: str, elapsed: float, status: int) -> str:
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", rule).strip("_") or "root"
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    # Random suffix: two captures of one route can land in the same second.
+    return f"{stamp}-{os.getpid()}-{request.method}-{slug}-{status}-{int(elapsed * 1000)}ms-{secrets.token_hex(3)}.{ext}"
+
+
+def _rotate(directory: str):
+    files = sorted(
+        (e for e in os.scandir(directory) if e.is_file() and e.name.endswith((".pstats", ".collapsed"))),
+        key=lambda e: e.stat().st_mtime,
+    )
+    for e in files[:max(len(files) - settings.PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(e.path)
+        except OSError:
+            pass
+
+
+def init_app(app):
+    """Register the profiling hooks and the admin listing endpoints."""
+
+    @app.before_request
+    def _start_profile():
+        mode = _requested_mode()
+        if mode is None:
+            return None
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (debugger, coverage) owns the hook.
+                return None
+        else:
+            profiler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+            profiler.start()
+        g._profile = (mode, profiler, time.perf_counter())
+        return None
+
+    @app.after_request
+    def _stop_profile(response):
+        entry = g.pop("_profile", None)
+        if entry is None:
+            return response
+        mode, profiler, start = entry
+        elapsed = time.perf_counter() - start
+        if mode == "cprofile":
+            profiler.disable()
+        else:
+            profiler.stop()
+        directory = profile_dir()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            name = _filename("pstats" if mode == "cprofile" else "collapsed", elapsed, response.status_code)
+            path = os.path.join(directory, name)
+            if mode == "cprofile":
+                profiler.dump_stats(path)
+            else:
+                profiler.dump(path)
+            _rotate(directory)
+            response.headers["X-Profile-File"] = name
+        except OSError as e:
+            sys.stdout.write(f"Profile capture failed: {e}\n")
+        return response
+
+    @app.get("/api/_profiles")
+    def _list_profiles():
+        require_admin()
+        directory = profile_dir()
+        try:
+            entries = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith((".pstats", ".collapsed"))]
+        except FileNotFoundError:
+            entries = []
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        return jsonify({"ok": True, "dir": directory, "profiles": [
+            {"name": e.name, "bytes": e.stat().st_size, "mtime": int(e.stat().st_mtime)} for e in entries
+        ]})
+
+    @app.get("/api/_profiles/<name>")
+    def _get_profile(name):
+        require_admin()
+        if not name.endswith((".pstats", ".collapsed")):
+            abort(404)
+        # send_from_directory rejects names that escape the directory.
+        return send_from_directory(profile_dir(), name, as_attachment=True)
@@ -0,0 +1,250 @@
+"""Long-lived Ably publisher with a bounded in-process queue.
+
+Handlers call `publisher.publish(channel, name, data)`, which only enqueues
+the message. A daemon thread per worker drains the queue, groups messages by
+channel into a single REST publish each, and retries failures with
+exponential backoff. The underlying `AblyRestSync` client keeps its HTTP
+connection alive between flushes.
+
+The drain thread is a daemon, so on a graceful worker exit (gunicorn's
+SIGTERM on deploy/restart) an atexit hook waits up to
+ABLY_EXIT_FLUSH_SECONDS for messages that are still queued.
+"""
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+
+from .config import settings
+from . import metrics
+
+
+def _client_options() -> dict:
+    opts = {}
+    if settings.ABLY_REST_HOST:
+        # Ably refuses Basic auth without TLS, so plain-HTTP hosts use tokens.
+        opts = {"rest_host": settings.ABLY_REST_HOST, "tls": settings.ABLY_TLS,
+                "use_token_auth": not settings.ABLY_TLS}
+        if settings.ABLY_REST_PORT:
+            opts["tls_port" if settings.ABLY_TLS else "port"] = settings.ABLY_REST_PORT
+    return opts
+
+
+class Publisher:
+    def __init__(self, maxsize: int, batch_size: int, max_retries: int, backoff: float):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue: queue.Queue = queue.Queue(self.maxsize)
+        self._thread = None
+        self._client = None
+        self.enqueued = 0
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+
+    def _get_client(self):
+        if self._client is None:
+            from ably.sync import AblyRestSync
+            self._client = AblyRestSync(settings.ABLY_API_KEY, **_client_options())
+        return self._client
+
+    def _ensure_thread(self):
+        if os.getpid() == self._pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Forked worker: the parent's thread and HTTP connection are
+                # gone. Reset under the lock so a racing request thread can't
+                # queue onto a queue that is about to be replaced.
+                self._reset()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ably-publisher", daemon=True)
+                self._thread.start()
+
+    def publish(self, channel: str, name: str, data) -> bool:
+        """Queue a message; returns False if it was dropped (queue full)."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((channel, name, data))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued so far has been sent (or given up on)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def flush_at_exit(self) -> bool:
+        """Bounded flush for interpreter exit; a no-op unless this process has a live drain thread."""
+        if os.getpid() != self._pid or self._thread is None or not self._thread.is_alive():
+            return True
+        return self.flush(settings.ABLY_EXIT_FLUSH_SECONDS)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_channel: dict[str, list] = {}
+            for channel, name, data in batch:
+                by_channel.setdefault(channel, []).append((name, data))
+            try:
+                for channel, messages in by_channel.items():
+                    self._send(channel, messages)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send(self, channel: str, messages: list):
+        from ably.sync.types.message import Message
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer("ably"):
+                    self._get_client().channels.get(channel).publish(
+                        messages=[Message(name, data) for name, data in messages]
+                    )
+                self.published += len(messages)
+                self.batches += 1
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    break
+                self.retries += 1
+                time.sleep(self.backoff * (2 ** attempt))
+        self.failed += len(messages)
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self.maxsize,
+            "enqueued": self.enqueued,
+            "published": self.published,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+
+class AsyncPublisher(Publisher):
+    """Event-loop variant used by the ASGI app (asgi.py).
+
+    Same bounded queue, batching, retries and metrics as Publisher, but the
+    flusher is an asyncio task and sends with Ably's async REST client, so a
+    slow Ably call never holds a thread. publish() must be called on the loop.
+    """
+
+    def _reset(self):
+        super()._reset()
+        self._queue = asyncio.Queue(self.maxsize)
+        self._task = None
+
+    def _get_client(self):
+        if self._client is None:
+            from ably import AblyRest
+            self._client = AblyRest(settings.ABLY_API_KEY, **_client_options())
+        return self._client
+
+    def _ensure_thread(self):
+        if os.getpid() != self._pid:
+            self._reset()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+
+    def publish(self, channel: str, name: str, data) -> bool:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((channel, name, data))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def aflush(self, timeout: float = 5.0) -> bool:
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def _run_async(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            by_channel: dict[str, list] = {}
+            for channel, name, data in batch:
+                by_channel.setdefault(channel, []).append((name, data))
+            try:
+                for channel, messages in by_channel.items():
+                    await self._send_async(channel, messages)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send_async(self, channel: str, messages: list):
+        from ably.types.message import Message
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                start = time.perf_counter()
+                try:
+                    await self._get_client().channels.get(channel).publish(
+                        messages=[Message(name, data) for name, data in messages]
+                    )
+                finally:
+                    metrics.observe_dependency("ably", time.perf_counter() - start)
+                self.published += len(messages)
+                self.batches += 1
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    break
+                self.retries += 1
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+        self.failed += len(messages)
+
+
+publisher = Publisher(
+    maxsize=settings.ABLY_QUEUE_SIZE,
+    batch_size=settings.ABLY_BATCH_SIZE,
+    max_retries=settings.ABLY_MAX_RETRIES,
+    backoff=settings.ABLY_RETRY_BACKOFF,
+)
+atexit.register(publisher.flush_at_exit)
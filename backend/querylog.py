@@ -0,0 +1,90 @@
+"""Per-request SQL accounting, slow-query log and a query budget for tests.
+
+db.py calls `record()` from its after_cursor_execute hook for every
+statement. Inside a request the count and total time accumulate on `g` and
+are reported in a `Server-Timing` header; statements slower than
+SLOW_QUERY_MS are logged as one JSON line each on the
+"npcchatter.slow_query" logger, tagged with the route.
+
+Tests wrap a call in `query_budget(n)` to fail when it runs more than n
+statements, which is how N+1 regressions get caught.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from .config import settings
+
+log = logging.getLogger("npcchatter.slow_query")
+
+# Active query budgets on this thread (see query_budget).
+_local = threading.local()
+
+
+def _route() -> str | None:
+    if not has_request_context():
+        return None
+    return request.url_rule.rule if request.url_rule is not None else request.path
+
+
+def record(statement: str, seconds: float):
+    if has_request_context():
+        g._db_queries = g.get("_db_queries", 0) + 1
+        g._db_time = g.get("_db_time", 0.0) + seconds
+    for budget in getattr(_local, "budgets", ()):
+        budget.append(statement)
+    if seconds * 1000 >= settings.SLOW_QUERY_MS:
+        log.warning(json.dumps({
+            "event": "slow_query",
+            "route": _route(),
+            "method": request.method if has_request_context() else None,
+            "ms": round(seconds * 1000, 3),
+            "statement": " ".join(statement.split())[:1000],
+        }))
+
+
+def request_stats() -> tuple[int, float]:
+    """(queries, seconds) recorded so far in the current request."""
+    return g.get("_db_queries", 0), g.get("_db_time", 0.0)
+
+
+@contextmanager
+def query_budget(limit: int):
+    """Fail with AssertionError if the block runs more than `limit` statements.
+
+    Counts statements executed on this thread through any engine from
+    db.get_engine(). Test clients run the app on the calling thread, so
+    wrapping `client.get(...)` covers the whole request.
+    """
+    statements: list[str] = []
+    budgets = _local.__dict__.setdefault("budgets", [])
+    budgets.append(statements)
+    try:
+        yield statements
+    finally:
+        budgets.remove(statements)
+    if len(statements) > limit:
+        listing = "\n".join(f"  {i + 1}. {' '.join(s.split())[:200]}" for i, s in enumerate(statements))
+        raise AssertionError(f"{len(statements)} queries run, budget is {limit}:\n{listing}")
+
+
+def init_app(app):
+    """Report per-request DB usage in a Server-Timing header."""
+
+    @app.before_request
+    def _start():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _server_timing(response):
+        queries, seconds = request_stats()
+        parts = [f'db;desc="{queries} queries";dur={seconds * 1000:.2f}']
+        start = g.get("_request_start")
+        if start is not None:
+            parts.append(f"app;dur={(time.perf_counter() - start) * 1000:.2f}")
+        response.headers.add("Server-Timing", ", ".join(parts))
+        return response
@@ -0,0 +1,306 @@
+"""Per-user and per-campaign rate limits, and a per-worker in-flight cap.
+
+Rate limits are token buckets. `check("roll", user=uid, campaign=cid)` takes
+one token from each configured bucket of that limit, in the order given,
+and raises 429 with Retry-After when one is empty. The user's bucket is
+checked first, so a client looping on an endpoint is stopped before it can
+drain its campaign's bucket for everyone else.
+
+    roll   ROLL_LIMIT_USER, ROLL_LIMIT_CAMPAIGN   (dice rolls, batch rolls)
+    token  TOKEN_LIMIT_USER                       (Ably token requests)
+
+With more than one worker (WEB_CONCURRENCY) buckets are kept in one SQLite
+file (RATE_LIMIT_DB) that every worker on the instance shares; a single
+worker keeps them in memory. RATE_LIMIT_STORE picks either explicitly. If
+the file can't be used, requests are let through and counted in
+ratelimit_store_errors_total rather than failed.
+
+Admission control (MAX_IN_FLIGHT) caps how many requests one worker handles
+at once, by default as many as its DB pool can serve, so the instance-wide
+cap is WEB_CONCURRENCY times that. It acts on gthread (as deployed) and ASGI
+workers; a sync worker only ever has one request. Requests over the cap
+wait up to ADMISSION_TIMEOUT in a queue of ADMISSION_QUEUE and are
+otherwise shed with 503 and Retry-After, before they pile up behind slow DB
+or Ably calls. Health checks, metrics and CORS preflights are never shed.
+"""
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple
+
+from flask import g, request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from . import metrics
+from .config import settings
+
+# (scope, setting) pairs per limit, checked in this order.
+LIMITS = {
+    "roll": (("user", "ROLL_LIMIT_USER"), ("campaign", "ROLL_LIMIT_CAMPAIGN")),
+    "token": (("user", "TOKEN_LIMIT_USER"),),
+}
+
+# Paths admission control never sheds.
+EXEMPT_PATHS = ("/api/health", "/api/_metrics")
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens per second
+    burst: float
+
+
+@lru_cache(maxsize=64)
+def parse_limit(spec: str) -> Limit | None:
+    """"20/10" is bursts of 20 refilled at 20 per 10 seconds; "" or "0" is None."""
+    spec = (spec or "").strip()
+    if not spec or spec == "0":
+        return None
+    count, _, seconds = spec.partition("/")
+    burst, period = float(count), float(seconds or 1)
+    if burst <= 0 or period <= 0:
+        return None
+    return Limit(burst / period, burst)
+
+
+def _take(tokens: float, updated: float, now: float, limit: Limit) -> tuple[float, float]:
+    """Refill a bucket and take one token: (tokens left, seconds to wait).
+
+    A wait above zero means the request is refused; the bucket is unchanged.
+    """
+    tokens = min(limit.burst, tokens + max(now - updated, 0) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.rate
+
+
+class MemoryBuckets:
+    """Buckets for this worker only; the least recently used are dropped
+    beyond MAX_KEYS (a dropped bucket comes back full)."""
+
+    MAX_KEYS = 100_000
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (tokens, updated)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens, wait = _take(tokens, updated, now, limit)
+            if wait == 0:
+                self._buckets[key] = (tokens, now)
+                self._buckets.move_to_end(key)
+                if len(self._buckets) > self.MAX_KEYS:
+                    self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SqliteBuckets:
+    """Buckets in a SQLite file shared by every worker on the instance.
+
+    Each take is one short BEGIN IMMEDIATE transaction. Rows record when
+    the bucket will be full again; rows past that are swept every
+    SWEEP_EVERY takes, since a missing row reads as a full bucket.
+    """
+
+    SWEEP_EVERY = 1024
+    # Seconds to wait for another worker's transaction before giving up.
+    TIMEOUT = 0.25
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, reopened in a forked worker.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key: str, limit: Limit) -> float:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = _take(*(row or (limit.burst, now)), now, limit)
+            if wait == 0:
+                full_at = now + (limit.burst - tokens) / limit.rate
+                conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, "
+                    "updated = excluded.updated, full_at = excluded.full_at",
+                    (key, tokens, now, full_at),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._takes += 1
+            sweep = self._takes % self.SWEEP_EVERY == 0
+        if sweep:
+            try:
+                conn.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+            except sqlite3.Error:
+                pass
+        return wait
+
+    def clear(self):
+        self._conn().execute("DELETE FROM buckets")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    """The bucket store chosen by RATE_LIMIT_STORE, or None when it is off."""
+    global _store
+    if settings.RATE_LIMIT_STORE == "off":
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.RATE_LIMIT_STORE == "sqlite":
+                    _store = SqliteBuckets(
+                        settings.RATE_LIMIT_DB or os.path.join(tempfile.gettempdir(), "npcchatter-ratelimit.db")
+                    )
+                else:
+                    _store = MemoryBuckets()
+    return _store
+
+
+def reset():
+    """Drop the store so the next check picks it again from settings (tests)."""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def check(name: str, **keys: str | None):
+    """Take a token from each of limit `name`'s buckets or raise 429.
+
+    `keys` maps a scope to its id, e.g. user=uid, campaign=cid; scopes with no
+    id or no configured limit are skipped.
+    """
+    buckets = store()
+    if buckets is None:
+        return
+    for scope, setting in LIMITS[name]:
+        key = keys.get(scope)
+        limit = parse_limit(getattr(settings, setting))
+        if not key or limit is None:
+            continue
+        try:
+            wait = buckets.take(f"{name}:{scope}:{key}", limit)
+        except (OSError, sqlite3.Error):
+            metrics.registry.count("ratelimit_store_errors_total")
+            return
+        if wait > 0:
+            metrics.registry.count("ratelimit_rejections_total", (("limit", name), ("scope", scope)))
+            raise TooManyRequests(f"Too many {name} requests; slow down", retry_after=max(1, math.ceil(wait)))
+
+
+class Admission:
+    """Counts in-flight requests against a cap, with a bounded wait queue."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+
+    def enter(self, limit: int, queue: int = 0, timeout: float = 0.0) -> str | None:
+        """Take a slot; returns None, or why not ("full" or "timeout")."""
+        with self._cond:
+            if self.active < limit:
+                self.active += 1
+                return None
+            if self.waiting >= queue or timeout <= 0:
+                return "full"
+            self.waiting += 1
+            metrics.registry.inc("admission_queued")
+            start = time.perf_counter()
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < limit, timeout)
+            finally:
+                self.waiting -= 1
+                metrics.registry.inc("admission_queued", amount=-1)
+                metrics.registry.observe("admission_wait_seconds", (), time.perf_counter() - start)
+            if not admitted:
+                return "timeout"
+            self.active += 1
+            return None
+
+    def leave(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+admission = Admission()
+
+
+def admit(wait: bool = True) -> bool:
+    """Take an in-flight slot when MAX_IN_FLIGHT is set, or raise 503.
+
+    Returns whether a slot was taken (and must be given back with
+    `admission.leave()`). With wait=False (the event loop) there is no queue.
+    """
+    if settings.MAX_IN_FLIGHT <= 0:
+        return False
+    reason = admission.enter(
+        settings.MAX_IN_FLIGHT,
+        settings.ADMISSION_QUEUE if wait else 0,
+        settings.ADMISSION_TIMEOUT if wait else 0,
+    )
+    if reason is not None:
+        metrics.registry.count("admission_rejections_total", (("reason", reason),))
+        raise ServiceUnavailable("Server busy; retry shortly", retry_after=settings.ADMISSION_RETRY_AFTER)
+    return True
+
+
+def exempt(method: str, path: str) -> bool:
+    return method == "OPTIONS" or path in EXEMPT_PATHS
+
+
+def init_app(app):
+    """Apply admission control to every request.
+
+    Register after metrics.init_app so shed requests are still timed and
+    counted (as 503s) in the request metrics.
+    """
+
+    @app.before_request
+    def _admit():
+        if not exempt(request.method, request.path):
+            g._admitted = admit()
+
+    @app.teardown_request
+    def _release(exc):
+        if g.pop("_admitted", False):
+            admission.leave()
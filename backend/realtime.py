@@ -1,51 +1,137 @@
-from flask import Blueprint, jsonify, request, abort, make_response
-from ably import AblyRest
-from sqlalchemy import create_engine, select
+import os
+import threading
+from flask import Blueprint, jsonify, request, abort
+from sqlalchemy import select
 from .campaigns import campaign_members_table
 from .config import settings
+from . import metrics
 from .authn import require_user
-import json
+from .ratelimit import check as check_rate_limit
+from .replicas import read_connection
+from .membership import membership_cache, MISS, DEFAULT_ROLE
 
-ALLOWED_ORIGIN = "https://www.npcchatter.com"
-
-def _corsify(resp):
-    resp.headers["Access-Control-Allow-Origin"] = ALLOWED_ORIGIN
-    resp.headers["Access-Control-Allow-Credentials"] = "true"
-    resp.headers["Vary"] = "Origin"
-    return resp
+# CORS (including the token preflight) comes from the /api/* policy in
+# app.py, the same one the ASGI entry point applies to its native routes.
 
 bp = Blueprint("realtime", __name__, url_prefix="/api/realtime")
 
 
-def _engine():
-    return create_engine(settings.DATABASE_URL, echo=False)
+# Capabilities granted on every campaign channel a user belongs to.
+CHANNEL_CAPS = ["publish", "subscribe", "presence", "history"]
+
+# (pid, client), swapped as one tuple so threads never pair a client with
+# another process's pid.
+_ably_state = (None, None)
+_ably_lock = threading.Lock()
+
+
+def _ably():
+    # One signing client per worker, shared by its threads. Creating a
+    # TokenRequest is a local HMAC, so this never does network I/O on the
+    # token path.
+    global _ably_state
+    pid, client = _ably_state
+    if client is None or pid != os.getpid():
+        with _ably_lock:
+            pid, client = _ably_state
+            if client is None or pid != os.getpid():
+                from ably.sync import AblyRestSync
+                client = AblyRestSync(settings.ABLY_API_KEY)
+                _ably_state = (os.getpid(), client)
+    return client
+
+
+def user_campaigns(user_id: str) -> dict[str, str]:
+    """{campaign_id: role} for every campaign user_id belongs to.
+
+    One query on ix_campaign_members_user_id, cached per user until a join or
+    leave on any worker invalidates it (or ABLY_CAPABILITY_TTL passes).
+    """
+    roles = membership_cache.get_user(user_id)
+    if roles is not MISS:
+        return roles
+    generation = membership_cache.generation()
+    with read_connection(user_id) as conn:
+        rows = conn.execute(_user_roles_query(user_id)).fetchall()
+    return _store_user_roles(user_id, rows, generation)
+
+
+# Query/cache halves of user_campaigns and member_role, shared with the ASGI
+# fast path (asgi.py), which runs the same queries on the async engine.
+def _user_roles_query(user_id: str):
+    return (
+        select(campaign_members_table.c.campaign_id, campaign_members_table.c.role)
+        .where(campaign_members_table.c.user_id == user_id)
+    )
+
+
+# `generation` is membership_cache.generation() read before the query, so a
+# join/leave that lands while it runs is not overwritten by the stale rows.
+def _store_user_roles(user_id: str, rows, generation: tuple[int, float] | None = None) -> dict[str, str]:
+    roles = {cid: (role or DEFAULT_ROLE) for cid, role in rows}
+    membership_cache.put_user(user_id, roles, generation)
+    for cid, role in roles.items():
+        membership_cache.put(cid, user_id, role, generation)
+    return roles
+
+
+def _member_role_query(campaign_id: str, user_id: str):
+    return select(campaign_members_table.c.role).where(
+        (campaign_members_table.c.campaign_id == campaign_id) & (campaign_members_table.c.user_id == user_id)
+    )
+
+
+def _store_member_role(campaign_id: str, user_id: str, row, generation: tuple[int, float] | None = None) -> str | None:
+    role = (row[0] or DEFAULT_ROLE) if row else None
+    membership_cache.put(campaign_id, user_id, role, generation)
+    return role
+
+
+def member_role(campaign_id: str, user_id: str) -> str | None:
+    """Role of user_id in campaign_id (None if not a member), cached with a TTL."""
+    role = membership_cache.get(campaign_id, user_id)
+    if role is not MISS:
+        return role
+    generation = membership_cache.generation()
+    with read_connection(user_id) as conn:
+        row = conn.execute(_member_role_query(campaign_id, user_id)).fetchone()
+    return _store_member_role(campaign_id, user_id, row, generation)
 
 
 def user_can_access_channel(user_id: str, channel: str) -> bool:
     # Only campaign:* channels are supported. For campaign channels, verify
-    # the user is a member by consulting the campaign_members table.
+    # the user is a member via the membership cache (falls back to the DB).
     if not channel.startswith("campaign:"):
         return False
     cid = channel.split(':', 1)[1]
     try:
-        engine = _engine()
-        with engine.connect() as conn:
-            res = conn.execute(
-                select(campaign_members_table.c.user_id).where(
-                    (campaign_members_table.c.campaign_id == cid) & (campaign_members_table.c.user_id == user_id)
-                )
-            )
-            # If the select succeeded and returned a row, the user is a member.
-            row = res.fetchone()
-            return bool(row)
+        return member_role(cid, user_id) is not None
     except Exception:
         # On DB error, default to deny to be safe.
         return False
 
 
+def _campaigns_capability(roles: dict[str, str]) -> dict[str, list[str]]:
+    return {f"campaign:{cid}": CHANNEL_CAPS for cid in sorted(roles)}
+
+
+def _sign_token_request(user_id: str, capability: dict) -> dict:
+    # TokenRequests carry a single-use nonce, so each call signs a fresh
+    # one; the expensive parts (client, memberships) are cached. Signing is a
+    # local HMAC, so this is safe to call from the event loop too.
+    if not capability:
+        # Ably reads a missing capability as the API key's own: every channel.
+        raise ValueError("refusing to sign a token request without a capability")
+    with metrics.timer("ably_token"):
+        return _ably().auth.create_token_request(token_params={
+            "client_id": user_id,
+            "capability": capability,
+            "ttl": settings.ABLY_TOKEN_TTL_MS,
+        }).to_dict()
+
+
 @bp.get("/token")
 def ably_token():
-    from os import environ as _env
     ably_key = settings.ABLY_API_KEY
     if not ably_key or ":" not in ably_key:
         abort(500, "ABLY_API_KEY missing or not in appId.keyId:secret format")
@@ -53,47 +139,32 @@ def ably_token():
     user_id = claims.get("sub") or claims.get("user_id")
     if not user_id:
         abort(401, "No user id in token")
+    check_rate_limit("token", user=user_id)
 
+    # With ?channel=campaign:<id> the token covers just that channel (older
+    # clients); otherwise it covers every campaign the user belongs to.
     chan = request.args.get("channel", "")
     capability = {}
     if chan:
         if not user_can_access_channel(user_id, chan):
             abort(403, "Not a member of that campaign")
-        capability = {chan: ["publish", "subscribe", "presence", "history"]}
-
-    ably = AblyRest(ably_key)
-    try:
-        # ably-python's type stubs don't define these keyword args Pylance
-        # expects, so silence type checking here. Runtime will accept them.
-        token_request = ably.auth.create_token_request(  # type: ignore[call-arg,arg-type]
-            client_id=user_id,
-            capability=(json.dumps(capability) if capability else None),
-            ttl=60 * 60 * 1000,
-        )
+        capability = {chan: CHANNEL_CAPS}
+    else:
         try:
-            # Helpful during diagnostics; remove or reduce in production logs.
-            print("TokenRequest.keyName:", token_request.get("keyName"))
+            roles = user_campaigns(user_id)
         except Exception:
-            pass
-    except Exception as e:
+            abort(503, "Unable to load campaign memberships")
+        if not roles:
+            abort(403, "Not a member of any campaign")
+        capability = _campaigns_capability(roles)
+
+    try:
+        token_request = _sign_token_request(user_id, capability)
+    except Exception:
         import sys, traceback
         traceback.print_exc(file=sys.stdout)
         resp = jsonify({"error": "failed to create Ably token request"})
         resp.status_code = 500
-        return _corsify(resp)
-
-    resp = jsonify(token_request)
-    return _corsify(resp)
-
-
-@bp.route("/token", methods=["OPTIONS"])
-def ably_token_options():
-    # Explicit preflight response to satisfy browsers when Authorization header
-    # and credentials are used. This is a conservative, explicit CORS reply.
-    resp = make_response(("", 204))
-    resp.headers["Access-Control-Allow-Origin"] = ALLOWED_ORIGIN
-    resp.headers["Access-Control-Allow-Headers"] = "Authorization,Content-Type"
-    resp.headers["Access-Control-Allow-Methods"] = "GET,POST,OPTIONS"
-    resp.headers["Access-Control-Allow-Credentials"] = "true"
-    resp.headers["Vary"] = "Origin"
-    return resp
+        return resp
+
+    return jsonify(token_request)
@@ -0,0 +1,16 @@
+"""Recompute the denormalized campaigns.member_count from campaign_members.
+
+join/leave keep the count in step transactionally; this fixes any drift left
+by manual edits, imports or bugs. Safe to run at any time.
+
+Usage:
+    python backend/repair_member_counts.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.campaigns import repair_member_counts
+
+if __name__ == '__main__':
+    print('Repaired member_count on', repair_member_counts(), 'campaign(s)')
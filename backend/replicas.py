@@ -0,0 +1,170 @@
+"""Route read-only handlers to read replicas.
+
+With DATABASE_URL_REPLICAS set (comma-separated URLs), `read_connection()`
+hands out a connection to one of the replicas, round-robin. Writes keep
+using db.get_engine() (the DATABASE_URL primary). Without replicas every
+read goes to the primary as before.
+
+- Health: a replica that refuses a connection is skipped for
+  REPLICA_RETRY_SECONDS and the read falls back to the next replica, then
+  the primary.
+- Read-your-writes: handlers that change what a user sees call
+  `note_write(user_id)` after committing. That user's reads go to the
+  primary for READ_YOUR_WRITES_SECONDS, so a join, leave or active-campaign
+  change is never hidden by replica lag. The marker is a file in
+  READ_YOUR_WRITES_DIR touched on write, so every gunicorn worker on the
+  instance sees it, not just the one that served the write.
+
+To try it locally, point DATABASE_URL and DATABASE_URL_REPLICAS at two SQLite
+files or two local Postgres databases. Nothing copies data between them, so
+reads on the replica show whatever was loaded into it.
+"""
+import hashlib
+import itertools
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.exc import DBAPIError
+
+from .config import settings
+from .db import get_engine
+
+_lock = threading.Lock()
+# replica URL -> monotonic time until which it is skipped
+_down_until: dict[str, float] = {}
+_rr = itertools.count()
+
+
+def replica_urls() -> list[str]:
+    return [u.strip() for u in settings.DATABASE_URL_REPLICAS.split(",") if u.strip()]
+
+
+class RecentWriters:
+    """Users who wrote in the last READ_YOUR_WRITES_SECONDS.
+
+    One empty marker file per user (named by a hash of the id), its mtime
+    the time of the last write. Markers older than `keep` seconds (default
+    READ_YOUR_WRITES_SECONDS) are swept every SWEEP_EVERY writes.
+    """
+
+    SWEEP_EVERY = 256
+
+    def __init__(self, directory: str, keep: float | None = None):
+        self.directory = directory
+        self.keep = keep
+        self._writes = 0
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(user_id.encode()).hexdigest()[:32])
+
+    def note(self, user_id: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(user_id)
+        with open(path, "a"):
+            pass
+        os.utime(path)
+        with _lock:
+            self._writes += 1
+            sweep = self._writes % self.SWEEP_EVERY == 0
+        if sweep:
+            self.sweep()
+
+    def last_write(self, user_id: str) -> float | None:
+        """Wall-clock time of user_id's last write, if its marker is still there."""
+        try:
+            return os.stat(self._path(user_id)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def recent(self, user_id: str) -> bool:
+        mtime = self.last_write(user_id)
+        return mtime is not None and time.time() - mtime < settings.READ_YOUR_WRITES_SECONDS
+
+    def sweep(self):
+        keep = self.keep if self.keep is not None else settings.READ_YOUR_WRITES_SECONDS
+        cutoff = time.time() - keep
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for e in entries:
+            try:
+                if e.stat().st_mtime < cutoff:
+                    os.remove(e.path)
+            except OSError:
+                pass
+
+
+recent_writers = RecentWriters(
+    settings.READ_YOUR_WRITES_DIR or os.path.join(tempfile.gettempdir(), "npcchatter-ryw")
+)
+
+
+def note_write(user_id: str | None):
+    """Pin user_id's reads to the primary for READ_YOUR_WRITES_SECONDS."""
+    if not user_id or not replica_urls():
+        return
+    try:
+        recent_writers.note(user_id)
+    except OSError:
+        # Worst case the user briefly reads from a lagging replica.
+        pass
+
+
+def mark_down(url: str):
+    with _lock:
+        _down_until[url] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def read_urls(user_id: str | None = None) -> list[str]:
+    """URLs to try for a read, in order; always ends with the primary."""
+    primary = settings.DATABASE_URL
+    replicas = replica_urls()
+    if not replicas or (user_id and recent_writers.recent(user_id)):
+        return [primary]
+    now = time.monotonic()
+    healthy = [u for u in replicas if _down_until.get(u, 0) <= now]
+    if healthy:
+        start = next(_rr) % len(healthy)
+        healthy = healthy[start:] + healthy[:start]
+    return healthy + [primary]
+
+
+@contextmanager
+def read_connection(user_id: str | None = None):
+    """Connection for a read-only handler (see the module docstring).
+
+    Pass the signed-in user's id, if there is one, so their recent writes are
+    honoured. Only a failed connect falls back; a query that fails on a
+    replica raises like it would on the primary.
+    """
+    urls = read_urls(user_id)
+    for url in urls[:-1]:
+        try:
+            conn = get_engine(url).connect()
+        except DBAPIError:
+            mark_down(url)
+            continue
+        break
+    else:
+        conn = get_engine(urls[-1]).connect()
+    with conn:
+        yield conn
+
+
+def stats() -> list[dict]:
+    """Replica health for /api/_pool (index into DATABASE_URL_REPLICAS, no URLs)."""
+    now = time.monotonic()
+    return [
+        {"replica": i, "healthy": _down_until.get(u, 0) <= now,
+         "retry_in_s": round(max(_down_until.get(u, 0) - now, 0), 1)}
+        for i, u in enumerate(replica_urls())
+    ]
+
+
+def reset():
+    with _lock:
+        _down_until.clear()
@@ -0,0 +1,120 @@
+"""One-time schema readiness check.
+
+The schema is owned by alembic (`python backend/alembic_upgrade.py head` runs
+at deploy). Instead of issuing DDL on every request, each worker compares the
+database's alembic revision with the migration scripts' head once and caches
+the answer. Requests to DB-backed blueprints fail fast with a 503 while the
+schema is behind.
+"""
+import os
+import sys
+import threading
+import time
+
+from flask import abort, request
+
+from .config import settings
+from .db import get_engine
+
+ALEMBIC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'alembic'))
+
+# Blueprints whose handlers touch the database.
+DB_BLUEPRINTS = {"campaigns", "realtime", "export"}
+
+
+class SchemaNotReady(RuntimeError):
+    pass
+
+
+_lock = threading.Lock()
+_state: dict = {"checked": False, "checked_at": 0.0, "revision": None, "error": None}
+
+
+def expected_heads() -> set[str]:
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    cfg = Config()
+    cfg.set_main_option('script_location', ALEMBIC_DIR)
+    return set(ScriptDirectory.from_config(cfg).get_heads())
+
+
+def current_heads(engine=None) -> set[str]:
+    from alembic.runtime.migration import MigrationContext
+
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        return set(MigrationContext.configure(conn).get_current_heads())
+
+
+def _probe(engine=None) -> dict:
+    if not settings.DATABASE_URL and engine is None:
+        return {"revision": None, "error": "DATABASE_URL is not configured"}
+    try:
+        want = expected_heads()
+        have = current_heads(engine)
+    except Exception as e:
+        # Unreachable DB: don't cache, so the next request retries.
+        raise SchemaNotReady(f"unable to read schema revision: {e}") from e
+    revision = ",".join(sorted(have)) or None
+    if have != want:
+        return {"revision": revision, "error": (
+            f"database schema is at revision {revision or '<none>'}, "
+            f"expected {','.join(sorted(want))}; "
+            "run `python backend/alembic_upgrade.py head`"
+        )}
+    return {"revision": revision, "error": None}
+
+
+def check_schema(engine=None, force: bool = False) -> str:
+    """Verify the DB is at the alembic head; cached after the first call.
+
+    Returns the current revision or raises SchemaNotReady.
+    """
+    if _state["checked"] and not force:
+        if not _state["error"]:
+            return _state["revision"]
+        # A failed check is re-probed at most every SCHEMA_RECHECK_SECONDS so a
+        # worker recovers once the migration lands without a restart.
+        if time.monotonic() - _state["checked_at"] < settings.SCHEMA_RECHECK_SECONDS:
+            raise SchemaNotReady(_state["error"])
+        force = True
+    with _lock:
+        if force or not _state["checked"]:
+            _state.update(checked=True, checked_at=time.monotonic(), **_probe(engine))
+        error = _state["error"]
+        revision = _state["revision"]
+    if error:
+        raise SchemaNotReady(error)
+    return revision
+
+
+def is_ready() -> bool:
+    """True if a cached check already passed (no I/O)."""
+    return settings.SCHEMA_CHECK == "off" or (_state["checked"] and not _state["error"])
+
+
+def reset():
+    _state.update(checked=False, checked_at=0.0, revision=None, error=None)
+
+
+def init_app(app):
+    """Check the schema at worker start and guard DB-backed routes."""
+    if settings.SCHEMA_CHECK == "off":
+        return
+    try:
+        rev = check_schema()
+        sys.stdout.write(f"Schema ready at revision {rev}\n")
+    except SchemaNotReady as e:
+        sys.stdout.write(f"Schema not ready: {e}\n")
+    sys.stdout.flush()
+
+    @app.before_request
+    def _require_schema():
+        if request.method == "OPTIONS" or request.blueprint not in DB_BLUEPRINTS:
+            return None
+        try:
+            check_schema()
+        except SchemaNotReady as e:
+            abort(503, f"Schema not ready: {e}")
+        return None
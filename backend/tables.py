@@ -0,0 +1,60 @@
+"""Table metadata shared by the campaign routes, the data-access layer and alembic.
+
+The schema itself is managed by alembic migrations; these definitions mirror it.
+"""
+from sqlalchemy import (
+    Table, Column, String, Integer, BigInteger, MetaData, PrimaryKeyConstraint, DateTime, Index, text
+)
+
+# --- DB Metadata & Tables ---
+metadata = MetaData()
+
+campaigns_table = Table(
+    "campaigns",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("description", String, nullable=True),
+    Column("avatar", String, nullable=True),
+    # Owner ID (Clerk user id). Nullable for existing rows; new creates will set this.
+    Column("owner_id", String, nullable=True),
+    Column("created_at", DateTime, server_default=text('CURRENT_TIMESTAMP')),
+    Column("updated_at", DateTime, nullable=True),
+    # Denormalized COUNT(*) of campaign_members (migration 0006); kept in step
+    # by join/leave and fixable with `python backend/repair_member_counts.py`.
+    Column("member_count", Integer, nullable=False, server_default=text('0')),
+)
+# Keyset pagination order for list_campaigns (migration 0003)
+Index("ix_campaigns_created_at_id", campaigns_table.c.created_at, campaigns_table.c.id)
+# Owned-campaign lookup for the dashboard (migration 0005)
+Index("ix_campaigns_owner_id", campaigns_table.c.owner_id)
+
+campaign_members_table = Table(
+    "campaign_members",
+    metadata,
+    Column("campaign_id", String, nullable=False),
+    Column("user_id", String, nullable=False),
+    # Added in migration 0002; NULL on old rows means 'player'
+    Column("role", String, nullable=True),
+    PrimaryKeyConstraint("campaign_id", "user_id", name="pk_campaign_members"),
+)
+
+# Simple user settings table to persist small per-user preferences such as
+# the currently active campaign. The schema itself is managed by alembic
+# (see schema.py); this metadata mirrors it for queries and tests.
+user_settings_table = Table(
+    "user_settings",
+    metadata,
+    Column("user_id", String, primary_key=True),
+    Column("active_campaign_id", String, nullable=True),
+)
+
+# Change counters behind the listing ETags (migration 0004). Keys are
+# 'members:<cid>' and 'user:<uid>'; the campaign directory's tags come from
+# its page rows instead (campaigns._page_version).
+versions_table = Table(
+    "versions",
+    metadata,
+    Column("key", String, primary_key=True),
+    Column("version", BigInteger, nullable=False, server_default=text('0')),
+)
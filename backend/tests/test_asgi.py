@@ -0,0 +1,188 @@
+import asyncio
+import importlib.util
+import os
+import unittest
+
+import httpx
+
+from backend import campaigns, ratelimit, realtime
+from backend.membership import membership_cache
+from backend.config import settings
+from backend.db import dispose_all
+
+# Importing the ASGI app imports backend.app; skip its startup schema probe.
+_schema_check, settings.SCHEMA_CHECK = settings.SCHEMA_CHECK, "off"
+from backend import asgi  # noqa: E402
+settings.SCHEMA_CHECK = _schema_check
+
+HAS_AIOSQLITE = importlib.util.find_spec("aiosqlite") is not None
+
+
+class _FakeChannel:
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+
+    async def publish(self, messages):
+        self.client.calls.append((self.name, [(m.name, m.data) for m in messages]))
+
+
+class _FakeAsyncClient:
+    def __init__(self):
+        self.calls = []
+        self.channels = self
+
+    def get(self, name):
+        return _FakeChannel(self, name)
+
+    async def close(self):
+        pass
+
+
+class AsgiTest(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        self._schema_check, settings.SCHEMA_CHECK = settings.SCHEMA_CHECK, "off"
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        campaigns.metadata.create_all(campaigns._engine())
+        self._require_user = campaigns.require_user
+        self._current_user = asgi.current_user
+
+    def tearDown(self):
+        campaigns.require_user = self._require_user
+        asgi.current_user = self._current_user
+        settings.SCHEMA_CHECK = self._schema_check
+        dispose_all()
+
+    def request(self, method, path, **kw):
+        async def go():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, path, **kw)
+        return asyncio.run(go())
+
+    def test_native_health(self):
+        resp = self.request("GET", "/api/health")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"ok": True})
+
+    def test_flask_fallback(self):
+        resp = self.request("GET", "/")
+        self.assertEqual(resp.json()["service"], "npcchatter-backend")
+
+        campaigns.require_user = lambda: {"sub": "user_1"}
+        resp = self.request("POST", "/api/campaigns", json={"name": "Bridged"})
+        self.assertEqual(resp.status_code, 200, resp.text)
+        cid = resp.json()["id"]
+        resp = self.request("GET", f"/api/campaigns/{cid}/members")
+        self.assertEqual(resp.status_code, 200, resp.text)
+        self.assertIn("Server-Timing", resp.headers)
+
+    def test_native_roll_publishes_async(self):
+        async def fake_user(req):
+            return {"sub": "user_1"}
+        asgi.current_user = fake_user
+        client = _FakeAsyncClient()
+
+        async def go():
+            pub = asgi.async_publisher
+            pub._reset()
+            pub._client = client
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                ok = await http.post("/api/campaigns/c1/roll", json={"expr": "2d1+1"})
+                bad = await http.post("/api/campaigns/c1/roll", json={"expr": "nope"})
+            self.assertTrue(await pub.aflush(2))
+            await pub.aclose()
+            return ok, bad
+
+        ok, bad = asyncio.run(go())
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(ok.json()["total"], 3)
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(len(client.calls), 1)
+        channel, messages = client.calls[0]
+        self.assertEqual(channel, "campaign:c1")
+        self.assertEqual([(name, data["user"], data["expr"]) for name, data in messages], [("dice", "user_1", "2d1+1")])
+
+    def test_native_roll_rate_limited(self):
+        async def fake_user(req):
+            return {"sub": "user_limited"}
+        asgi.current_user = fake_user
+        saved = settings.ROLL_LIMIT_USER
+        settings.ROLL_LIMIT_USER = "1/60"
+        ratelimit.reset()
+        try:
+            first = self.request("POST", "/api/campaigns/c1/roll", json={"expr": "nope"})
+            second = self.request("POST", "/api/campaigns/c1/roll", json={"expr": "1d6"})
+        finally:
+            settings.ROLL_LIMIT_USER = saved
+            ratelimit.reset()
+        self.assertEqual(first.status_code, 400)
+        self.assertEqual(second.status_code, 429)
+        self.assertIn("Retry-After", second.headers)
+
+    def test_cors_on_native_routes(self):
+        resp = self.request("GET", "/api/health", headers={"Origin": "http://localhost:5173"})
+        self.assertEqual(resp.headers["Access-Control-Allow-Origin"], "http://localhost:5173")
+        resp = self.request("GET", "/api/health", headers={"Origin": "https://evil.example"})
+        self.assertNotIn("Access-Control-Allow-Origin", resp.headers)
+
+    def test_token_cors_matches_flask(self):
+        saved = (settings.ABLY_API_KEY, realtime.require_user)
+        settings.ABLY_API_KEY = "app.key:secret"
+        realtime.require_user = lambda: {"sub": "user_cors"}
+
+        async def fake_user(req):
+            return {"sub": "user_cors"}
+        asgi.current_user = fake_user
+        with campaigns._engine().begin() as conn:
+            conn.execute(campaigns.campaigns_table.insert().values(id="c_cors", name="C", owner_id="o"))
+            conn.execute(campaigns.campaign_members_table.insert().values(campaign_id="c_cors", user_id="user_cors"))
+        membership_cache.clear()
+        cors = lambda headers: {k.lower(): v for k, v in headers.items() if k.lower().startswith("access-control-")}
+        try:
+            for origin in ("http://localhost:5173", "https://www.npcchatter.com", "https://evil.example"):
+                native = self.request("GET", "/api/realtime/token", headers={"Origin": origin})
+                with asgi.flask_app.test_client() as client:
+                    flask = client.get("/api/realtime/token", headers={"Origin": origin})
+                self.assertEqual((native.status_code, flask.status_code), (200, 200))
+                self.assertEqual(cors(native.headers), cors(flask.headers), origin)
+        finally:
+            settings.ABLY_API_KEY, realtime.require_user = saved
+            membership_cache.clear()
+
+    def test_profile_header_allowed_cross_origin(self):
+        origin = "http://localhost:5173"
+        with asgi.flask_app.test_client() as client:
+            preflight = client.options("/api/campaigns", headers={
+                "Origin": origin,
+                "Access-Control-Request-Method": "GET",
+                "Access-Control-Request-Headers": "authorization,x-profile",
+            })
+        self.assertIn("x-profile", preflight.headers["Access-Control-Allow-Headers"].lower())
+        native = self.request("GET", "/api/health", headers={"Origin": origin})
+        self.assertIn("X-Profile", native.headers["Access-Control-Allow-Headers"])
+        self.assertIn("X-Profile-File", native.headers["Access-Control-Expose-Headers"])
+
+    def test_compressed_native_response_etag(self):
+        scope = {"method": "GET", "path": "/api/campaigns", "headers": [(b"accept-encoding", b"gzip")]}
+        resp = asgi._cacheable(asgi.Response.json([{"id": f"c{i}"} for i in range(200)]), "campaigns.3.abc")
+        asgi._compress(asgi.Request(scope, b""), resp)
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(resp.headers["ETag"], '"campaigns.3.abc-gzip"')
+
+    @unittest.skipUnless(HAS_AIOSQLITE, "aiosqlite not installed")
+    def test_native_list_matches_flask(self):
+        campaigns.require_user = lambda: {"sub": "user_1"}
+        for name in ("A", "B", "C"):
+            self.request("POST", "/api/campaigns", json={"name": name})
+        resp = self.request("GET", "/api/campaigns?limit=2")
+        self.assertEqual(resp.status_code, 200, resp.text)
+        self.assertEqual(len(resp.json()), 2)
+        self.assertIn("X-Next-Cursor", resp.headers)
+        again = self.request("GET", "/api/campaigns?limit=2", headers={"If-None-Match": resp.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
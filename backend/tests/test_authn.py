@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+import unittest
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+from werkzeug.exceptions import Unauthorized
+
+from backend import authn
+from backend.config import settings
+
+
+def _make_key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private.public_key()))
+    jwk.update(kid=kid, use="sig", alg="RS256")
+    return private, jwk
+
+
+class _AuthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.private, self.jwk = _make_key("kid_1")
+        self.fetches = []
+        settings.CLERK_JWKS_URL = "https://jwks.test/primary"
+        settings.CLERK_JWKS_URL_ALT = ""
+        settings.CLERK_ISSUER = ""
+
+        def fake_fetch(url):
+            self.fetches.append(url)
+            return {"keys": [self.jwk]}
+
+        self._orig_fetch = authn._fetch_jwks
+        authn._fetch_jwks = fake_fetch
+        authn.jwks_store = authn.KeyStore()
+        authn.jwks_store.on_rotate(authn._evict_rotated)
+        authn.claims_cache = authn.ClaimsCache(64)
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        authn._fetch_jwks = self._orig_fetch
+
+    def _token(self, kid="kid_1", key=None):
+        claims = {"sub": "user_1", "exp": int(time.time()) + 300}
+        return jwt.encode(claims, key or self.private, algorithm="RS256", headers={"kid": kid})
+
+    def _require(self, token):
+        with self.app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            return authn.require_user()
+
+
+class KeyStoreTest(_AuthTestCase):
+    def test_known_kid_verifies_without_refetch(self):
+        token = self._token()
+        for _ in range(5):
+            self.assertEqual(self._require(token)["sub"], "user_1")
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_unknown_kid_is_negatively_cached(self):
+        self._require(self._token())
+        bad = self._token(kid="kid_bogus")
+        # Forced refreshes are rate limited, so a flood of bad kids right after
+        # the initial load costs no outbound HTTP.
+        for i in range(20):
+            with self.assertRaises(Unauthorized):
+                self._require(bad)
+            with self.assertRaises(Unauthorized):
+                self._require(self._token(kid=f"kid_other_{i}"))
+        self.assertEqual(len(self.fetches), 1)
+
+        # Once the interval has passed an unknown kid forces one refresh and is
+        # then remembered as bad.
+        authn.jwks_store._last_forced = 0.0
+        for _ in range(20):
+            with self.assertRaises(Unauthorized):
+                self._require(self._token(kid="kid_rotated"))
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_failed_first_fetch_is_retried_soon(self):
+        good_fetch = authn._fetch_jwks
+
+        def flaky_fetch(url):
+            self.fetches.append(url)
+            raise RuntimeError("connection reset")
+
+        authn._fetch_jwks = flaky_fetch
+        token = self._token()
+        with self.assertRaises(Unauthorized):
+            self._require(token)
+        authn._fetch_jwks = good_fetch
+        # Straight away: still backing off, no second fetch.
+        with self.assertRaises(Unauthorized):
+            self._require(token)
+        self.assertEqual(len(self.fetches), 1)
+        # A second later, well inside JWKS_MIN_REFRESH_INTERVAL, it retries.
+        authn.jwks_store._last_forced -= authn.FETCH_RETRY_SECONDS
+        self.assertLess(authn.FETCH_RETRY_SECONDS, settings.JWKS_MIN_REFRESH_INTERVAL)
+        self.assertEqual(self._require(token)["sub"], "user_1")
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_keys_merge_across_urls(self):
+        alt_private, alt_jwk = _make_key("kid_alt")
+        settings.CLERK_JWKS_URL_ALT = "https://jwks.test/alt"
+        authn._fetch_jwks = lambda url: {"keys": [alt_jwk if url.endswith("alt") else self.jwk]}
+        self.assertEqual(self._require(self._token())["sub"], "user_1")
+        self.assertEqual(self._require(self._token(kid="kid_alt", key=alt_private))["sub"], "user_1")
+
+
+class ClaimsCacheTest(_AuthTestCase):
+    def test_repeat_token_hits_cache(self):
+        token = self._token()
+        first = self._require(token)
+        self.assertIs(self._require(token), first)
+        self.assertEqual(authn.claims_cache.stats()["hits"], 1)
+        self.assertEqual(authn.claims_cache.stats()["misses"], 1)
+
+    def test_expired_entry_is_not_served(self):
+        token = self._token()
+        self._require(token)
+        k = authn.ClaimsCache._key(token)
+        claims, _, kid = authn.claims_cache._entries[k]
+        authn.claims_cache._entries[k] = (claims, time.time() - 1, kid)
+        self.assertIsNone(authn.claims_cache.get(token))
+
+    def test_rotated_kid_is_evicted(self):
+        token = self._token()
+        self._require(token)
+        _, self.jwk = _make_key("kid_2")
+        authn.jwks_store.refresh()
+        self.assertEqual(authn.claims_cache.stats()["size"], 0)
+        with self.assertRaises(Unauthorized):
+            self._require(token)
+
+
+class ConcurrencyTest(_AuthTestCase):
+    THREADS = 32
+    ROUNDS = 20
+
+    def _hammer(self, tokens):
+        """Call require_user for the tokens from THREADS threads at once."""
+        barrier = threading.Barrier(self.THREADS)
+        results, errors = [], []
+
+        def worker(n):
+            barrier.wait()
+            for i in range(self.ROUNDS):
+                try:
+                    results.append(self._require(tokens[(n + i) % len(tokens)])["sub"])
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def _slow_fetch(self, delay=0.05):
+        fetch = authn._fetch_jwks
+
+        def slow(url):
+            time.sleep(delay)
+            return fetch(url)
+        authn._fetch_jwks = slow
+
+    def test_cold_start_fetches_once(self):
+        self._slow_fetch()
+        tokens = [self._token() for _ in range(8)]
+        results, errors = self._hammer(tokens)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.THREADS * self.ROUNDS)
+        self.assertEqual(len(self.fetches), 1)
+        stats = authn.claims_cache.stats()
+        self.assertEqual(stats["hits"] + stats["misses"], self.THREADS * self.ROUNDS)
+
+    def test_rotation_is_single_flighted(self):
+        self._require(self._token())
+        self.private, self.jwk = _make_key("kid_2")
+        authn.jwks_store._last_forced = 0.0
+        self._slow_fetch()
+        results, errors = self._hammer([self._token(kid="kid_2")])
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.THREADS * self.ROUNDS)
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_refresh_ahead_starts_one_thread(self):
+        self._require(self._token())
+        authn.jwks_store._fetched_at -= settings.JWKS_TTL
+        # No claims cache, so every request reaches the key store.
+        authn.claims_cache = authn.ClaimsCache(0)
+        self._slow_fetch()
+        results, errors = self._hammer([self._token()])
+        self.assertEqual(errors, [])
+        deadline = time.time() + 5
+        while authn.jwks_store._background is not None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.fetches), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
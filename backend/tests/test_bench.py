@@ -0,0 +1,48 @@
+import unittest
+from flask import Flask
+
+from backend import authn
+from backend.bench.__main__ import percentile, summarize
+from backend.bench.serialize import run as run_serialize
+from backend.bench.stubs import JwksServer
+from backend.config import settings
+
+
+class BenchHelpersTest(unittest.TestCase):
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile(values, 100), 100.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summarize(self):
+        out = summarize({"list": [(0.01, 200), (0.03, 500)], "roll": [(0.02, 200)]}, duration=1.0)
+        self.assertEqual(out["list"]["errors"], 1)
+        self.assertEqual(out["all"]["requests"], 3)
+        self.assertEqual(out["all"]["p50_ms"], 20.0)
+
+    def test_serialize_report(self):
+        report = run_serialize([20], repeat=2)
+        entry = report["payloads"]["20"]
+        self.assertEqual(set(entry["encode_ms"]), {"stdlib", "jsonprovider"})
+        self.assertLess(entry["bytes"]["gzip"], entry["bytes"]["identity"])
+
+    def test_stub_jwks_tokens_verify(self):
+        server = JwksServer().start()
+        saved = (settings.CLERK_JWKS_URL, settings.CLERK_JWKS_URL_ALT, settings.CLERK_ISSUER, authn.jwks_store)
+        try:
+            settings.CLERK_JWKS_URL, settings.CLERK_JWKS_URL_ALT = server.url, ""
+            settings.CLERK_ISSUER = server.issuer
+            authn.jwks_store = authn.KeyStore()
+            app = Flask(__name__)
+            with app.test_request_context(headers={"Authorization": f"Bearer {server.mint('bench_user')}"}):
+                self.assertEqual(authn.require_user()["sub"], "bench_user")
+            self.assertEqual(server.fetches, 1)
+        finally:
+            settings.CLERK_JWKS_URL, settings.CLERK_JWKS_URL_ALT, settings.CLERK_ISSUER, authn.jwks_store = saved
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
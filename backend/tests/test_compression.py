@@ -0,0 +1,99 @@
+import gzip
+import json
+import unittest
+from datetime import datetime, timezone
+from flask import Flask, Response, jsonify
+
+from backend import compression, jsonprovider
+from backend.config import settings
+
+
+class JsonProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        jsonprovider.init_app(self.app)
+
+    def test_datetimes_are_iso(self):
+        when = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+        with self.app.app_context():
+            body = jsonify({"at": when, "n": 1}).get_data()
+        self.assertEqual(json.loads(body), {"at": "2024-05-01T12:30:00+00:00", "n": 1})
+        self.assertTrue(body.endswith(b"\n"))
+
+    def test_stdlib_fallback_matches(self):
+        rows = [{"id": "c1", "when": datetime(2024, 1, 2, 3, 4, 5), 7: "int key"}]
+        fast = jsonprovider.dumps_bytes(rows)
+        settings.JSON_PROVIDER, saved = "stdlib", settings.JSON_PROVIDER
+        try:
+            slow = jsonprovider.dumps_bytes(rows)
+        finally:
+            settings.JSON_PROVIDER = saved
+        self.assertEqual(json.loads(fast), json.loads(slow))
+
+    def test_big_ints_fall_back_to_stdlib(self):
+        self.assertEqual(json.loads(jsonprovider.dumps_bytes({"total": 10 ** 30})), {"total": 10 ** 30})
+
+    def test_get_json_uses_provider(self):
+        @self.app.post("/echo")
+        def echo():
+            from flask import request
+            return jsonify(request.get_json())
+
+        resp = self.app.test_client().post("/echo", data=b"{\"a\": [1, 2]}", content_type="application/json")
+        self.assertEqual(resp.get_json(), {"a": [1, 2]})
+        bad = self.app.test_client().post("/echo", data=b"{nope", content_type="application/json")
+        self.assertEqual(bad.status_code, 400)
+
+
+class CompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        jsonprovider.init_app(self.app)
+        compression.init_app(self.app)
+        self.big = [{"id": f"c{i}", "name": "Campaign name"} for i in range(200)]
+
+        @self.app.get("/big")
+        def big():
+            return jsonify(self.big)
+
+        @self.app.get("/small")
+        def small():
+            return jsonify({"ok": True})
+
+        @self.app.get("/stream")
+        def stream():
+            return Response((b"x" * 4096 for _ in range(4)), mimetype="application/x-ndjson")
+
+        self.client = self.app.test_client()
+
+    def test_negotiate(self):
+        self.assertIsNone(compression.negotiate(None))
+        self.assertIsNone(compression.negotiate("identity"))
+        self.assertIsNone(compression.negotiate("gzip;q=0"))
+        self.assertEqual(compression.negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(compression.negotiate("*"), "br" if compression.brotli else "gzip")
+        expect = "br" if compression.brotli else "gzip"
+        self.assertEqual(compression.negotiate("gzip;q=0.5, br"), expect)
+
+    def test_large_json_is_gzipped(self):
+        resp = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertEqual(int(resp.headers["Content-Length"]), len(resp.data))
+        self.assertEqual(json.loads(gzip.decompress(resp.data)), self.big)
+
+    def test_left_alone(self):
+        # Small body, no Accept-Encoding, streamed body.
+        small = self.client.get("/small", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", small.headers)
+        self.assertIn("Accept-Encoding", small.headers["Vary"])
+        plain = self.client.get("/big")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.get_json(), self.big)
+        streamed = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", streamed.headers)
+        self.assertEqual(len(streamed.data), 4 * 4096)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import unittest
+from flask import Flask
+
+from backend import campaigns
+from backend.db import dispose_all
+from backend.config import settings
+
+
+class DashboardTest(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        self.engine = campaigns._engine()
+        campaigns.metadata.create_all(self.engine)
+        self.user_id = "user_1"
+        t, m = campaigns.campaigns_table, campaigns.campaign_members_table
+        with self.engine.begin() as conn:
+            conn.execute(t.insert(), [
+                {"id": "c_joined", "name": "Joined", "owner_id": "someone"},
+                {"id": "c_owned", "name": "Owned", "owner_id": self.user_id},
+                {"id": "c_both", "name": "Both", "owner_id": self.user_id},
+                {"id": "c_other", "name": "Other", "owner_id": "someone"},
+            ])
+            conn.execute(m.insert(), [
+                {"campaign_id": "c_joined", "user_id": self.user_id, "role": "dm"},
+                {"campaign_id": "c_joined", "user_id": "user_2", "role": "player"},
+                {"campaign_id": "c_both", "user_id": self.user_id, "role": "player"},
+                {"campaign_id": "c_other", "user_id": "user_2", "role": "player"},
+            ])
+            conn.execute(campaigns.user_settings_table.insert().values(
+                user_id=self.user_id, active_campaign_id="c_joined"
+            ))
+
+        # Fixture rows bypass join/leave, so bring the counts in line.
+        self.assertEqual(campaigns.repair_member_counts(self.engine), 3)
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(campaigns.bp)
+        campaigns.require_user = lambda: {"sub": self.user_id}
+
+    def tearDown(self):
+        dispose_all()
+
+    def test_dashboard(self):
+        with self.app.test_client() as client:
+            resp = client.get("/api/user/dashboard")
+        self.assertEqual(resp.status_code, 200, resp.data)
+        data = resp.get_json()
+        self.assertEqual(data["active"], "c_joined")
+        by_id = {c["id"]: c for c in data["campaigns"]}
+        self.assertEqual(sorted(by_id), ["c_both", "c_joined", "c_owned"])
+        self.assertEqual((by_id["c_joined"]["role"], by_id["c_joined"]["member_count"]), ("dm", 2))
+        self.assertFalse(by_id["c_joined"]["is_owner"])
+        self.assertEqual((by_id["c_owned"]["role"], by_id["c_owned"]["is_member"]), ("owner", False))
+        self.assertEqual(by_id["c_owned"]["member_count"], 0)
+        self.assertTrue(by_id["c_both"]["is_owner"] and by_id["c_both"]["is_member"])
+
+    def test_join_and_leave_maintain_count(self):
+        def count():
+            with self.engine.connect() as conn:
+                return conn.execute(campaigns.select(campaigns.campaigns_table.c.member_count)
+                                    .where(campaigns.campaigns_table.c.id == "c_owned")).scalar()
+        with self.app.test_client() as client:
+            client.post("/api/campaigns/c_owned/join")
+            client.post("/api/campaigns/c_owned/join")
+            self.assertEqual(count(), 1)
+            listed = {c["id"]: c["member_count"] for c in client.get("/api/campaigns").get_json()}
+            self.assertEqual(listed, {"c_joined": 2, "c_owned": 1, "c_both": 1, "c_other": 1})
+            client.post("/api/campaigns/c_owned/leave")
+            client.post("/api/campaigns/c_owned/leave")
+            self.assertEqual(count(), 0)
+        self.assertEqual(campaigns.repair_member_counts(self.engine), 0)
+
+    def test_empty(self):
+        self.user_id = "nobody"
+        with self.app.test_client() as client:
+            data = client.get("/api/user/dashboard").get_json()
+        self.assertEqual(data, {"campaigns": [], "active": None})
+
+
+if __name__ == "__main__":
+    unittest.main()
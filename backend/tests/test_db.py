@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import text
+
+from backend import db
+from backend.config import settings
+
+
+class EngineRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.url = f"sqlite:///{os.path.join(self.tmp, 'a.db')}"
+        self.other = f"sqlite:///{os.path.join(self.tmp, 'b.db')}"
+        db.dispose_all()
+
+    def tearDown(self):
+        db.dispose_all()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_one_engine_per_url(self):
+        self.assertIs(db.get_engine(self.url), db.get_engine(self.url))
+        self.assertIsNot(db.get_engine(self.url), db.get_engine(self.other))
+        saved, settings.DATABASE_URL = settings.DATABASE_URL, self.url
+        try:
+            self.assertIs(db.get_engine(), db.get_engine(self.url))
+        finally:
+            settings.DATABASE_URL = saved
+        # Memory SQLite keeps SQLAlchemy's own pool, without the sizing options.
+        self.assertNotIsInstance(db.get_engine("sqlite://").pool, db._TimedQueuePool)
+
+    def test_pool_stats(self):
+        engine = db.get_engine(self.url)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            (stats,) = db.pool_stats()
+            self.assertEqual(stats["dialect"], "sqlite")
+            self.assertEqual(stats["pool"], "_TimedQueuePool")
+            self.assertEqual(stats["checked_out"], 1)
+            self.assertEqual(stats["size"], settings.DB_POOL_SIZE)
+            self.assertEqual(stats["max_overflow"], settings.DB_MAX_OVERFLOW)
+            self.assertGreaterEqual(stats["waits"], 1)
+            self.assertIn("wait_max_ms", stats)
+        self.assertEqual(db.pool_stats()[0]["checked_out"], 0)
+
+    def test_failed_statement_leaves_no_timing_behind(self):
+        engine = db.get_engine(self.url)
+        with engine.connect() as conn:
+            with self.assertRaises(Exception):
+                conn.execute(text("SELECT * FROM no_such_table"))
+            self.assertEqual(conn.execute(text("SELECT 1")).scalar(), 1)
+            self.assertNotIn("query_start", conn.connection.info)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_forked_child_gets_fresh_pools(self):
+        engine = db.get_engine(self.url)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertEqual(engine.pool.checkedin(), 1)
+        parent_pool = id(engine.pool)
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # Same engine object, but none of the parent's connections.
+                ok = db.get_engine(self.url) is engine and id(engine.pool) != parent_pool \
+                    and engine.pool.checkedin() == 0
+                with engine.connect() as conn:
+                    ok = ok and conn.execute(text("SELECT 1")).scalar() == 1
+                os.write(write, b"1" if ok else b"0")
+            finally:
+                os._exit(0)
+        os.close(write)
+        result = os.read(read, 1)
+        os.close(read)
+        os.waitpid(pid, 0)
+        self.assertEqual(result, b"1")
+        # The parent's pool is untouched.
+        self.assertEqual(engine.pool.checkedin(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import random
+import unittest
+
+from flask import Flask
+
+from backend import dice
+
+
+class _Scripted:
+    """Stand-in RNG that hands out predetermined die faces in order."""
+
+    def __init__(self, *faces):
+        self.faces = list(faces)
+
+    def choices(self, population, k):
+        out, self.faces = self.faces[:k], self.faces[k:]
+        return out
+
+
+class DiceEngineTest(unittest.TestCase):
+    def test_compile_multiple_terms(self):
+        plan = dice.compile_expr("4d6kh3 + 1d4 - 2")
+        self.assertEqual(plan.constant, -2)
+        self.assertEqual(plan.dice, 5)
+        self.assertEqual(plan.terms[0], dice.DiceTerm(1, 4, 6, "h", 3))
+        self.assertEqual(dice.compile_expr("4d6dl1").terms[0], plan.terms[0])
+        self.assertIs(dice.compile_expr("4d6kh3 + 1d4 - 2"), plan)
+
+    def test_invalid_and_limits(self):
+        for expr in ["", "d", "1d0", "2d6kh3", "1d1!", "1d6+", "abc", "1d6r6",
+                     f"{dice.MAX_DICE + 1}d6", f"1d{dice.MAX_SIDES + 1}"]:
+            with self.assertRaises(dice.DiceError, msg=expr):
+                dice.compile_expr(expr)
+
+    def test_modifiers_with_scripted_rolls(self):
+        self.assertEqual(dice.execute(dice.compile_expr("4d6kh3+2"), _Scripted(3, 1, 6, 5)).total, 16)
+        self.assertEqual(dice.execute(dice.compile_expr("2d20kl1"), _Scripted(17, 4)).total, 4)
+        # 6 explodes into 6 again, then 2: one die worth 14.
+        self.assertEqual(dice.execute(dice.compile_expr("2d6!"), _Scripted(6, 3, 6, 2)).total, 17)
+        # The 1 is re-rolled once into another 1 and kept.
+        self.assertEqual(dice.execute(dice.compile_expr("2d6r1"), _Scripted(1, 4, 1)).total, 5)
+        r = dice.execute(dice.compile_expr("3d6kh2-1"), _Scripted(2, 5, 4))
+        self.assertEqual((r.total, r.detail), (8, "5+4 (dropped 2)-1"))
+
+    def test_ranges(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            self.assertTrue(4 <= dice.execute(dice.compile_expr("2d6+2"), rng).total <= 14)
+            self.assertTrue(1 <= dice.execute(dice.compile_expr("1d10r1"), rng).total <= 10)
+            self.assertGreaterEqual(dice.execute(dice.compile_expr("3d6!"), rng).total, 3)
+
+    def test_detail_is_summarized_for_large_pools(self):
+        r = dice.roll("5000d6")
+        self.assertTrue(5000 <= r.total <= 30000)
+        self.assertEqual(r.detail, f"[5000d6={r.total}]")
+        self.assertEqual(dice.roll("3").detail, "3")
+
+
+class DistributionTest(unittest.TestCase):
+    def test_exact_values(self):
+        d = dice.distribution("2d6", at_least=[7])
+        pmf = dict((v, p) for v, p in d["pmf"])
+        self.assertAlmostEqual(pmf[7], 6 / 36, places=15)
+        self.assertAlmostEqual(d["mean"], 7.0, places=12)
+        self.assertAlmostEqual(d["variance"], 35 / 6, places=12)
+        self.assertAlmostEqual(d["at_least"]["7"], 21 / 36, places=15)
+        self.assertEqual(d["percentiles"]["50"], 7)
+
+    def test_keep_and_reroll(self):
+        self.assertAlmostEqual(dice.distribution("4d6kh3")["mean"], 15869 / 1296, places=12)
+        self.assertAlmostEqual(dice.distribution("2d20kh1", at_least=[15])["at_least"]["15"], 0.51, places=12)
+        # Re-roll 1s once: P(1) = 1/36.
+        self.assertAlmostEqual(dict(map(tuple, dice.distribution("1d6r1")["pmf"]))[1], 1 / 36, places=15)
+
+    def test_matches_roller_support(self):
+        for expr in ["1d6!", "3d4kl2+1d4-1", "2d6r1!", "-1d8+3"]:
+            d = dice.distribution(expr)
+            self.assertAlmostEqual(sum(p for _, p in d["pmf"]), 1.0, places=12)
+            values = set(v for v, _ in d["pmf"])
+            plan = dice.compile_expr(expr)
+            rng = random.Random(3)
+            for _ in range(500):
+                self.assertIn(dice.execute(plan, rng).total, values)
+
+    def test_budget(self):
+        with self.assertRaises(dice.DiceError):
+            dice.distribution("1000d6")
+
+    def test_die_shape_matches_die(self):
+        for sides, explode, reroll in [(6, False, 0), (6, False, 2), (4, True, 0), (6, True, 1), (2, True, 0)]:
+            lo, die = dice._die(sides, explode, reroll)
+            self.assertEqual(dice._die_shape(sides, explode, reroll), (lo, lo + len(die) - 1, sum(die).bit_length()))
+
+    def test_large_exploding_dice_rejected_cheaply(self):
+        built = []
+        orig = dice._die
+        # Building even one of these chains takes about half a second.
+        dice._die = lambda *args: built.append(args) or orig(*args)
+        try:
+            for sides in range(9990, 10001):
+                with self.assertRaises(dice.DiceError):
+                    dice.distribution(f"1d{sides}!")
+        finally:
+            dice._die = orig
+        self.assertEqual(built, [])
+
+
+class BatchRollTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self._orig = (dice.require_user, dice.publisher.publish)
+        dice.require_user = lambda: {"sub": "user_1"}
+        dice.publisher.publish = lambda *args: self.sent.append(args)
+        self.app = Flask(__name__)
+        self.app.register_blueprint(dice.bp)
+
+    def tearDown(self):
+        dice.require_user, dice.publisher.publish = self._orig
+
+    def test_batch_publishes_once(self):
+        with self.app.test_client() as client:
+            resp = client.post("/api/campaigns/c_test/rolls", json={"rolls": [
+                {"label": "Goblin 1", "expr": "1d20+2"},
+                {"label": "Goblin 2", "expr": "1d20+2"},
+                "2d6",
+            ]})
+            self.assertEqual(resp.status_code, 200, resp.data)
+            results = resp.get_json()["results"]
+            self.assertEqual([r["label"] for r in results], ["Goblin 1", "Goblin 2", None])
+            self.assertTrue(all(3 <= r["total"] <= 22 for r in results[:2]))
+        self.assertEqual(len(self.sent), 1)
+        channel, name, payload = self.sent[0]
+        self.assertEqual((channel, name), ("campaign:c_test", "dice_batch"))
+        self.assertEqual(payload["rolls"], results)
+
+    def test_batch_rejects_bad_input(self):
+        with self.app.test_client() as client:
+            self.assertEqual(client.post("/api/campaigns/c_test/rolls", json={"rolls": []}).status_code, 400)
+            self.assertEqual(client.post("/api/campaigns/c_test/rolls", json={"rolls": ["1d6", "nope"]}).status_code, 400)
+            too_many = {"rolls": ["1d6"] * (dice.MAX_BATCH + 1)}
+            self.assertEqual(client.post("/api/campaigns/c_test/rolls", json=too_many).status_code, 400)
+        self.assertEqual(self.sent, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
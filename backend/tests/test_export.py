@@ -0,0 +1,69 @@
+import gzip
+import json
+import os
+import unittest
+from flask import Flask
+
+from backend import campaigns, export
+from backend.config import settings
+from backend.db import dispose_all
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        self.engine = campaigns._engine()
+        campaigns.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            for i in range(5):
+                conn.execute(campaigns.campaigns_table.insert().values(id=f"c{i}", name=f"Campaign {i}", owner_id="owner"))
+                conn.execute(campaigns.campaign_members_table.insert().values(campaign_id=f"c{i}", user_id="u1"))
+            conn.execute(campaigns.user_settings_table.insert().values(user_id="u1", active_campaign_id="c0"))
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(export.bp)
+        self._orig = export.require_admin
+        export.require_admin = lambda: {"sub": "admin"}
+
+    def tearDown(self):
+        export.require_admin = self._orig
+        dispose_all()
+
+    def _lines(self, resp):
+        body = resp.get_data()
+        if resp.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    def test_full_dump(self):
+        with self.app.test_client() as client:
+            lines = self._lines(client.get("/api/export"))
+        kinds = [line["type"] for line in lines]
+        self.assertEqual(kinds.count("campaign"), 5)
+        self.assertEqual(kinds.count("member"), 5)
+        self.assertEqual(kinds.count("user_settings"), 1)
+        self.assertEqual(lines[-1], {"type": "end", "rows": 11})
+        self.assertTrue(lines[0]["created_at"])
+
+    def test_resume_with_cursor_and_gzip(self):
+        seen = []
+        cursor = None
+        with self.app.test_client() as client:
+            for _ in range(10):
+                args = {"limit": 4, "gzip": 1, **({"cursor": cursor} if cursor else {})}
+                lines = self._lines(client.get("/api/export", query_string=args))
+                seen.extend(line for line in lines if line["type"] not in ("next", "end"))
+                if lines[-1]["type"] == "end":
+                    break
+                cursor = lines[-1]["cursor"]
+        self.assertEqual(len(seen), 11)
+        self.assertEqual(len({(r["type"], r.get("id"), r.get("campaign_id"), r.get("user_id")) for r in seen}), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
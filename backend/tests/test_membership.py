@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+
+from backend import campaigns, realtime
+from backend.db import dispose_all
+from backend.config import settings
+from backend.membership import MISS, MembershipCache, membership_cache
+from backend.querylog import query_budget
+
+
+class MembershipCacheTest(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        # Pooled connections would keep the previous (unlinked) file alive.
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        self.engine = campaigns._engine()
+        campaigns.metadata.create_all(self.engine)
+        membership_cache.clear()
+
+        self.cid = "c_test"
+        self.user_id = "user_1"
+        with self.engine.begin() as conn:
+            conn.execute(campaigns.campaigns_table.insert().values(
+                id=self.cid, name="Test Campaign", description="", avatar="", owner_id="owner"
+            ))
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(campaigns.bp)
+        self.app.register_blueprint(realtime.bp)
+        campaigns.require_user = lambda: {"sub": self.user_id}
+        realtime.require_user = lambda: {"sub": self.user_id}
+        settings.ABLY_API_KEY = "app.key:secret"
+
+    def tearDown(self):
+        dispose_all()
+
+    def _delete_rows_behind_cache(self):
+        with self.engine.begin() as conn:
+            conn.execute(campaigns.campaign_members_table.delete())
+
+    def test_role_is_cached(self):
+        hits = membership_cache.stats()["hits"]
+        with self.engine.begin() as conn:
+            conn.execute(campaigns.campaign_members_table.insert().values(
+                campaign_id=self.cid, user_id=self.user_id, role="dm"
+            ))
+        self.assertEqual(realtime.member_role(self.cid, self.user_id), "dm")
+        # Served from the cache even though the row is gone.
+        self._delete_rows_behind_cache()
+        self.assertEqual(realtime.member_role(self.cid, self.user_id), "dm")
+        self.assertTrue(realtime.user_can_access_channel(self.user_id, f"campaign:{self.cid}"))
+        self.assertEqual(membership_cache.stats()["hits"] - hits, 2)
+
+    def test_join_and_leave_invalidate(self):
+        channel = f"campaign:{self.cid}"
+        self.assertFalse(realtime.user_can_access_channel(self.user_id, channel))
+        with self.app.test_client() as client:
+            self.assertEqual(client.post(f"/api/campaigns/{self.cid}/join").status_code, 200)
+            self.assertEqual(realtime.member_role(self.cid, self.user_id), "player")
+            self.assertEqual(client.post(f"/api/campaigns/{self.cid}/leave").status_code, 200)
+            self.assertFalse(realtime.user_can_access_channel(self.user_id, channel))
+
+    def test_fill_racing_invalidation_is_dropped(self):
+        # A reader loaded "not a member" just before a join committed; its
+        # late put must not hide the join for the negative TTL.
+        generation = membership_cache.generation()
+        membership_cache.invalidate(self.cid, self.user_id)
+        membership_cache.put(self.cid, self.user_id, None, generation)
+        membership_cache.put_user(self.user_id, {}, generation)
+        self.assertIs(membership_cache.get(self.cid, self.user_id), MISS)
+        self.assertIs(membership_cache.get_user(self.user_id), MISS)
+
+    def test_join_on_another_worker_reaches_this_cache(self):
+        with self.app.test_client() as client:
+            self.assertEqual(client.post(f"/api/campaigns/{self.cid}/join").status_code, 200)
+            first = client.get("/api/realtime/token").get_json()
+            self.assertEqual(list(json.loads(first["capability"])), [f"campaign:{self.cid}"])
+
+            # Worker B (its own cache, same marker directory) handles a join.
+            other = MembershipCache(60, 5, 100, 2700, marks_dir=membership_cache._marks.directory)
+            with self.engine.begin() as conn:
+                conn.execute(campaigns.campaigns_table.insert().values(id="c_new", name="New", owner_id="owner"))
+                conn.execute(campaigns.campaign_members_table.insert().values(campaign_id="c_new", user_id=self.user_id))
+            other.invalidate("c_new", self.user_id)
+
+            tr = client.get("/api/realtime/token").get_json()
+            self.assertEqual(sorted(json.loads(tr["capability"])), ["campaign:c_new", f"campaign:{self.cid}"])
+
+    def test_fill_racing_other_worker_is_ignored(self):
+        marks = os.path.join(tempfile.mkdtemp(), "marks")
+        a = MembershipCache(60, 5, 100, 2700, marks_dir=marks)
+        b = MembershipCache(60, 5, 100, 2700, marks_dir=marks)
+        generation = b.generation()
+        a.invalidate(self.cid, self.user_id)
+        b.put_user(self.user_id, {}, generation)
+        self.assertIs(b.get_user(self.user_id), MISS)
+        # A fill that starts after the change is used as usual.
+        b.put_user(self.user_id, {self.cid: "player"}, b.generation())
+        self.assertEqual(b.get_user(self.user_id), {self.cid: "player"})
+        shutil.rmtree(os.path.dirname(marks), ignore_errors=True)
+
+    def test_token_covers_all_campaigns(self):
+        with self.engine.begin() as conn:
+            conn.execute(campaigns.campaigns_table.insert().values(id="c_other", name="Other", owner_id="owner"))
+            conn.execute(campaigns.campaign_members_table.insert().values(campaign_id="c_other", user_id=self.user_id))
+        with self.app.test_client() as client:
+            self.assertEqual(client.post(f"/api/campaigns/{self.cid}/join").status_code, 200)
+            resp = client.get("/api/realtime/token")
+            self.assertEqual(resp.status_code, 200, resp.data)
+            tr = resp.get_json()
+            self.assertEqual(tr["clientId"], self.user_id)
+            self.assertEqual(sorted(json.loads(tr["capability"])), ["campaign:c_other", f"campaign:{self.cid}"])
+
+            # Cached: a second mint needs no DB round trip.
+            self._delete_rows_behind_cache()
+            with query_budget(0):
+                again = client.get("/api/realtime/token").get_json()
+            self.assertEqual(again["capability"], tr["capability"])
+            self.assertNotEqual(again["nonce"], tr["nonce"])
+
+            # Leaving invalidates the user's capability. With no campaigns
+            # left there is nothing to grant; a token without a capability
+            # would get the API key's access to every channel.
+            self.assertEqual(client.post(f"/api/campaigns/{self.cid}/leave").status_code, 200)
+            self.assertEqual(client.get("/api/realtime/token").status_code, 403)
+
+    def test_never_signs_without_capability(self):
+        with self.assertRaises(ValueError):
+            realtime._sign_token_request(self.user_id, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from flask import Flask, abort
+
+from backend import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._registry = metrics.registry
+        # flush_interval=0: no background thread, flush explicitly.
+        metrics.registry = metrics.Registry(self.dir, 0)
+        self.app = Flask(__name__)
+        metrics.init_app(self.app)
+
+        @self.app.get("/api/things/<tid>")
+        def thing(tid):
+            if tid == "missing":
+                abort(404)
+            return {"id": tid}
+
+    def tearDown(self):
+        metrics.registry = self._registry
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _scrape(self, client):
+        resp = client.get("/api/_metrics")
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_data(as_text=True).splitlines()
+
+    def test_records_route_and_status(self):
+        with self.app.test_client() as client:
+            client.get("/api/things/a")
+            client.get("/api/things/b")
+            client.get("/api/things/missing")
+            lines = self._scrape(client)
+        self.assertIn('http_request_duration_seconds_count{route="/api/things/<tid>",method="GET",status="200"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{route="/api/things/<tid>",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{route="/api/things/<tid>",method="GET",status="200",le="+Inf"} 2', lines)
+        # Only the scrape itself is in flight.
+        self.assertIn("http_requests_in_flight 1", lines)
+
+    def test_merges_other_workers(self):
+        with metrics.timer("db"):
+            pass
+        metrics.registry.flush()
+        # A worker that has exited: its histograms still count, its gauges do not.
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        counts = [0] * (len(metrics.BUCKETS) + 2)
+        counts[0], counts[-2], counts[-1] = 3, 0.003, 3
+        with open(os.path.join(self.dir, f"{proc.pid}.json"), "w") as f:
+            json.dump({
+                "hist": [["dependency_duration_seconds", [["dep", "db"]], counts]],
+                "gauges": [["http_requests_in_flight", [], 5]],
+            }, f)
+        with self.app.test_client() as client:
+            lines = self._scrape(client)
+        self.assertIn('dependency_duration_seconds_count{dep="db"} 4', lines)
+        self.assertIn("http_requests_in_flight 1", lines)
+        # The exited worker's file was folded into the retired totals.
+        self.assertFalse(os.path.exists(os.path.join(self.dir, f"{proc.pid}.json")))
+        self.assertIn(metrics.Registry.RETIRED, os.listdir(self.dir))
+        with self.app.test_client() as client:
+            self.assertIn('dependency_duration_seconds_count{dep="db"} 4', self._scrape(client))
+
+    def test_reused_pid_does_not_reset_counters(self):
+        # A worker that exited and a new one that got the same pid.
+        old = metrics.Registry(self.dir, 0)
+        old.count("ratelimit_rejections_total", amount=7)
+        old.flush()
+        new = metrics.Registry(self.dir, 0)
+        new._name = old._name.split("-")[0] + "-ffff.json"
+        new.count("ratelimit_rejections_total", amount=1)
+        new.flush()
+        metrics.registry = new
+        with self.app.test_client() as client:
+            self.assertIn("ratelimit_rejections_total 8", self._scrape(client))
+            self.assertFalse(os.path.exists(os.path.join(self.dir, old._name)))
+            new.flush()
+            self.assertIn("ratelimit_rejections_total 8", self._scrape(client))
+
+
+if __name__ == "__main__":
+    unittest.main()
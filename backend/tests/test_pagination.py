@@ -0,0 +1,152 @@
+import os
+import unittest
+from flask import Flask
+from sqlalchemy import text
+
+from backend import campaigns, compression
+from backend.config import settings
+from backend.db import dispose_all
+
+
+class _ListingTestCase(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        self.engine = campaigns._engine()
+        campaigns.metadata.create_all(self.engine)
+
+        # Several campaigns share a created_at so the id tie-breaker matters.
+        with self.engine.begin() as conn:
+            for i in range(7):
+                conn.execute(campaigns.campaigns_table.insert().values(
+                    id=f"c{i}", name=f"Campaign {i}", owner_id="owner",
+                    created_at=text("'2025-01-0%d 00:00:00'" % (1 + i // 3)),
+                ))
+            for i in range(5):
+                conn.execute(campaigns.campaign_members_table.insert().values(campaign_id="c0", user_id=f"u{i}"))
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(campaigns.bp)
+
+    def tearDown(self):
+        dispose_all()
+
+    def _walk(self, client, url, limit):
+        seen, cursor, pages = [], None, 0
+        while True:
+            resp = client.get(url, query_string={"limit": limit, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(resp.status_code, 200, resp.data)
+            seen.extend(resp.get_json())
+            pages += 1
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                return seen, pages
+
+
+class PaginationTest(_ListingTestCase):
+    def test_campaigns_walk_in_order(self):
+        with self.app.test_client() as client:
+            rows, pages = self._walk(client, "/api/campaigns", 2)
+        self.assertEqual([r["id"] for r in rows], [f"c{i}" for i in range(7)])
+        self.assertEqual(pages, 4)
+        self.assertNotIn("created_at", rows[0])
+
+    def test_members_walk_in_order(self):
+        with self.app.test_client() as client:
+            rows, pages = self._walk(client, "/api/campaigns/c0/members", 2)
+        self.assertEqual(rows, [f"u{i}" for i in range(5)])
+        self.assertEqual(pages, 3)
+
+    def test_limit_is_capped_and_cursor_validated(self):
+        with self.app.test_client() as client:
+            resp = client.get("/api/campaigns", query_string={"limit": 10_000})
+            self.assertEqual(len(resp.get_json()), 7)
+            self.assertIsNone(resp.headers.get("X-Next-Cursor"))
+            self.assertEqual(client.get("/api/campaigns?cursor=not-a-cursor").status_code, 400)
+            # Well-formed base64 JSON of the wrong shape is a 400 too, not a 500.
+            for values in (5, [], {"a": 1}, [5]):
+                cursor = campaigns._encode_cursor(values)
+                for url in ("/api/campaigns", "/api/campaigns/c0/members"):
+                    self.assertEqual(client.get(url, query_string={"cursor": cursor}).status_code, 400, (url, values))
+
+
+class ConditionalGetTest(_ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        campaigns.require_user = lambda: {"sub": "u0"}
+
+    def test_campaigns_304_until_write(self):
+        with self.app.test_client() as client:
+            first = client.get("/api/campaigns")
+            etag = first.headers["ETag"]
+            self.assertEqual(first.headers["Cache-Control"], "no-cache")
+            again = client.get("/api/campaigns", headers={"If-None-Match": etag})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.get_data(), b"")
+            # Another page of the same listing has its own tag.
+            self.assertNotEqual(client.get("/api/campaigns?limit=2").headers["ETag"], etag)
+
+            client.post("/api/campaigns", json={"name": "New"})
+            changed = client.get("/api/campaigns", headers={"If-None-Match": etag})
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_join_only_expires_pages_that_show_it(self):
+        with self.app.test_client() as client:
+            first = client.get("/api/campaigns?limit=2").headers["ETag"]
+            last = client.get("/api/campaigns?limit=2&cursor=" + campaigns._encode_cursor(["2025-01-02T00:00:00", "c5"]))
+            client.post("/api/campaigns/c1/join")
+            self.assertEqual(client.get("/api/campaigns?limit=2", headers={"If-None-Match": first}).status_code, 200)
+            self.assertEqual(client.get("/api/campaigns?limit=2&cursor=" + campaigns._encode_cursor(
+                ["2025-01-02T00:00:00", "c5"]), headers={"If-None-Match": last.headers["ETag"]}).status_code, 304)
+        with self.engine.connect() as conn:
+            self.assertIsNone(conn.execute(campaigns._version_query("campaigns")).fetchone())
+
+    def test_etag_carries_format_version(self):
+        with self.app.test_client() as client:
+            etag = client.get("/api/campaigns").headers["ETag"]
+            saved = campaigns.ETAG_FORMAT
+            campaigns.ETAG_FORMAT = saved + 1
+            try:
+                self.assertEqual(client.get("/api/campaigns", headers={"If-None-Match": etag}).status_code, 200)
+            finally:
+                campaigns.ETAG_FORMAT = saved
+
+    def test_compressed_body_has_its_own_etag(self):
+        compression.init_app(self.app)
+        saved, settings.COMPRESS_MIN_BYTES = settings.COMPRESS_MIN_BYTES, 1
+        try:
+            with self.app.test_client() as client:
+                plain = client.get("/api/campaigns").headers["ETag"]
+                gz = client.get("/api/campaigns", headers={"Accept-Encoding": "gzip"})
+                self.assertEqual(gz.headers["Content-Encoding"], "gzip")
+                self.assertEqual(gz.headers["ETag"], plain[:-1] + '-gzip"')
+                # Either validator revalidates; the 304 names the one held.
+                again = client.get("/api/campaigns", headers={"Accept-Encoding": "gzip", "If-None-Match": gz.headers["ETag"]})
+                self.assertEqual((again.status_code, again.headers["ETag"]), (304, gz.headers["ETag"]))
+                self.assertEqual(client.get("/api/campaigns", headers={"If-None-Match": plain}).status_code, 304)
+        finally:
+            settings.COMPRESS_MIN_BYTES = saved
+
+    def test_members_and_active_campaign(self):
+        with self.app.test_client() as client:
+            etag = client.get("/api/campaigns/c1/members").headers["ETag"]
+            self.assertEqual(client.get("/api/campaigns/c1/members", headers={"If-None-Match": etag}).status_code, 304)
+            client.post("/api/campaigns/c1/join")
+            self.assertEqual(client.get("/api/campaigns/c1/members", headers={"If-None-Match": etag}).status_code, 200)
+
+            active = client.get("/api/user/active_campaign")
+            self.assertEqual(active.headers["Cache-Control"], "private, no-cache")
+            tag = active.headers["ETag"]
+            self.assertEqual(client.get("/api/user/active_campaign", headers={"If-None-Match": tag}).status_code, 304)
+            client.post("/api/user/active_campaign", json={"active": "c1"})
+            fresh = client.get("/api/user/active_campaign", headers={"If-None-Match": tag})
+            self.assertEqual((fresh.status_code, fresh.get_json()), (200, {"active": "c1"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
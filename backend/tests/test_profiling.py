@@ -0,0 +1,81 @@
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+from flask import Flask, abort
+
+from backend import profiling
+from backend.config import settings
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._saved = (settings.PROFILE_DIR, settings.PROFILE_MAX_FILES, settings.PROFILE_SAMPLE_RATE)
+        settings.PROFILE_DIR = self.dir
+        self.admin = True
+
+        def fake_admin():
+            if not self.admin:
+                abort(403)
+            return {"sub": "admin"}
+        profiling.require_admin = fake_admin
+
+        self.app = Flask(__name__)
+        profiling.init_app(self.app)
+
+        @self.app.get("/api/slow")
+        def slow():
+            time.sleep(0.05)
+            return {"ok": True}
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        settings.PROFILE_DIR, settings.PROFILE_MAX_FILES, settings.PROFILE_SAMPLE_RATE = self._saved
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_cprofile_capture(self):
+        resp = self.client.get("/api/slow", headers={"X-Profile": "cprofile"})
+        name = resp.headers["X-Profile-File"]
+        self.assertTrue(name.endswith(".pstats"))
+        stats = pstats.Stats(os.path.join(self.dir, name))
+        self.assertTrue(any(func[2] == "slow" for func in stats.stats))
+
+    def test_sampled_stacks(self):
+        resp = self.client.get("/api/slow", headers={"X-Profile": "sample"})
+        with open(os.path.join(self.dir, resp.headers["X-Profile-File"])) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any("slow (test_profiling.py" in line for line in lines))
+
+    def test_not_opted_in(self):
+        self.assertNotIn("X-Profile-File", self.client.get("/api/slow").headers)
+        self.admin = False
+        resp = self.client.get("/api/slow", headers={"X-Profile": "cprofile"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Profile-File", resp.headers)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_rotation_and_listing(self):
+        settings.PROFILE_MAX_FILES = 2
+        for _ in range(3):
+            self.client.get("/api/slow", headers={"X-Profile": "cprofile"})
+            time.sleep(0.01)
+        listing = self.client.get("/api/_profiles").get_json()["profiles"]
+        self.assertEqual(len(listing), 2)
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(p["name"] for p in listing))
+        self.assertEqual(self.client.get(f"/api/_profiles/{listing[0]['name']}").status_code, 200)
+        self.assertEqual(self.client.get("/api/_profiles/..%2Fsecret.pstats").status_code, 404)
+        self.admin = False
+        self.assertEqual(self.client.get("/api/_profiles").status_code, 403)
+
+    def test_sample_rate(self):
+        settings.PROFILE_SAMPLE_RATE = 1.0
+        self.assertIn("X-Profile-File", self.client.get("/api/slow").headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
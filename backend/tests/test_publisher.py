@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+
+from backend.config import settings
+from backend.publisher import Publisher
+
+
+class _FakeChannel:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def publish(self, messages):
+        self.client.entered.set()
+        self.client.gate.wait(5)
+        if self.client.fail_next:
+            self.client.fail_next -= 1
+            raise RuntimeError("ably unavailable")
+        self.client.calls.append((self.name, [(m.name, m.data) for m in messages]))
+
+
+class _FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.fail_next = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+        self.channels = self
+
+    def get(self, name):
+        return _FakeChannel(self, name)
+
+
+class PublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.pub = Publisher(maxsize=10, batch_size=50, max_retries=2, backoff=0)
+        self.client = _FakeClient()
+        self.pub._client = self.client
+
+    def test_batches_per_channel(self):
+        # Hold the queue before the flusher starts so all messages land in one batch.
+        for i in range(3):
+            self.pub._queue.put_nowait(("campaign:a", "dice", {"n": i}))
+        self.pub._queue.put_nowait(("campaign:b", "dice", {"n": 9}))
+        self.pub._ensure_thread()
+        self.assertTrue(self.pub.flush())
+        self.assertEqual(sorted(c[0] for c in self.client.calls), ["campaign:a", "campaign:b"])
+        self.assertEqual(self.pub.metrics()["queue_depth"], 0)
+
+    def test_retries_then_succeeds(self):
+        self.client.fail_next = 2
+        self.assertTrue(self.pub.publish("campaign:a", "dice", {}))
+        self.assertTrue(self.pub.flush())
+        self.assertEqual(self.pub.retries, 2)
+        self.assertEqual(self.pub.published, 1)
+        self.assertEqual(self.pub.failed, 0)
+
+    def test_drops_when_full(self):
+        # Stall the flusher on its first send, then fill the queue behind it.
+        self.client.gate.clear()
+        self.pub.publish("campaign:a", "dice", {})
+        self.assertTrue(self.client.entered.wait(5))
+        for i in range(10):
+            self.assertTrue(self.pub.publish("campaign:a", "dice", {"n": i}))
+        self.assertFalse(self.pub.publish("campaign:a", "dice", {}))
+        self.assertEqual(self.pub.metrics()["dropped"], 1)
+        self.assertEqual(self.pub.metrics()["queue_depth"], 10)
+        self.client.gate.set()
+        self.assertTrue(self.pub.flush())
+        self.assertEqual(self.pub.published, 11)
+
+    def test_exit_flush_is_bounded(self):
+        # Nothing started in this process: nothing to wait for.
+        self.assertTrue(self.pub.flush_at_exit())
+        saved, settings.ABLY_EXIT_FLUSH_SECONDS = settings.ABLY_EXIT_FLUSH_SECONDS, 0.2
+        try:
+            self.client.gate.clear()
+            self.pub.publish("campaign:a", "dice", {})
+            self.assertTrue(self.client.entered.wait(5))
+            self.pub.publish("campaign:a", "dice", {"n": 1})
+            start = time.monotonic()
+            self.assertFalse(self.pub.flush_at_exit())
+            self.assertLess(time.monotonic() - start, 1)
+            self.client.gate.set()
+            self.assertTrue(self.pub.flush_at_exit())
+        finally:
+            settings.ABLY_EXIT_FLUSH_SECONDS = saved
+        self.assertEqual(self.pub.published, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import unittest
+from flask import Flask
+
+from backend import campaigns, querylog
+from backend.db import dispose_all
+from backend.config import settings
+
+
+class QueryLogTest(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        self.engine = campaigns._engine()
+        campaigns.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(campaigns.campaigns_table.insert(), [
+                {"id": f"c{i}", "name": f"Campaign {i}", "owner_id": "owner"} for i in range(5)
+            ])
+        self.app = Flask(__name__)
+        self.app.register_blueprint(campaigns.bp)
+        querylog.init_app(self.app)
+        campaigns.require_user = lambda: {"sub": "user_1"}
+        self._slow_ms = settings.SLOW_QUERY_MS
+
+    def tearDown(self):
+        settings.SLOW_QUERY_MS = self._slow_ms
+        dispose_all()
+
+    def test_server_timing_header(self):
+        with self.app.test_client() as client:
+            resp = client.get("/api/campaigns")
+        timing = resp.headers["Server-Timing"]
+        # Just the page query; its rows are the ETag version
+        self.assertIn('db;desc="1 queries"', timing)
+        self.assertIn("app;dur=", timing)
+
+    def test_slow_query_log(self):
+        settings.SLOW_QUERY_MS = 0
+        with self.assertLogs("npcchatter.slow_query", "WARNING") as logs:
+            with self.app.test_client() as client:
+                client.get("/api/campaigns/c1/members")
+        self.assertIn('"route": "/api/campaigns/<cid>/members"', logs.output[0])
+
+    def test_budgets(self):
+        with self.app.test_client() as client:
+            with querylog.query_budget(1):
+                client.get("/api/campaigns")
+            with querylog.query_budget(3):
+                client.get("/api/user/dashboard")
+            with querylog.query_budget(3):
+                client.post("/api/campaigns/c1/join")
+            with self.assertRaises(AssertionError) as cm:
+                with querylog.query_budget(1):
+                    client.get("/api/campaigns/c1/members")
+        self.assertIn("2 queries run, budget is 1", str(cm.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from flask import Flask
+
+from backend import dice, metrics, ratelimit
+from backend.config import settings
+
+
+class LimitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._saved = {k: getattr(settings, k) for k in (
+            "RATE_LIMIT_STORE", "RATE_LIMIT_DB", "ROLL_LIMIT_USER", "ROLL_LIMIT_CAMPAIGN")}
+        settings.RATE_LIMIT_STORE = "memory"
+        settings.ROLL_LIMIT_USER = "2/60"
+        settings.ROLL_LIMIT_CAMPAIGN = "3/60"
+        ratelimit.reset()
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(dice.bp)
+        self._orig = (dice.require_user, dice.publisher.publish)
+        self.user = "u1"
+        dice.require_user = lambda: {"sub": self.user}
+        dice.publisher.publish = lambda *args: None
+
+    def tearDown(self):
+        dice.require_user, dice.publisher.publish = self._orig
+        for k, v in self._saved.items():
+            setattr(settings, k, v)
+        ratelimit.reset()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _roll(self, client, cid="c1"):
+        return client.post(f"/api/campaigns/{cid}/roll", json={"expr": "1d6"})
+
+    def test_parse_limit(self):
+        self.assertEqual(ratelimit.parse_limit("20/10"), ratelimit.Limit(2.0, 20.0))
+        self.assertEqual(ratelimit.parse_limit("5"), ratelimit.Limit(5.0, 5.0))
+        self.assertIsNone(ratelimit.parse_limit(""))
+        self.assertIsNone(ratelimit.parse_limit("0"))
+
+    def test_user_then_campaign_limits(self):
+        with self.app.test_client() as client:
+            self.assertEqual([self._roll(client).status_code for _ in range(2)], [200, 200])
+            refused = self._roll(client)
+            self.assertEqual(refused.status_code, 429)
+            self.assertEqual(refused.headers["Retry-After"], "30")
+            # The refused roll did not use up the campaign's budget.
+            self.user = "u2"
+            self.assertEqual(self._roll(client).status_code, 200)
+            # c1 is now at its campaign limit for everyone.
+            self.assertEqual(self._roll(client).status_code, 429)
+            self.user = "u3"
+            self.assertEqual(self._roll(client).status_code, 429)
+            self.assertEqual(self._roll(client, "c2").status_code, 200)
+        rendered = metrics.registry.render()
+        self.assertIn('ratelimit_rejections_total{limit="roll",scope="campaign"}', rendered)
+
+    def test_off(self):
+        settings.RATE_LIMIT_STORE = "off"
+        with self.app.test_client() as client:
+            self.assertEqual({self._roll(client).status_code for _ in range(5)}, {200})
+
+    def test_sqlite_store_is_shared(self):
+        path = os.path.join(self.tmp, "rl", "buckets.db")
+        limit = ratelimit.parse_limit("3/60")
+        # Two stores on one file stand in for two workers.
+        a, b = ratelimit.SqliteBuckets(path), ratelimit.SqliteBuckets(path)
+        waits = [s.take("roll:user:u1", limit) for s in (a, b, a, b)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertGreater(waits[3], 0)
+
+    def test_store_failure_lets_requests_through(self):
+        settings.RATE_LIMIT_STORE = "sqlite"
+        settings.RATE_LIMIT_DB = self.tmp  # a directory: unusable as a database
+        with self.app.test_client() as client:
+            self.assertEqual({self._roll(client).status_code for _ in range(4)}, {200})
+        self.assertIn("ratelimit_store_errors_total", metrics.registry.render())
+
+
+class AdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self._saved = (settings.MAX_IN_FLIGHT, settings.ADMISSION_QUEUE, settings.ADMISSION_TIMEOUT)
+        settings.MAX_IN_FLIGHT, settings.ADMISSION_QUEUE, settings.ADMISSION_TIMEOUT = 1, 0, 0
+        self.app = Flask(__name__)
+        ratelimit.init_app(self.app)
+        self.entered, self.release = threading.Event(), threading.Event()
+
+        @self.app.get("/api/slow")
+        def slow():
+            self.entered.set()
+            self.release.wait(5)
+            return {"ok": True}
+
+        @self.app.get("/api/health")
+        def health():
+            return {"ok": True}
+
+    def tearDown(self):
+        self.release.set()
+        settings.MAX_IN_FLIGHT, settings.ADMISSION_QUEUE, settings.ADMISSION_TIMEOUT = self._saved
+
+    def test_sheds_over_cap(self):
+        held = threading.Thread(target=lambda: self.app.test_client().get("/api/slow"))
+        held.start()
+        self.assertTrue(self.entered.wait(5))
+        client = self.app.test_client()
+        shed = client.get("/api/slow")
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(shed.headers["Retry-After"], str(settings.ADMISSION_RETRY_AFTER))
+        self.assertEqual(client.get("/api/health").status_code, 200)
+        self.release.set()
+        held.join(5)
+        self.assertEqual(ratelimit.admission.active, 0)
+
+    def test_queued_request_gets_freed_slot(self):
+        adm = ratelimit.Admission()
+        self.assertIsNone(adm.enter(1))
+        self.assertEqual(adm.enter(1), "full")
+        threading.Timer(0.05, adm.leave).start()
+        self.assertIsNone(adm.enter(1, queue=1, timeout=5))
+        self.assertEqual(adm.enter(1, queue=1, timeout=0.01), "timeout")
+
+
+class DefaultsTest(unittest.TestCase):
+    def _defaults(self, **env):
+        env = {k: v for k, v in os.environ.items()
+               if k not in ("RATE_LIMIT_STORE", "MAX_IN_FLIGHT", "WEB_CONCURRENCY")} | env
+        out = subprocess.run(
+            [sys.executable, "-c", "from backend.config import settings as s; "
+             "print(s.RATE_LIMIT_STORE, s.MAX_IN_FLIGHT, s.DB_POOL_SIZE + s.DB_MAX_OVERFLOW)"],
+            env=env, cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        return out[0], int(out[1]), int(out[2])
+
+    def test_shared_store_and_cap_by_default(self):
+        store, cap, pool = self._defaults(WEB_CONCURRENCY="2")
+        self.assertEqual(store, "sqlite")
+        self.assertEqual(cap, pool)
+        self.assertGreater(cap, 0)
+        self.assertEqual(self._defaults()[0], "memory")
+
+
+if __name__ == "__main__":
+    unittest.main()
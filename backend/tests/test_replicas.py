@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+
+from backend import campaigns, realtime, replicas
+from backend.config import settings
+from backend.db import dispose_all, get_engine
+from backend.membership import membership_cache
+
+
+class ReplicaRoutingTest(unittest.TestCase):
+    """Primary and replica are two SQLite files holding different rows."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        self.replica_url = f"sqlite:///{os.path.join(self.tmp, 'replica.db')}"
+        settings.DATABASE_URL_REPLICAS = self.replica_url
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        replicas.reset()
+        self._recent_writers = replicas.recent_writers
+        replicas.recent_writers = replicas.RecentWriters(os.path.join(self.tmp, "ryw"))
+        membership_cache.clear()
+
+        for url, cid in ((settings.DATABASE_URL, "c_primary"), (self.replica_url, "c_replica")):
+            engine = get_engine(url)
+            campaigns.metadata.create_all(engine)
+            with engine.begin() as conn:
+                conn.execute(campaigns.campaigns_table.insert().values(id=cid, name=cid, owner_id="owner"))
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(campaigns.bp)
+        self.user_id = "user_1"
+        campaigns.require_user = lambda: {"sub": self.user_id}
+        self.auth = {"Authorization": "Bearer test"}
+
+    def tearDown(self):
+        settings.DATABASE_URL_REPLICAS = ""
+        replicas.recent_writers = self._recent_writers
+        replicas.reset()
+        dispose_all()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _listed(self, client, **kw):
+        resp = client.get("/api/campaigns", **kw)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return [c["id"] for c in resp.get_json()]
+
+    def test_reads_go_to_replica(self):
+        with self.app.test_client() as client:
+            self.assertEqual(self._listed(client), ["c_replica"])
+            self.assertEqual(self._listed(client, headers=self.auth), ["c_replica"])
+
+    def test_writer_reads_own_writes_from_primary(self):
+        with self.app.test_client() as client:
+            self.assertEqual(client.post("/api/campaigns/c_primary/join").status_code, 200)
+            self.assertEqual(self._listed(client, headers=self.auth), ["c_primary"])
+            # Everyone else keeps reading the replica.
+            self.assertEqual(self._listed(client), ["c_replica"])
+            self.assertEqual(realtime.member_role("c_primary", self.user_id), "player")
+
+            settings.READ_YOUR_WRITES_SECONDS, window = 0, settings.READ_YOUR_WRITES_SECONDS
+            try:
+                self.assertEqual(self._listed(client, headers=self.auth), ["c_replica"])
+            finally:
+                settings.READ_YOUR_WRITES_SECONDS = window
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        bad = f"sqlite:///{os.path.join(self.tmp, 'missing', 'replica.db')}"
+        settings.DATABASE_URL_REPLICAS = bad
+        with self.app.test_client() as client:
+            self.assertEqual(self._listed(client), ["c_primary"])
+        self.assertEqual(replicas.stats()[0]["healthy"], False)
+        # Skipped while marked down: the primary is the only candidate.
+        self.assertEqual(replicas.read_urls(), [settings.DATABASE_URL])
+
+    def test_round_robin_over_replicas(self):
+        settings.DATABASE_URL_REPLICAS = f"{self.replica_url},sqlite:///other.db"
+        firsts = {replicas.read_urls()[0] for _ in range(4)}
+        self.assertEqual(firsts, {self.replica_url, "sqlite:///other.db"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+from alembic import command
+from alembic.config import Config
+from flask import Flask
+from sqlalchemy import text
+
+from backend import campaigns, schema
+from backend.config import settings
+from backend.db import dispose_all, get_engine
+from backend.routes.health import bp as health_bp
+
+OLDER = "0005_campaigns_owner_id_index"
+
+
+class SchemaCheckTest(unittest.TestCase):
+    """Against real SQLite files migrated (or stamped) with the repo's alembic scripts."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._saved = (settings.DATABASE_URL, settings.SCHEMA_CHECK, settings.SCHEMA_RECHECK_SECONDS)
+        settings.DATABASE_URL = f"sqlite:///{os.path.join(self.tmp, 'schema.db')}"
+        settings.SCHEMA_CHECK = "on"
+        settings.SCHEMA_RECHECK_SECONDS = 30
+        dispose_all()
+        schema.reset()
+
+    def tearDown(self):
+        settings.DATABASE_URL, settings.SCHEMA_CHECK, settings.SCHEMA_RECHECK_SECONDS = self._saved
+        schema.reset()
+        dispose_all()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _alembic(self, action, revision):
+        cfg = Config()
+        cfg.set_main_option("script_location", schema.ALEMBIC_DIR)
+        cfg.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
+        getattr(command, action)(cfg, revision)
+
+    def _guarded_status(self) -> int:
+        app = Flask(__name__)
+        app.register_blueprint(campaigns.bp)
+        schema.init_app(app)
+        with app.test_client() as client:
+            return client.get("/api/campaigns").status_code
+
+    def test_head_is_ready_and_cached(self):
+        self._alembic("upgrade", "head")
+        head = schema.check_schema()
+        self.assertEqual({head}, schema.expected_heads())
+        self.assertEqual(self._guarded_status(), 200)
+        # Cached: a later downgrade is not seen until a forced check.
+        self._alembic("stamp", OLDER)
+        self.assertEqual(schema.check_schema(), head)
+        with self.assertRaises(schema.SchemaNotReady):
+            schema.check_schema(force=True)
+
+    def test_behind_is_rechecked_after_interval(self):
+        self._alembic("upgrade", OLDER)
+        with self.assertRaisesRegex(schema.SchemaNotReady, OLDER):
+            schema.check_schema()
+        self.assertEqual(self._guarded_status(), 503)
+        self._alembic("upgrade", "head")
+        # Still the cached failure inside SCHEMA_RECHECK_SECONDS...
+        with self.assertRaises(schema.SchemaNotReady):
+            schema.check_schema()
+        # ...then re-probed.
+        settings.SCHEMA_RECHECK_SECONDS = 0
+        self.assertEqual({schema.check_schema()}, schema.expected_heads())
+
+    def test_member_count_backfill_in_batches(self):
+        self._alembic("upgrade", OLDER)
+        # Enough campaigns for several BACKFILL_BATCH-sized commits.
+        with get_engine().begin() as conn:
+            conn.execute(text("INSERT INTO campaigns (id, name) VALUES (:id, 'x')"),
+                         [{"id": f"c{i:04d}"} for i in range(1201)])
+            conn.execute(text("INSERT INTO campaign_members (campaign_id, user_id) VALUES (:c, :u)"),
+                         [{"c": c, "u": f"u{i}"} for c in ("c0001", "c1200") for i in range(3)])
+        dispose_all()
+        self._alembic("upgrade", "head")
+        with get_engine().connect() as conn:
+            counts = dict(conn.execute(text("SELECT id, member_count FROM campaigns WHERE member_count > 0")).fetchall())
+        self.assertEqual(counts, {"c0001": 3, "c1200": 3})
+
+    def test_unreachable_db_is_not_cached(self):
+        settings.DATABASE_URL = f"sqlite:///{os.path.join(self.tmp, 'missing', 'schema.db')}"
+        with self.assertRaisesRegex(schema.SchemaNotReady, "unable to read"):
+            schema.check_schema()
+        self.assertFalse(schema._state["checked"])
+
+    def test_guard_only_db_blueprints(self):
+        self._alembic("stamp", OLDER)
+        app = Flask(__name__)
+        app.register_blueprint(health_bp)
+        app.register_blueprint(campaigns.bp)
+        schema.init_app(app)
+        with app.test_client() as client:
+            self.assertEqual(client.get("/api/campaigns").status_code, 503)
+            self.assertEqual(client.get("/api/health").status_code, 200)
+            self.assertNotEqual(client.options("/api/campaigns").status_code, 503)
+
+    def test_off_skips_everything(self):
+        settings.SCHEMA_CHECK = "off"
+        settings.DATABASE_URL = f"sqlite:///{os.path.join(self.tmp, 'missing', 'schema.db')}"
+        app = Flask(__name__)
+        app.register_blueprint(health_bp)
+        schema.init_app(app)
+        self.assertFalse(schema._state["checked"])
+        self.assertEqual(app.before_request_funcs, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import unittest
+from datetime import datetime
+from flask import Flask
+
+from backend import campaigns, jsonprovider
+from backend.db import dispose_all
+from backend.config import settings
+
+
+class WritePathTest(unittest.TestCase):
+    def setUp(self):
+        settings.DATABASE_URL = "sqlite:///tmp_test.db"
+        dispose_all()
+        try:
+            os.remove('tmp_test.db')
+        except FileNotFoundError:
+            pass
+        self.engine = campaigns._engine()
+        campaigns.metadata.create_all(self.engine)
+        self.user_id = "user_1"
+        with self.engine.begin() as conn:
+            conn.execute(campaigns.campaigns_table.insert(), [
+                {"id": "c_mine", "name": "Mine", "owner_id": self.user_id},
+                {"id": "c_theirs", "name": "Theirs", "owner_id": "someone"},
+            ])
+        self.app = Flask(__name__)
+        jsonprovider.init_app(self.app)
+        self.app.register_blueprint(campaigns.bp)
+        campaigns.require_user = lambda: {"sub": self.user_id}
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        dispose_all()
+
+    def _active(self):
+        return self.client.get("/api/user/active_campaign").get_json()["active"]
+
+    def test_set_active(self):
+        post = lambda active: self.client.post("/api/user/active_campaign", json={"active": active})
+        self.assertEqual(post("c_missing").status_code, 404)
+        self.assertEqual(post("c_theirs").status_code, 403)
+        self.assertEqual(post("c_mine").status_code, 200)
+        self.assertEqual(self._active(), "c_mine")
+        # Members may select campaigns they do not own; the upsert updates in place.
+        self.client.post("/api/campaigns/c_theirs/join")
+        self.assertEqual(post("c_theirs").status_code, 200)
+        self.assertEqual(self._active(), "c_theirs")
+        self.assertEqual(post(None).status_code, 200)
+        self.assertIsNone(self._active())
+
+    def test_update_campaign(self):
+        patch = lambda cid: self.client.patch(f"/api/campaigns/{cid}", json={"name": "Renamed"})
+        self.assertEqual(patch("c_missing").status_code, 404)
+        self.assertEqual(patch("c_theirs").status_code, 403)
+        resp = patch("c_mine")
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(resp.get_json()["name"], "Renamed")
+        # ISO 8601 from the JSON provider, not Flask's HTTP date format
+        datetime.fromisoformat(resp.get_json()["updated_at"])
+
+    def test_join(self):
+        self.assertEqual(self.client.post("/api/campaigns/c_missing/join").status_code, 404)
+        for _ in range(2):
+            self.assertEqual(self.client.post("/api/campaigns/c_theirs/join").status_code, 200)
+        self.assertEqual(self.client.get("/api/campaigns/c_theirs/members").get_json(), [self.user_id])
+
+    def test_leave_clears_active(self):
+        self.client.post("/api/campaigns/c_theirs/join")
+        self.client.post("/api/user/active_campaign", json={"active": "c_theirs"})
+        resp = self.client.post("/api/campaigns/c_theirs/leave").get_json()
+        self.assertIsNone(resp["active"])
+        self.assertIsNone(self._active())
+
+
+if __name__ == "__main__":
+    unittest.main()
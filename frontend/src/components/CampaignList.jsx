@@ -1,6 +1,6 @@
 import React from 'react';
 
-export default function CampaignList({ campaigns, onJoin }) {
+export default function CampaignList({ campaigns, onJoin, hasMore, onLoadMore }) {
   return (
     <div className="w-full max-w-2xl mx-auto mt-6">
       <h2 className="text-lg font-bold mb-2">Available Campaigns</h2>
@@ -28,6 +28,14 @@ export default function CampaignList({ campaigns, onJoin }) {
           );
         })}
       </div>
+      {hasMore && (
+        <button
+          className="mt-3 w-full px-2 py-1 border border-blue-600 text-blue-700 rounded hover:bg-blue-50 text-sm"
+          onClick={onLoadMore}
+        >
+          Load more
+        </button>
+      )}
     </div>
   );
 }
@@ -6,15 +6,19 @@ import CampaignList from '../components/CampaignList';
 import UserCampaigns from '../components/UserCampaigns';
 import GamePage from './GamePage';
 import {
-  getCampaigns,
+  getCampaignsPage,
   createCampaign,
   joinCampaign,
-  getCampaignMembers,
+  getDashboard,
   updateCampaign
 } from '../utils/api';
 
+// Campaigns per directory page ("Load more" fetches the next one).
+const DIRECTORY_PAGE_SIZE = 50;
+
 export default function CampaignsPage() {
   const [campaigns, setCampaigns] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [userCampaigns, setUserCampaigns] = useState([]);
   const [activeId, setActiveId] = useState(null);
   const [activeCampaign, setActiveCampaign] = useState(null);
@@ -23,44 +27,61 @@ export default function CampaignsPage() {
   const { getToken } = useAuth();
   const [showGame, setShowGame] = useState(false);
 
-  useEffect(() => {
+  // One dashboard call returns the user's campaigns, roles and active
+  // campaign; the public listing is only needed for the "Join" column, and
+  // only its first page until the user asks for more.
   async function refreshLists() {
-      setLoading(true);
-      const all = await getCampaigns();
-      if (user) {
-        const userId = user.id;
-        const joined = [];
-        for (const c of all) {
-          const members = await getCampaignMembers(c.id);
-          if (members.includes(userId)) joined.push({ ...c, members });
-        }
-        const joinedIds = new Set(joined.map(c => c.id));
-        setUserCampaigns(joined);
-        // Only show campaigns the user has NOT already joined
-        setCampaigns(all.filter(c => !joinedIds.has(c.id)));
-      } else {
-        setCampaigns(all);
-        setUserCampaigns([]);
-      }
-      setLoading(false);
+    if (!user) {
+      const page = await getCampaignsPage({ limit: DIRECTORY_PAGE_SIZE });
+      setCampaigns(page.items);
+      setNextCursor(page.nextCursor);
+      setUserCampaigns([]);
+      return null;
+    }
+    const token = await getToken();
+    const [page, dashboard] = await Promise.all([
+      getCampaignsPage({ limit: DIRECTORY_PAGE_SIZE, token }),
+      getDashboard(token),
+    ]);
+    const joined = dashboard.campaigns.filter(c => c.is_member);
+    setUserCampaigns(joined);
+    setCampaigns(notJoined(page.items, joined));
+    setNextCursor(page.nextCursor);
+    return dashboard;
+  }
+
+  // Only show campaigns the user has NOT already joined
+  function notJoined(items, joined) {
+    const joinedIds = new Set(joined.map(c => c.id));
+    return items.filter(c => !joinedIds.has(c.id));
+  }
+
+  async function handleLoadMore() {
+    if (!nextCursor) return;
+    setLoading(true);
+    try {
+      const token = user ? await getToken() : undefined;
+      const page = await getCampaignsPage({ cursor: nextCursor, limit: DIRECTORY_PAGE_SIZE, token });
+      setCampaigns(prev => [...prev, ...notJoined(page.items, userCampaigns)]);
+      setNextCursor(page.nextCursor);
+    } catch (e) {
+      console.error('Failed to load more campaigns', e);
     }
-    refreshLists();
-    // Also load persisted active campaign for this user
-    async function loadActive() {
-      if (!user) return;
+    setLoading(false);
+  }
+
+  useEffect(() => {
+    async function load() {
+      setLoading(true);
       try {
-        const token = await getToken();
-        const { getActiveCampaign } = await import('../utils/api');
-        const res = await getActiveCampaign(token);
-        if (res && res.active) {
-          setActiveId(res.active);
-          // activeCampaign will be set after we populate userCampaigns below
-        }
+        const dashboard = await refreshLists();
+        if (dashboard && dashboard.active) setActiveId(dashboard.active);
       } catch (e) {
-        // ignore
+        console.error('Failed to load campaigns', e);
       }
+      setLoading(false);
     }
-    loadActive();
+    load();
   }, [user]);
 
   // Keep activeCampaign object in sync when activeId or userCampaigns change
@@ -78,20 +99,7 @@ export default function CampaignsPage() {
     const token = await getToken();
     await joinCampaign(id, token);
     // Refresh lists so the joined campaign is removed from available list
-    const all = await getCampaigns();
-    if (user) {
-      const userId = user.id;
-      const joined = [];
-      for (const c of all) {
-        const members = await getCampaignMembers(c.id);
-        if (members.includes(userId)) joined.push({ ...c, members });
-      }
-      const joinedIds = new Set(joined.map(c => c.id));
-      setUserCampaigns(joined);
-      setCampaigns(all.filter(c => !joinedIds.has(c.id)));
-    } else {
-      setCampaigns(all);
-    }
+    await refreshLists();
     setLoading(false);
   }
 
@@ -100,20 +108,7 @@ export default function CampaignsPage() {
     const token = await getToken();
     await createCampaign(data, token);
     // Refresh lists after creating a campaign
-    const all = await getCampaigns();
-    if (user) {
-      const userId = user.id;
-      const joined = [];
-      for (const c of all) {
-        const members = await getCampaignMembers(c.id);
-        if (members.includes(userId)) joined.push({ ...c, members });
-      }
-      const joinedIds = new Set(joined.map(c => c.id));
-      setUserCampaigns(joined);
-      setCampaigns(all.filter(c => !joinedIds.has(c.id)));
-    } else {
-      setCampaigns(all);
-    }
+    await refreshLists();
     setLoading(false);
   }
 
@@ -148,20 +143,7 @@ export default function CampaignsPage() {
       alert('Failed to update campaign');
     }
     // Refresh lists after update
-    const all = await getCampaigns();
-    if (user) {
-      const userId = user.id;
-      const joined = [];
-      for (const c of all) {
-        const members = await getCampaignMembers(c.id);
-        if (members.includes(userId)) joined.push({ ...c, members });
-      }
-      const joinedIds = new Set(joined.map(c => c.id));
-      setUserCampaigns(joined);
-      setCampaigns(all.filter(c => !joinedIds.has(c.id)));
-    } else {
-      setCampaigns(all);
-    }
+    await refreshLists();
     setLoading(false);
   }
 
@@ -180,24 +162,11 @@ export default function CampaignsPage() {
       const { leaveCampaign } = await import('../utils/api');
       await leaveCampaign(id, token);
       // Refresh lists
-      const all = await getCampaigns();
-      if (user) {
-        const userId = user.id;
-        const joined = [];
-        for (const c of all) {
-          const members = await getCampaignMembers(c.id);
-          if (members.includes(userId)) joined.push({ ...c, members });
-        }
-        const joinedIds = new Set(joined.map(c => c.id));
-        setUserCampaigns(joined);
-        setCampaigns(all.filter(c => !joinedIds.has(c.id)));
-        // If the active campaign was the one left, clear it locally
-        if (activeId === id) {
-          setActiveId(null);
-          setActiveCampaign(null);
-        }
-      } else {
-        setCampaigns(all);
+      await refreshLists();
+      // If the active campaign was the one left, clear it locally
+      if (activeId === id) {
+        setActiveId(null);
+        setActiveCampaign(null);
       }
     } catch (e) {
       console.error('Leave failed', e);
@@ -219,7 +188,7 @@ export default function CampaignsPage() {
           <section className="bg-white rounded-lg shadow-lg p-4 border border-green-900 flex flex-col items-center">
             <h2 className="text-2xl font-extrabold text-green-700 mb-2 tracking-wider">Join</h2>
             <p className="text-sm text-green-900 mb-4 italic">Browse open campaigns</p>
-            <CampaignList campaigns={campaigns} onJoin={handleJoin} />
+            <CampaignList campaigns={campaigns} onJoin={handleJoin} hasMore={Boolean(nextCursor)} onLoadMore={handleLoadMore} />
           </section>
             <section className="bg-white rounded-lg shadow-lg p-4 border border-blue-900 flex flex-col items-center">
             <h2 className="text-2xl font-extrabold text-blue-700 mb-2 tracking-wider">Play</h2>
@@ -15,10 +15,41 @@ export async function updateCampaign(id, data, token) {
 // Utility functions for frontend API calls to backend
 const API_BASE = import.meta.env.VITE_API_BASE || '';
 
-export async function getCampaigns() {
-  const res = await fetch(`${API_BASE}/api/campaigns`, { credentials: 'include' });
-  if (!res.ok) throw new Error('Failed to fetch campaigns');
-  return await res.json();
+// List endpoints are keyset-paginated: the body is one page (an array) and
+// the cursor for the next page comes back in the X-Next-Cursor header.
+// They are public; an optional token only makes the backend read the user's
+// own recent writes from the primary database.
+async function fetchPage(path, { cursor, limit, token } = {}) {
+  const params = new URLSearchParams();
+  if (cursor) params.set('cursor', cursor);
+  if (limit) params.set('limit', String(limit));
+  const qs = params.toString();
+  const res = await fetch(`${API_BASE}${path}${qs ? `?${qs}` : ''}`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+    credentials: 'include',
+  });
+  if (!res.ok) return { ok: false };
+  return { ok: true, items: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+}
+
+async function fetchAllPages(path, errorMessage, token) {
+  const items = [];
+  let cursor = null;
+  do {
+    const page = await fetchPage(path, { cursor, limit: 200, token });
+    if (!page.ok) throw new Error(errorMessage);
+    items.push(...page.items);
+    cursor = page.nextCursor;
+  } while (cursor);
+  return items;
+}
+
+// The campaign directory grows with every user, so it is read a page at a
+// time; nextCursor is null after the last page.
+export async function getCampaignsPage({ cursor, limit, token } = {}) {
+  const page = await fetchPage('/api/campaigns', { cursor, limit, token });
+  if (!page.ok) throw new Error('Failed to fetch campaigns');
+  return { items: page.items, nextCursor: page.nextCursor };
 }
 
 export async function createCampaign(data, token) {
@@ -59,9 +90,21 @@ export async function leaveCampaign(id, token) {
   return await res.json();
 }
 
-export async function getCampaignMembers(id) {
-  const res = await fetch(`${API_BASE}/api/campaigns/${id}/members`, { credentials: 'include' });
-  if (!res.ok) throw new Error('Failed to fetch members');
+export async function getCampaignMembers(id, token) {
+  return fetchAllPages(`/api/campaigns/${id}/members`, 'Failed to fetch members', token);
+}
+
+// Joined/owned campaigns with role and member count, plus the active
+// campaign, in a single request.
+export async function getDashboard(token) {
+  const res = await fetch(`${API_BASE}/api/user/dashboard`, {
+    method: 'GET',
+    headers: {
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    credentials: 'include',
+  });
+  if (!res.ok) throw new Error('Failed to fetch dashboard');
   return await res.json();
 }
 